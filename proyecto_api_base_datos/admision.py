@@ -0,0 +1,243 @@
+"""
+Control de admisión (load shedding)
+
+Cuando las conexiones del pool se agotan, las peticiones nuevas se quedan
+esperando una conexión hasta el pool_timeout y la latencia sube para todos.
+Este middleware rechaza esas peticiones enseguida, antes de tocar la base de
+datos, para que las que sí se atienden terminen rápido:
+
+- Límite global de peticiones en curso (ADMISSION_MAX_IN_FLIGHT) -> 503
+- Espera media para obtener una conexión del pool por encima de
+  ADMISSION_MAX_POOL_WAIT_MS -> 503. Cada pool tiene su propia media y solo
+  cuenta el que usará la petición: GET/HEAD/OPTIONS el de lectura, el resto el
+  de escritura. Así una cola de escrituras no rechaza lecturas con el pool de
+  lectura libre
+- Límite por cliente con un token bucket (ADMISSION_RATE_PER_CLIENT peticiones
+  por segundo con ráfagas de ADMISSION_BURST) -> 429
+
+Todas las respuestas de rechazo llevan Retry-After. Las rutas de
+ADMISSION_EXEMPT_PATHS (estáticos, métricas, el stream /events y las
+comprobaciones de salud) no se limitan.
+
+Al apagar (ver apagado.py) se rechaza todo con 503, también las rutas exentas,
+y en_curso dice cuántas peticiones quedan por terminar (aunque el control de
+admisión esté desactivado).
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))
+ADMISSION_MAX_POOL_WAIT_MS = float(os.getenv("ADMISSION_MAX_POOL_WAIT_MS", "250"))
+# 0 desactiva el límite por cliente (detrás de un proxy todos comparten IP)
+ADMISSION_RATE_PER_CLIENT = float(os.getenv("ADMISSION_RATE_PER_CLIENT", "0"))
+ADMISSION_BURST = int(os.getenv("ADMISSION_BURST", "20"))
+ADMISSION_EXEMPT_PATHS = tuple(os.getenv("ADMISSION_EXEMPT_PATHS", "/static,/metrics,/events,/healthz,/readyz").split(","))
+
+# Clientes recordados como máximo; al pasarlo se olvidan los que tienen el bucket lleno
+MAX_CLIENTES = 10_000
+
+# Métodos HTTP que no modifican datos: usan el pool de lectura
+METODOS_LECTURA = {"GET", "HEAD", "OPTIONS"}
+
+
+class EsperaPool:
+    """
+    Media móvil de lo que tarda una petición en obtener una conexión del pool.
+
+    La registran get_db y single-flight (en el threadpool, de ahí el lock). Si no llegan
+    muestras nuevas la media se va reduciendo a la mitad cada `vida_media`
+    segundos: sin eso, tras rechazar todo no habría muestras para recuperarse.
+    """
+
+    def __init__(self, vida_media: float = 1.0, peso: float = 0.2):
+        self.vida_media = vida_media
+        self.peso = peso
+        self.maxima = 0.0
+        self._media = 0.0
+        self._ultima = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _actual(self, ahora: float) -> float:
+        return self._media * 0.5 ** ((ahora - self._ultima) / self.vida_media)
+
+    def registrar(self, segundos: float):
+        with self._lock:
+            ahora = time.monotonic()
+            media = self._actual(ahora)
+            self._media = media + self.peso * (segundos - media)
+            self._ultima = ahora
+            self.maxima = max(self.maxima, segundos)
+
+    def media_ms(self) -> float:
+        return self._actual(time.monotonic()) * 1000
+
+
+# Una por pool. Si las lecturas no tienen pool propio (read_engine es engine),
+# database.py hace que "read" sea la misma que "write"
+esperas_pool = {"write": EsperaPool(), "read": EsperaPool()}
+
+
+def pool_de(metodo: str) -> str:
+    """Nombre del pool que usará una petición con ese método HTTP"""
+    return "read" if metodo in METODOS_LECTURA else "write"
+
+
+class ControlAdmision:
+    """
+    Decide qué peticiones se atienden y guarda las métricas.
+    Solo se usa desde el event loop, así que los contadores no necesitan locks.
+    """
+
+    def __init__(
+        self,
+        max_en_curso: int = ADMISSION_MAX_IN_FLIGHT,
+        max_espera_pool_ms: float = ADMISSION_MAX_POOL_WAIT_MS,
+        tasa_por_cliente: float = ADMISSION_RATE_PER_CLIENT,
+        rafaga: int = ADMISSION_BURST,
+        activo: bool = ADMISSION_ENABLED,
+    ):
+        self.max_en_curso = max_en_curso
+        self.max_espera_pool_ms = max_espera_pool_ms
+        self.tasa_por_cliente = tasa_por_cliente
+        self.rafaga = rafaga
+        self.activo = activo
+        self.en_curso = 0
+        self.max_en_curso_visto = 0
+        self.admitidas = 0
+        self.rechazadas = {"in_flight": 0, "pool_wait": 0, "rate_limit": 0, "shutting_down": 0}
+        # True durante el apagado: ya no se acepta ninguna petición
+        self.cerrando = False
+        # cliente -> [tokens, momento de la última recarga]
+        self._buckets: dict[str, list[float]] = {}
+
+    def rechazo(self, cliente: str, pool: str) -> tuple[int, int, str] | None:
+        """None si la petición (que usará `pool`) se atiende; si no, (status, Retry-After, detalle)"""
+        espera = self._tomar_token(cliente)
+        if espera:
+            self.rechazadas["rate_limit"] += 1
+            return 429, espera, "Demasiadas peticiones, inténtalo más tarde"
+        motivo = self.sobrecarga(pool)
+        if motivo:
+            self.rechazadas[motivo] += 1
+            return 503, 1, "Servidor sobrecargado, inténtalo más tarde"
+        return None
+
+    def sobrecarga(self, pool: str | None = None) -> str | None:
+        """
+        Motivo por el que ahora se rechazaría una petición que usa `pool`.
+        Sin pool (para /readyz) basta con que uno de los pools esté lento
+        """
+        if self.en_curso >= self.max_en_curso:
+            return "in_flight"
+        if self.pool_lento(pool):
+            return "pool_wait"
+        return None
+
+    def pool_lento(self, pool: str | None = None) -> str | None:
+        """El pool (`pool` o cualquiera si es None) cuya espera media supera el límite"""
+        # Con pocas peticiones en curso se admite siempre: si no, el servidor se
+        # quedaría parado esperando a que la media baje sin muestras nuevas
+        if self.en_curso < self.max_en_curso // 4:
+            return None
+        for nombre in [pool] if pool else esperas_pool:
+            if esperas_pool[nombre].media_ms() > self.max_espera_pool_ms:
+                return nombre
+        return None
+
+    def _tomar_token(self, cliente: str) -> int:
+        """Devuelve 0 si el cliente tiene un token, o los segundos que debe esperar"""
+        if not self.tasa_por_cliente:
+            return 0
+        ahora = time.monotonic()
+        bucket = self._buckets.get(cliente)
+        if bucket is None:
+            if len(self._buckets) >= MAX_CLIENTES:
+                self._olvidar_clientes(ahora)
+            bucket = self._buckets[cliente] = [self.rafaga, ahora]
+        else:
+            bucket[0] = min(self.rafaga, bucket[0] + (ahora - bucket[1]) * self.tasa_por_cliente)
+            bucket[1] = ahora
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0
+        return math.ceil((1 - bucket[0]) / self.tasa_por_cliente)
+
+    def _olvidar_clientes(self, ahora: float):
+        # Un bucket que ya se habría llenado es igual que uno nuevo
+        llenado = self.rafaga / self.tasa_por_cliente
+        self._buckets = {
+            cliente: bucket for cliente, bucket in self._buckets.items()
+            if ahora - bucket[1] < llenado
+        }
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.activo,
+            "in_flight": self.en_curso,
+            "shutting_down": self.cerrando,
+            "max_in_flight": self.max_en_curso,
+            "max_in_flight_seen": self.max_en_curso_visto,
+            "admitted": self.admitidas,
+            "rejected": dict(self.rechazadas),
+            "pool_wait_avg_ms": {nombre: round(espera.media_ms(), 2) for nombre, espera in esperas_pool.items()},
+            "pool_wait_max_ms": {nombre: round(espera.maxima * 1000, 2) for nombre, espera in esperas_pool.items()},
+            "clients_tracked": len(self._buckets),
+        }
+
+
+control_admision = ControlAdmision()
+
+
+class MiddlewareAdmision:
+    """Middleware ASGI: consulta a control_admision antes de pasar la petición a la app"""
+
+    def __init__(self, app, control: ControlAdmision = control_admision):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        control = self.control
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if control.cerrando:
+            control.rechazadas["shutting_down"] += 1
+            await _rechazar(send, 503, 1, "Servidor cerrándose, inténtalo más tarde")
+            return
+        if scope["path"].startswith(ADMISSION_EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        if control.activo:
+            cliente = scope["client"][0] if scope.get("client") else "desconocido"
+            rechazo = control.rechazo(cliente, pool_de(scope["method"]))
+            if rechazo:
+                await _rechazar(send, *rechazo)
+                return
+
+        control.admitidas += 1
+        control.en_curso += 1
+        control.max_en_curso_visto = max(control.max_en_curso_visto, control.en_curso)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            control.en_curso -= 1
+
+
+async def _rechazar(send, status: int, reintentar: int, detalle: str):
+    cuerpo = json.dumps({"detail": detalle}, ensure_ascii=False).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(cuerpo)).encode()),
+            (b"retry-after", str(reintentar).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": cuerpo})
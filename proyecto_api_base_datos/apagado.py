@@ -0,0 +1,64 @@
+"""
+Apagado ordenado del worker
+
+Al reiniciar los workers se podían cortar commits a medias de crud, y el
+archivo -wal de SQLite crecía hasta el siguiente checkpoint. Al salir del
+lifespan, apagar():
+
+1. Deja de aceptar peticiones: el control de admisión responde 503 a todas
+   (también a /events y a /readyz) y el balanceador deja de enviar tráfico.
+2. Espera a que terminen las peticiones en curso, como mucho
+   SHUTDOWN_DRAIN_SECONDS segundos.
+3. Detiene los servicios de fondo que se le pasen, en orden (por ejemplo la
+   cola de escrituras en lote, que guarda lo pendiente antes de parar).
+4. Ejecuta wal_checkpoint(TRUNCATE) y cierra las conexiones de los dos pools
+   (ver database.cerrar_motores).
+
+Con uvicorn, apagar() empieza después de que el servidor deje de aceptar
+conexiones y espere a las peticiones en curso. Esa espera no tiene límite si
+no se indica --timeout-graceful-shutdown (y un stream de /events no termina
+nunca): hay que arrancarlo con el mismo plazo, por ejemplo
+    uvicorn main:app --timeout-graceful-shutdown 10
+
+Configuración: SHUTDOWN_DRAIN_SECONDS (10 por defecto).
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+from admision import control_admision
+from database import cerrar_motores
+from registro import campos
+
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "10"))
+
+log = logging.getLogger("app.apagado")
+
+
+async def drenar(plazo: float) -> int:
+    """Deja de aceptar peticiones y espera a las que están en curso; devuelve las que no terminaron"""
+    control_admision.cerrando = True
+    limite = time.monotonic() + plazo
+    while control_admision.en_curso and time.monotonic() < limite:
+        await asyncio.sleep(0.05)
+    return control_admision.en_curso
+
+
+async def apagar(*detener):
+    """`detener`: funciones async que paran cada servicio de fondo, en orden"""
+    inicio = time.perf_counter()
+    sin_terminar = await drenar(SHUTDOWN_DRAIN_SECONDS)
+    if sin_terminar:
+        log.warning("apagado_con_peticiones_en_curso", extra=campos(peticiones=sin_terminar))
+    for parar in detener:
+        await parar()
+    checkpoint = await run_in_threadpool(cerrar_motores)
+    log.info("apagado", extra=campos(
+        peticiones_sin_terminar=sin_terminar,
+        wal_checkpoint=checkpoint,
+        duracion_ms=round((time.perf_counter() - inicio) * 1000, 2),
+    ))
@@ -0,0 +1,45 @@
+"""
+Archivado de items antiguos (tabla caliente / tabla fría)
+
+La tabla items crece sin parar y cada listado, recuento e índice carga también
+con items que nadie abre desde hace años. Este trabajo mueve los items creados
+hace más de ARCHIVE_AFTER_DAYS días a la tabla items_archive:
+
+- Por lotes de ARCHIVE_BATCH_SIZE items, cada uno en su propia transacción
+  (copiar a items_archive + borrar de items). El bloqueo de escritura de
+  SQLite dura lo que tarda un lote, no todo el archivado.
+- Entre lotes espera ARCHIVE_PAUSE_MS para que entren las escrituras de la API.
+- Los items conservan su id. item_count, las estadísticas y /events no cambian:
+  archivar no es borrar (ver NO_ARCHIVADO en models.py).
+
+Las lecturas (crud.get_items, crud.get_item) usan solo items salvo que se pida
+archivados=True. Se ejecuta con:
+    python mantenimiento.py archivar-items [--dias N]
+"""
+
+import os
+import time
+from typing import Iterator
+
+import crud
+from database import SessionLocal
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+ARCHIVE_PAUSE_MS = float(os.getenv("ARCHIVE_PAUSE_MS", "50"))
+
+
+def archivar_items(
+    dias: int = ARCHIVE_AFTER_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    pausa_ms: float = ARCHIVE_PAUSE_MS,
+) -> Iterator[int]:
+    """Archiva lote a lote y devuelve cuántos items movió cada lote"""
+    while True:
+        with SessionLocal() as db:
+            movidos = crud.archive_old_items(db, dias, batch_size)
+            db.commit()
+        if not movidos:
+            return
+        yield movidos
+        time.sleep(pausa_ms / 1000)
@@ -0,0 +1,173 @@
+"""
+Cola de escrituras agrupadas (group commit)
+
+En SQLite cada commit implica un fsync, así que hacer un commit por petición
+limita la ingesta a unos cientos de escrituras por segundo. Con esta cola las
+peticiones concurrentes se acumulan y se guardan juntas en una sola
+transacción cada WRITE_BATCH_MAX_DELAY_MS milisegundos o cada
+WRITE_BATCH_MAX_ROWS filas. Cada petición espera su propio resultado.
+
+Compromiso durabilidad/latencia:
+- Una petición solo recibe su respuesta cuando el lote ya hizo commit.
+- Cuanto mayor es el retardo, más filas por commit y más latencia añadida.
+- SQLITE_SYNCHRONOUS (ver database.py) controla cuánto espera SQLite al disco.
+
+Si una operación falla, el lote se repite fila por fila y solo esa petición
+recibe el error. Si falla el lote entero (por ejemplo el commit), todas sus
+peticiones reciben la excepción y la cola sigue funcionando.
+
+Al detenerla (stop), running pasa a False en ese mismo momento: las rutas
+escriben directamente y submit ya no acepta operaciones. Lo que quedó en la
+cola, también detrás del aviso de parada, se guarda antes de terminar.
+"""
+
+import asyncio
+import os
+
+from fastapi.concurrency import run_in_threadpool
+
+from database import SessionLocal
+
+WRITE_BATCH_ENABLED = os.getenv("WRITE_BATCH_ENABLED", "false").lower() == "true"
+WRITE_BATCH_MAX_ROWS = int(os.getenv("WRITE_BATCH_MAX_ROWS", "100"))
+WRITE_BATCH_MAX_DELAY_MS = float(os.getenv("WRITE_BATCH_MAX_DELAY_MS", "5"))
+
+
+class WriteBatcher:
+    """
+    Agrupa operaciones de escritura y las ejecuta en una sola transacción.
+
+    Cada operación es una función de crud que recibe la sesión como primer
+    argumento y no hace commit (por ejemplo crud.insert_user_item).
+    """
+
+    def __init__(self, session_factory, max_rows: int, max_delay_ms: float):
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._parando = False
+        self.batches = 0
+        self.rows = 0
+        self.errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done() and not self._parando
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Guarda las escrituras pendientes y detiene la tarea de fondo"""
+        if not self.running:
+            return
+        self._parando = True
+        try:
+            await self._queue.put(None)
+            await self._task
+        finally:
+            self._task = None
+            self._parando = False
+
+    async def submit(self, operacion, *args):
+        """Encola la operación y espera su resultado (o su excepción)"""
+        if not self.running:
+            raise RuntimeError("La cola de escrituras no está iniciada o se está deteniendo")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((operacion, args, future))
+        return await future
+
+    async def _run(self):
+        terminar = False
+        while not terminar:
+            primera = await self._queue.get()
+            if primera is None:
+                break
+            lote = [primera]
+            limite = asyncio.get_running_loop().time() + self.max_delay
+            while len(lote) < self.max_rows:
+                restante = limite - asyncio.get_running_loop().time()
+                try:
+                    if restante > 0:
+                        siguiente = await asyncio.wait_for(self._queue.get(), restante)
+                    else:
+                        siguiente = self._queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if siguiente is None:
+                    terminar = True
+                    break
+                lote.append(siguiente)
+            await self._guardar(lote)
+
+        # Parando: nadie más encola, pero puede quedar algo detrás del aviso de parada.
+        # Se guarda también, para que ninguna petición se quede esperando para siempre
+        resto = []
+        while not self._queue.empty():
+            elemento = self._queue.get_nowait()
+            if elemento is not None:
+                resto.append(elemento)
+        for inicio in range(0, len(resto), self.max_rows):
+            await self._guardar(resto[inicio:inicio + self.max_rows])
+
+    async def _guardar(self, lote):
+        """Ejecuta el lote y entrega a cada petición su resultado o su excepción"""
+        try:
+            resultados = await run_in_threadpool(self._flush, lote)
+        except Exception as error:
+            # Falló el lote entero, no una operación (sin conexión, disco lleno...):
+            # la sesión ya se cerró con rollback. Todas sus peticiones reciben el
+            # error y la tarea sigue atendiendo los lotes siguientes
+            self.errors += len(lote)
+            resultados = [(None, error)] * len(lote)
+        for (_, _, future), (resultado, error) in zip(lote, resultados):
+            if future.cancelled():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(resultado)
+
+    def _flush(self, lote):
+        """Ejecuta el lote en una transacción; si falla, reintenta fila por fila"""
+        self.batches += 1
+        self.rows += len(lote)
+        with self.session_factory() as db:
+            try:
+                resultados = [(operacion(db, *args), None) for operacion, args, _ in lote]
+                db.commit()
+                return resultados
+            except Exception:
+                db.rollback()
+
+        # Una operación inválida no debe hacer fallar al resto del lote
+        resultados = []
+        for operacion, args, _ in lote:
+            with self.session_factory() as db:
+                try:
+                    resultado = operacion(db, *args)
+                    db.commit()
+                    resultados.append((resultado, None))
+                except Exception as error:
+                    db.rollback()
+                    self.errors += 1
+                    resultados.append((None, error))
+        return resultados
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "batches": self.batches,
+            "rows": self.rows,
+            "errors": self.errors,
+            "avg_rows_per_batch": round(self.rows / self.batches, 2) if self.batches else 0.0,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+write_batcher = WriteBatcher(SessionLocal, WRITE_BATCH_MAX_ROWS, WRITE_BATCH_MAX_DELAY_MS)
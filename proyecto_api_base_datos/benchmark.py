@@ -0,0 +1,1589 @@
+"""
+Benchmarks de la API
+
+Usa una base de datos SQLite temporal y llama a la app directamente con
+httpx.ASGITransport, así que no hace falta tener el servidor corriendo.
+
+Uso:
+    python benchmark.py                  # ejecuta todos los benchmarks
+    python benchmark.py escrituras       # solo uno
+"""
+
+import asyncio
+import bisect
+import collections
+import csv
+import dataclasses
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Annotated
+
+# La configuración se lee al importar database.py: hay que fijarla antes
+_tmpdir = tempfile.mkdtemp(prefix="bench_api_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+os.environ["SQL_ECHO"] = "false"
+# Los benchmarks solo muestran sus resultados (los eventos INFO irían a stderr)
+os.environ["LOG_LEVEL"] = "WARNING"
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, EmailStr, ValidationError, field_validator
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+import crud
+import filas
+import importacion
+import registro
+import schemas
+import apagado
+from admision import control_admision, esperas_pool
+from archivado import archivar_items
+from batch_writes import write_batcher
+from calentamiento import calentamiento
+from eventos import difusor
+from single_flight import single_flight
+from database import ReadSessionLocal, SessionLocal, engine, read_engine
+from main import app
+from models import recalcular_item_count, verificar_estadisticas
+import salud
+
+
+def poblar(num_users: int):
+    """Inserta usuarios de prueba directamente con SQL"""
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM items"))
+        conn.execute(text("DELETE FROM users"))
+        conn.execute(
+            text("INSERT INTO users (email, hashed_password, es_activo) VALUES (:email, 'x', true)"),
+            [{"email": f"user{i}@bench.com"} for i in range(num_users)]
+        )
+
+
+def reportar(nombre: str, latencias: list[float], duracion: float):
+    latencias = sorted(latencias)
+    p95 = latencias[int(len(latencias) * 0.95) - 1]
+    print(
+        f"  {nombre:<28} {len(latencias) / duracion:9.0f} req/s   "
+        f"latencia media {statistics.mean(latencias):7.2f} ms   p95 {p95:7.2f} ms"
+    )
+
+
+async def _lanzar(client: httpx.AsyncClient, peticiones: list, concurrencia: int):
+    """Envía las peticiones con un número fijo de clientes concurrentes"""
+    pendientes = iter(peticiones)
+    latencias = []
+
+    async def trabajador():
+        for metodo, url, cuerpo in pendientes:
+            inicio = time.perf_counter()
+            respuesta = await client.request(metodo, url, json=cuerpo)
+            respuesta.raise_for_status()
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    return latencias, time.perf_counter() - inicio
+
+
+def bench_escrituras(total: int = 2000, concurrencia: int = 50):
+    """Creación de items con un commit por petición vs escrituras agrupadas"""
+    print(f"✍️  Creación de items ({total} peticiones, {concurrencia} concurrentes)")
+    poblar(10)
+    # Mide el coste de escribir, no el de rechazar: con 50 escritores a la vez la
+    # espera media al pool de escritura ronda el límite del control de admisión
+    control_admision.activo = False
+    try:
+        peticiones = [
+            ("POST", f"/users/{i % 10 + 1}/items/", {"nombre": f"item{i}", "descripcion": "bench"})
+            for i in range(total)
+        ]
+
+        async def ejecutar(agrupado: bool):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                if agrupado:
+                    await write_batcher.start()
+                try:
+                    return await _lanzar(client, peticiones, concurrencia)
+                finally:
+                    await write_batcher.stop()
+
+        reportar("un commit por petición", *asyncio.run(ejecutar(False)))
+        reportar("escrituras agrupadas", *asyncio.run(ejecutar(True)))
+        print(f"  métricas: {write_batcher.stats()}")
+
+        # Un lote que falla entero (p. ej. OperationalError al hacer commit) no deja
+        # colgadas sus peticiones ni las siguientes
+        async def lote_fallido():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                await write_batcher.start()
+
+                def fallar(lote):
+                    raise OperationalError("COMMIT", {}, sqlite3.OperationalError("disk I/O error"))
+
+                write_batcher._flush = fallar
+                try:
+                    errores = await asyncio.wait_for(asyncio.gather(*(
+                        write_batcher.submit(crud.insert_user_item, schemas.ItemCreate(nombre=f"fallo{i}"), 1)
+                        for i in range(5)
+                    ), return_exceptions=True), 5)
+                finally:
+                    del write_batcher._flush
+                try:
+                    respuesta = await asyncio.wait_for(
+                        client.post("/users/1/items/", json={"nombre": "después del fallo", "descripcion": None}), 5
+                    )
+                finally:
+                    await write_batcher.stop()
+                return errores, respuesta
+
+        errores, respuesta = asyncio.run(lote_fallido())
+        assert all(isinstance(e, OperationalError) for e in errores), errores
+        assert respuesta.status_code == 200, respuesta.status_code
+        print("  ✅ lote fallido: sus 5 peticiones reciben el error y la cola sigue guardando las siguientes")
+
+        # Escrituras que llegan mientras la cola se detiene: ninguna se queda esperando para siempre
+        async def parar_con_pendientes():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                await write_batcher.start()
+                encoladas = [
+                    asyncio.create_task(write_batcher.submit(crud.insert_user_item, schemas.ItemCreate(nombre=f"parada{i}"), 1))
+                    for i in range(20)
+                ]
+                await asyncio.sleep(0)
+                parada = asyncio.create_task(write_batcher.stop())
+                await asyncio.sleep(0)
+                assert not write_batcher.running
+                # Una escritura justo detrás del aviso de parada (la carrera que antes la perdía)
+                tardia = asyncio.get_running_loop().create_future()
+                write_batcher._queue.put_nowait((crud.insert_user_item, (schemas.ItemCreate(nombre="tardía"), 1), tardia))
+                try:
+                    await write_batcher.submit(crud.insert_user_item, schemas.ItemCreate(nombre="rechazada"), 1)
+                    raise AssertionError("submit aceptó una escritura durante la parada")
+                except RuntimeError:
+                    pass
+                # La ruta escribe directamente mientras la cola se detiene
+                respuesta = await client.post("/users/1/items/", json={"nombre": "durante la parada", "descripcion": None})
+                await asyncio.wait_for(parada, 5)
+                guardadas = await asyncio.wait_for(asyncio.gather(*encoladas, tardia), 5)
+                return guardadas, respuesta
+
+        guardadas, respuesta = asyncio.run(parar_con_pendientes())
+        assert respuesta.status_code == 200, respuesta.text
+        assert len(guardadas) == 21 and all(item.id for item in guardadas), guardadas
+        print("  ✅ parada: las 21 escrituras pendientes se guardan y las nuevas van directas a la base")
+    finally:
+        control_admision.activo = True
+
+def _lector(duracion: float, num_users: int, contador):
+    """Simula un worker de uvicorn que solo atiende peticiones GET"""
+    # Cada proceso debe abrir sus propias conexiones (no heredar las del padre)
+    read_engine.dispose(close=False)
+    lecturas = 0
+    fin = time.perf_counter() + duracion
+    while time.perf_counter() < fin:
+        with ReadSessionLocal() as db:
+            crud.get_user(db, user_id=random.randint(1, num_users))
+            crud.get_items(db, skip=random.randint(0, 1000), limit=20)
+        lecturas += 1
+    with contador.get_lock():
+        contador.value += lecturas
+
+
+def _escritor(duracion: float, num_users: int, contador):
+    """Escribe items sin parar mientras los lectores trabajan"""
+    engine.dispose(close=False)
+    escrituras = 0
+    fin = time.perf_counter() + duracion
+    while time.perf_counter() < fin:
+        with SessionLocal() as db:
+            item = schemas.ItemCreate(nombre=f"item{escrituras}", descripcion="bench")
+            crud.create_user_item(db, item=item, user_id=random.randint(1, num_users))
+        escrituras += 1
+    with contador.get_lock():
+        contador.value += escrituras
+
+
+def bench_lecturas(duracion: float = 3.0, workers: tuple = (1, 2, 4)):
+    """Lecturas por segundo según el número de workers, con un escritor activo"""
+    print(f"📖 Lecturas con escrituras concurrentes ({duracion:.0f} s por medición)")
+    num_users = 1000
+    poblar(num_users)
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO items (nombre, descripcion, propietario_id) VALUES (:nombre, 'bench', :pid)"),
+            [{"nombre": f"item{i}", "pid": i % num_users + 1} for i in range(5000)]
+        )
+    engine.dispose()
+    read_engine.dispose()
+
+    ctx = multiprocessing.get_context("fork")
+    for n in workers:
+        lecturas = ctx.Value("i", 0)
+        escrituras = ctx.Value("i", 0)
+        procesos = [ctx.Process(target=_lector, args=(duracion, num_users, lecturas)) for _ in range(n)]
+        procesos.append(ctx.Process(target=_escritor, args=(duracion, num_users, escrituras)))
+        for proceso in procesos:
+            proceso.start()
+        for proceso in procesos:
+            proceso.join()
+        print(
+            f"  {n} worker(s) de lectura   {lecturas.value / duracion:9.0f} lecturas/s   "
+            f"{escrituras.value / duracion:7.0f} escrituras/s"
+        )
+
+
+def _registrador(emails: list[str], creados, rechazados):
+    """Un worker que intenta registrar todos los emails (con mayúsculas al azar)"""
+    engine.dispose(close=False)
+    random.shuffle(emails)
+    nuevos = repetidos = 0
+    for email in emails:
+        if random.random() < 0.5:
+            email = email.upper()
+        with SessionLocal() as db:
+            user = schemas.UserCreate(email=email, password="contraseña123")
+            if crud.create_user(db, user=user) is None:
+                repetidos += 1
+            else:
+                nuevos += 1
+    with creados.get_lock():
+        creados.value += nuevos
+    with rechazados.get_lock():
+        rechazados.value += repetidos
+
+
+def bench_registros(num_emails: int = 500, workers: int = 4):
+    """Registros simultáneos del mismo email: debe crearse exactamente una cuenta"""
+    print(f"👥 Registros simultáneos ({num_emails} emails, {workers} procesos registrando todos)")
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM items"))
+        conn.execute(text("DELETE FROM users"))
+    engine.dispose()
+    emails = [f"signup{i}@bench.com" for i in range(num_emails)]
+
+    ctx = multiprocessing.get_context("fork")
+    creados = ctx.Value("i", 0)
+    rechazados = ctx.Value("i", 0)
+    procesos = [ctx.Process(target=_registrador, args=(list(emails), creados, rechazados)) for _ in range(workers)]
+    inicio = time.perf_counter()
+    for proceso in procesos:
+        proceso.start()
+    for proceso in procesos:
+        proceso.join()
+    duracion = time.perf_counter() - inicio
+
+    with engine.connect() as conn:
+        cuentas = conn.execute(text("SELECT COUNT(*) FROM users")).scalar()
+        distintas = conn.execute(text("SELECT COUNT(DISTINCT lower(email)) FROM users")).scalar()
+    assert all(proceso.exitcode == 0 for proceso in procesos), "un worker falló"
+    assert creados.value == cuentas == distintas == num_emails, (creados.value, cuentas, distintas)
+    assert rechazados.value == num_emails * (workers - 1)
+    print(
+        f"  ✅ {cuentas} cuentas para {num_emails} emails, {rechazados.value} registros repetidos rechazados"
+        f"   ({num_emails * workers / duracion:.0f} intentos/s)"
+    )
+
+    # Por HTTP el conflicto se convierte en el 400 de siempre
+    async def registrar_dos_veces():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            cuerpo = {"email": "Repetido@Bench.com", "password": "contraseña123"}
+            return [await client.post("/users/", json=cuerpo) for _ in range(2)]
+
+    primera, segunda = asyncio.run(registrar_dos_veces())
+    assert primera.status_code == 200 and segunda.status_code == 400, (primera.text, segunda.text)
+    print(f"  ✅ POST /users/ repetido -> {segunda.status_code} {segunda.json()['detail']}")
+
+
+def _password_length(cls, value):
+    if len(value) < 8:
+        raise ValueError('La contraseña debe tener al menos 8 caracteres.')
+    return value
+
+
+class UserCreatePython(BaseModel):
+    """UserCreate con la regla de la contraseña como @field_validator (versión anterior)"""
+    email: EmailStr
+    password: str
+
+    password_length = field_validator('password')(_password_length)
+
+
+class SoloPasswordPython(BaseModel):
+    """Solo la regla de la contraseña, sin el email: lo único que cambia entre las dos versiones"""
+    password: str
+
+    password_length = field_validator('password')(_password_length)
+
+
+class SoloPasswordCore(BaseModel):
+    password: Annotated[str, schemas.UserCreate.model_fields["password"].metadata[0]]
+
+
+def _errores(modelo, datos: dict) -> list[tuple]:
+    try:
+        modelo.model_validate(datos)
+    except ValidationError as e:
+        return [(error['loc'], error['msg'], error['input']) for error in e.errors()]
+    return []
+
+
+def _validaciones_por_segundo(modelos: dict, datos: dict, repeticiones: int, rondas: int) -> dict:
+    """Mediana de varias rondas, alternando los modelos para repartir el ruido entre los dos"""
+    tiempos = {nombre: [] for nombre in modelos}
+    for _ in range(rondas):
+        for nombre, modelo in modelos.items():
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                try:
+                    modelo.model_validate(datos)
+                except ValidationError:
+                    pass
+            tiempos[nombre].append(time.perf_counter() - inicio)
+    return {nombre: repeticiones / statistics.median(t) for nombre, t in tiempos.items()}
+
+
+def bench_validacion(repeticiones: int = 20_000, rondas: int = 5):
+    """Validación de UserCreate (registro): @field_validator vs restricción de pydantic-core"""
+    print(f"🛡️  Validación de UserCreate ({repeticiones} validaciones x {rondas} rondas, mediana)")
+    casos = {
+        "válido": {"email": "ana@bench.com", "password": "contraseña123"},
+        "password corta": {"email": "ana@bench.com", "password": "123"},
+        "password no es texto": {"email": "ana@bench.com", "password": 123},
+        "email inválido": {"email": "ana", "password": "123"},
+    }
+    for caso, datos in casos.items():
+        assert _errores(UserCreatePython, datos) == _errores(schemas.UserCreate, datos), caso
+        assert _errores(SoloPasswordPython, datos) == _errores(SoloPasswordCore, datos), caso
+    print("  ✅ mismos errores (loc, msg, input) con las dos versiones")
+
+    # La regla sola mide el cambio; el modelo completo, lo que nota el registro
+    # (email-validator tarda mucho más que la regla y la ganancia se pierde en el ruido)
+    for titulo, python, core in (
+        ("regla de la contraseña", SoloPasswordPython, SoloPasswordCore),
+        ("UserCreate completo", UserCreatePython, schemas.UserCreate),
+    ):
+        print(f"  {titulo}:")
+        for caso, datos in casos.items():
+            if python is SoloPasswordPython and caso == "email inválido":
+                continue  # sin email es el mismo caso que "password corta"
+            por_segundo = _validaciones_por_segundo({"python": python, "core": core}, datos, repeticiones, rondas)
+            print(
+                f"    {caso:<22} python {por_segundo['python']:9.0f}/s   "
+                f"core {por_segundo['core']:9.0f}/s   "
+                f"ganancia {por_segundo['core'] / por_segundo['python']:5.2f}x"
+            )
+
+
+def _generar_csv(ruta: str, filas: int, num_users: int) -> int:
+    """Escribe un CSV de items con ~5% de filas inválidas; devuelve cuántas son válidas"""
+    validas = 0
+    with open(ruta, "w", encoding="utf-8", newline="") as f:
+        f.write("nombre,descripcion,propietario_id\n")
+        for i in range(filas):
+            resto = i % 40
+            if resto == 0:
+                f.write(f"item{i},propietario inexistente,{num_users + 1000}\n")
+            elif resto == 1:
+                f.write(f"item{i},propietario no numérico,abc\n")
+            else:
+                descripcion = f"descripción {i}" if i % 3 else ""
+                f.write(f"item{i},{descripcion},{random.randint(1, num_users)}\n")
+                validas += 1
+    return validas
+
+
+def bench_importacion(filas: int = 1_000_000, num_users: int = 1000):
+    """POST /items/import con un CSV grande: filas/s, memoria máxima y filas guardadas"""
+    print(f"📥 Importación CSV ({filas} filas, lotes de {importacion.IMPORT_BATCH_SIZE})")
+    poblar(num_users)
+    ruta = os.path.join(_tmpdir, "items.csv")
+    validas = _generar_csv(ruta, filas, num_users)
+    tamano = os.path.getsize(ruta) / 1024 / 1024
+
+    async def importar():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            with open(ruta, "rb") as f:
+                respuesta = await client.post("/items/import", files={"archivo": ("items.csv", f, "text/csv")})
+        return respuesta
+
+    inicio = time.perf_counter()
+    respuesta = asyncio.run(importar())
+    duracion = time.perf_counter() - inicio
+
+    lineas = respuesta.text.splitlines()
+    resumen = json.loads(lineas[-1])
+    with engine.connect() as conn:
+        guardados = conn.execute(text("SELECT COUNT(*) FROM items")).scalar()
+    assert respuesta.status_code == 200, respuesta.text
+    assert resumen == {"total": filas, "importados": validas, "rechazados": filas - validas, "completo": True}, resumen
+    assert guardados == validas and len(lineas) - 1 == filas - validas, (guardados, len(lineas))
+    # En Linux ru_maxrss está en KiB
+    memoria = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"  ✅ {guardados} items guardados, {resumen['rechazados']} filas rechazadas con su línea\n"
+        f"  {filas / duracion:9.0f} filas/s   {duracion:6.1f} s   CSV {tamano:.0f} MiB   "
+        f"memoria máxima del proceso {memoria:.0f} MiB"
+    )
+
+    # Un archivo que se estropea a mitad: el error llega como una línea del informe
+    cabecera = b"nombre,descripcion,propietario_id\n"
+    buenas = b"".join(b"item%d,,1\n" % i for i in range(20_000))
+    for nombre, resto in (("bytes que no son UTF-8", b"roto\xff\xfe,,1\n"), ("campo más largo que csv.field_size_limit()", b"x" * (csv.field_size_limit() + 1) + b",,1\n")):
+        async def importar_roto():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                contenido = cabecera + buenas + resto + b"otra,,1\n"
+                return await client.post("/items/import", files={"archivo": ("items.csv", contenido, "text/csv")})
+
+        with engine.connect() as conn:
+            antes = conn.execute(text("SELECT COUNT(*) FROM items")).scalar()
+        respuesta = asyncio.run(importar_roto())
+        *errores, resumen = [json.loads(linea) for linea in respuesta.text.splitlines()]
+        with engine.connect() as conn:
+            guardados = conn.execute(text("SELECT COUNT(*) FROM items")).scalar() - antes
+        assert respuesta.status_code == 200 and not resumen["completo"], resumen
+        assert len(errores) == 1 and "archivo" in errores[0]["errores"], errores
+        assert resumen["importados"] == guardados > 0, (resumen, guardados)
+        print(f"  ✅ {nombre}: línea de error {errores[0]['linea']}, {guardados} filas anteriores importadas")
+
+
+def _percentil(valores: list[float], p: float) -> float:
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0.0
+
+
+def bench_sobrecarga(clientes: int = 400, duracion: float = 5.0, num_users: int = 1000):
+    """Más clientes que conexiones: latencia de las peticiones atendidas con y sin control de admisión"""
+    print(f"🚦 Sobrecarga ({clientes} clientes durante {duracion:.0f} s contra GET /users/)")
+    poblar(num_users)
+
+    async def ejecutar(activo: bool):
+        control_admision.activo = activo
+        atendidas, rechazadas = [], []
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            fin = time.perf_counter() + duracion
+
+            async def cliente():
+                while time.perf_counter() < fin:
+                    inicio = time.perf_counter()
+                    respuesta = await client.get(f"/users/?skip={random.randint(0, num_users - 50)}&limit=50")
+                    latencia = (time.perf_counter() - inicio) * 1000
+                    if respuesta.status_code == 200:
+                        atendidas.append(latencia)
+                    else:
+                        assert respuesta.status_code == 503 and respuesta.headers["retry-after"], respuesta.text
+                        rechazadas.append(latencia)
+                        await asyncio.sleep(int(respuesta.headers["retry-after"]))
+
+            inicio = time.perf_counter()
+            await asyncio.gather(*(cliente() for _ in range(clientes)))
+            total = time.perf_counter() - inicio
+        return atendidas, rechazadas, total
+
+    # Escrituras lentas que saturan el pool de escritura (1 + 2 conexiones) mientras
+    # llegan lecturas: el pool de lectura está libre y los GET se deben admitir
+    async def escrituras_saturadas(escritores: int = 60, segundos: float = 3.0):
+        control_admision.activo = True
+        escrituras, lecturas = collections.Counter(), collections.Counter()
+        espera_escritura = []
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            fin = time.perf_counter() + segundos
+
+            async def escritor(i: int):
+                while time.perf_counter() < fin:
+                    respuesta = await client.post(f"/users/{i % num_users + 1}/items/", json={"nombre": "cola"})
+                    escrituras[respuesta.status_code] += 1
+                    if respuesta.status_code == 503:
+                        await asyncio.sleep(0.05)  # sigue presionando, sin esperar el Retry-After
+
+            async def lector():
+                await asyncio.sleep(segundos / 3)  # deja que crezca la cola de escrituras
+                while time.perf_counter() < fin:
+                    respuesta = await client.get("/users/?limit=10")
+                    lecturas[respuesta.status_code] += 1
+                    if control_admision.en_curso >= control_admision.max_en_curso // 4:
+                        espera_escritura.append(esperas_pool["write"].media_ms())
+
+            await asyncio.gather(*(escritor(i) for i in range(escritores)), *(lector() for _ in range(5)))
+        return escrituras, lecturas, max(espera_escritura, default=0.0)
+
+    def escritura_lenta(*args):
+        time.sleep(0.05)
+
+    try:
+        for activo in (False, True):
+            atendidas, rechazadas, total = asyncio.run(ejecutar(activo))
+            nombre = "con control de admisión" if activo else "sin control de admisión"
+            print(
+                f"  {nombre:<24} {len(atendidas) / total:7.0f} req/s atendidas   "
+                f"p50 {_percentil(atendidas, 0.5):7.1f} ms   p99 {_percentil(atendidas, 0.99):7.1f} ms   "
+                f"503: {len(rechazadas)} (p99 {_percentil(rechazadas, 0.99):5.1f} ms)"
+            )
+        print(f"  métricas: {control_admision.stats()}")
+
+        event.listen(engine, "before_cursor_execute", escritura_lenta)
+        try:
+            escrituras, lecturas, espera = asyncio.run(escrituras_saturadas())
+        finally:
+            event.remove(engine, "before_cursor_execute", escritura_lenta)
+    finally:
+        control_admision.activo = True
+    # La espera de escritura superó el límite con muchas peticiones en curso
+    # y aun así ningún GET recibe 503
+    assert espera > control_admision.max_espera_pool_ms, espera
+    assert lecturas and set(lecturas) == {200}, lecturas
+    print(
+        f"  ✅ escrituras saturadas (espera media de escritura {espera:.0f} ms, POST {dict(escrituras)}): "
+        f"los {sum(lecturas.values())} GET se admiten"
+    )
+
+
+def _contar_consultas(fragmento_sql: str, retener_hasta=None):
+    """
+    Cuenta las consultas del pool de lectura cuyo SQL contiene fragmento_sql.
+    retener_hasta (opcional) hace esperar a la primera hasta que devuelva True:
+    simula una consulta lenta para que todas las peticiones lleguen mientras tanto.
+    """
+    contador = {"n": 0}
+
+    def antes(conn, cursor, statement, parameters, context, executemany):
+        if fragmento_sql in statement:
+            contador["n"] += 1
+            limite = time.monotonic() + 10
+            while retener_hasta and not retener_hasta() and time.monotonic() < limite:
+                time.sleep(0.001)
+
+    event.listen(read_engine, "before_cursor_execute", antes)
+    return contador, lambda: event.remove(read_engine, "before_cursor_execute", antes)
+
+
+def bench_coalescencia(peticiones: int = 1000):
+    """Peticiones idénticas simultáneas: una sola consulta compartida (single-flight)"""
+    print(f"🔀 Lecturas compartidas ({peticiones} peticiones idénticas a la vez)")
+    poblar(200)
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO items (nombre, descripcion, propietario_id) VALUES (:n, 'bench', :p)"),
+            [{"n": f"item{i}", "p": i % 200 + 1} for i in range(500)]
+        )
+
+    async def lanzar(url: str):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            inicio = time.perf_counter()
+            respuestas = await asyncio.gather(*(client.get(url) for _ in range(peticiones)))
+            return respuestas, time.perf_counter() - inicio
+
+    # Todas las peticiones están dentro a la vez: no debe rechazarlas el control de admisión
+    control_admision.activo = False
+    try:
+        # 1) Con la consulta retenida hasta que llegan todas: debe ejecutarse una sola vez
+        compartidas_antes = single_flight.shared
+        contador, quitar = _contar_consultas(
+            "FROM users WHERE id", lambda: single_flight.shared - compartidas_antes >= peticiones - 1
+        )
+        try:
+            respuestas, _ = asyncio.run(lanzar("/users/7"))
+        finally:
+            quitar()
+        assert all(r.status_code == 200 and r.json() == respuestas[0].json() for r in respuestas)
+        assert contador["n"] == 1, contador
+        print(f"  ✅ GET /users/7 x{peticiones}: {contador['n']} consulta, todas las respuestas iguales")
+
+        # 2) Rendimiento real con y sin single-flight
+        for activo in (False, True):
+            single_flight.enabled = activo
+            contador, quitar = _contar_consultas("FROM items ORDER BY id")
+            try:
+                respuestas, duracion = asyncio.run(lanzar("/items/?skip=0&limit=100"))
+            finally:
+                quitar()
+            assert all(r.status_code == 200 for r in respuestas)
+            nombre = "con single-flight" if activo else "sin single-flight"
+            print(
+                f"  {nombre:<20} GET /items/ {peticiones / duracion:7.0f} req/s   "
+                f"{contador['n']:4d} consultas para {peticiones} peticiones"
+            )
+    finally:
+        control_admision.activo = True
+        single_flight.enabled = True
+    print(f"  métricas: {single_flight.stats()}")
+
+
+def _reintentos(claves: list[str], duplicados: int):
+    """Cada clave se envía `duplicados` veces a la vez, como un cliente que reintenta"""
+    async def enviar():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def crear(clave: str):
+                return await client.post(
+                    "/users/1/items/", json={"nombre": clave, "descripcion": "bench"},
+                    headers={"Idempotency-Key": clave}
+                )
+            return await asyncio.gather(*(crear(clave) for clave in claves for _ in range(duplicados)))
+    return asyncio.run(enviar())
+
+
+def _reintentador(claves: list[str], duplicados: int, errores):
+    """Un worker (otro proceso) que reintenta las mismas claves"""
+    engine.dispose(close=False)
+    respuestas = _reintentos(claves, duplicados)
+    if any(r.status_code != 200 for r in respuestas):
+        with errores.get_lock():
+            errores.value += 1
+
+
+def bench_idempotencia(claves: int = 200, duplicados: int = 5, workers: int = 4):
+    """POST con Idempotency-Key reintentado a la vez: un solo item por clave"""
+    print(f"🔁 Idempotency-Key ({claves} claves x {duplicados} envíos simultáneos)")
+    poblar(1)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM idempotency_keys"))
+
+    def items_guardados() -> int:
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT COUNT(*) FROM items")).scalar()
+
+    # Muchos duplicados a la vez: no debe rechazarlos el control de admisión
+    control_admision.activo = False
+    try:
+        lista = [f"movil-{i}" for i in range(claves)]
+        inicio = time.perf_counter()
+        respuestas = _reintentos(lista, duplicados)
+        duracion = time.perf_counter() - inicio
+        repetidas = sum(r.headers.get("idempotent-replayed") == "true" for r in respuestas)
+        por_clave = {}
+        for r in respuestas:
+            assert r.status_code == 200, r.text
+            por_clave.setdefault(r.json()["nombre"], set()).add(r.json()["id"])
+        assert all(len(ids) == 1 for ids in por_clave.values()), "dos items para la misma clave"
+        assert items_guardados() == claves and repetidas == claves * (duplicados - 1)
+        print(
+            f"  ✅ un proceso: {items_guardados()} items para {len(respuestas)} peticiones, "
+            f"{repetidas} respuestas repetidas   ({len(respuestas) / duracion:.0f} req/s)"
+        )
+
+        # Los mismos reintentos desde varios procesos a la vez (como varios workers de uvicorn)
+        lista = [f"multi-{i}" for i in range(claves)]
+        engine.dispose()
+        ctx = multiprocessing.get_context("fork")
+        errores = ctx.Value("i", 0)
+        procesos = [ctx.Process(target=_reintentador, args=(lista, duplicados, errores)) for _ in range(workers)]
+        for proceso in procesos:
+            proceso.start()
+        for proceso in procesos:
+            proceso.join()
+        assert all(proceso.exitcode == 0 for proceso in procesos) and errores.value == 0, "un worker falló"
+        assert items_guardados() == 2 * claves, items_guardados()
+        print(f"  ✅ {workers} procesos: {claves} items nuevos para {claves * duplicados * workers} peticiones")
+
+        # Otro worker tiene la clave y la libera tras un 5xx: el que espera la procesa él mismo
+        with engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO idempotency_keys (clave, huella, expira) VALUES ('liberada', x'00', unixepoch() + 60)")
+            )
+
+        async def liberar_mientras_espera():
+            async def liberar():
+                await asyncio.sleep(0.2)
+                with engine.begin() as conn:
+                    conn.execute(text("DELETE FROM idempotency_keys WHERE clave = 'liberada'"))
+            tarea = asyncio.create_task(liberar())
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                respuesta = await client.post(
+                    "/users/1/items/", json={"nombre": "liberada", "descripcion": "bench"},
+                    headers={"Idempotency-Key": "liberada"}
+                )
+            await tarea
+            return respuesta
+
+        respuesta = asyncio.run(liberar_mientras_espera())
+        assert respuesta.status_code == 200, respuesta.text
+        assert items_guardados() == 2 * claves + 1
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT status FROM idempotency_keys WHERE clave = 'liberada'")).scalar() == 200
+        print("  ✅ clave liberada por otro worker (5xx): la petición que esperaba se procesa")
+
+        # La app lanza una excepción o el cliente se corta: la clave no debe quedar reservada
+        original = crud.create_user_item
+
+        def fallar(**kwargs):
+            raise RuntimeError("fallo inyectado")
+
+        def lento(**kwargs):
+            time.sleep(0.2)
+            return original(**kwargs)
+
+        async def con_fallo(clave: str, defecto, cancelar: bool):
+            transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                def crear():
+                    return client.post(
+                        "/users/1/items/", json={"nombre": clave, "descripcion": "bench"},
+                        headers={"Idempotency-Key": clave}
+                    )
+                crud.create_user_item = defecto
+                try:
+                    if cancelar:
+                        tarea = asyncio.create_task(crear())
+                        await asyncio.sleep(0.05)
+                        tarea.cancel()
+                        await asyncio.gather(tarea, return_exceptions=True)
+                        await asyncio.sleep(0.3)  # el hilo termina y la clave se libera
+                    else:
+                        assert (await crear()).status_code == 500
+                finally:
+                    crud.create_user_item = original
+                return await crear()
+
+        for clave, defecto, cancelar, caso in (
+            ("excepcion", fallar, False, "la app lanza una excepción"),
+            ("desconexion", lento, True, "el cliente se desconecta"),
+        ):
+            antes = items_guardados()
+            respuesta = asyncio.run(con_fallo(clave, defecto, cancelar))
+            assert respuesta.status_code == 200, (caso, respuesta.status_code, respuesta.text)
+            assert respuesta.headers.get("idempotent-replayed") is None, caso
+            # Con la desconexión el primer intento pudo guardar su item: el reintento crea otro
+            assert items_guardados() - antes == (2 if cancelar else 1), caso
+            print(f"  ✅ {caso}: el reintento con la misma clave se procesa (no 409)")
+    finally:
+        control_admision.activo = True
+
+
+def bench_versiones(clientes: int = 20, incrementos: int = 10):
+    """Lectura-modificación-escritura concurrente: If-Match evita perder actualizaciones"""
+    print(f"🏷️  Concurrencia optimista ({clientes} clientes incrementando {incrementos} veces un contador)")
+    poblar(1)
+
+    async def ejecutar(con_if_match: bool, agrupado: bool):
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM items"))
+            conn.execute(text("INSERT INTO items (id, nombre, descripcion, propietario_id) VALUES (1, 'contador', '0', 1)"))
+        conflictos = 0
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            if agrupado:
+                await write_batcher.start()
+
+            async def cliente():
+                nonlocal conflictos
+                for _ in range(incrementos):
+                    while True:
+                        leido = await client.get("/items/1")
+                        valor = int(leido.json()["descripcion"]) + 1
+                        cabeceras = {"If-Match": leido.headers["etag"]} if con_if_match else {}
+                        respuesta = await client.put(
+                            "/items/1", json={"nombre": "contador", "descripcion": str(valor)}, headers=cabeceras
+                        )
+                        if respuesta.status_code != 412:
+                            assert respuesta.status_code == 200, respuesta.text
+                            assert respuesta.headers["etag"] == f'"{respuesta.json()["version"]}"'
+                            break
+                        conflictos += 1  # otro cliente escribió antes: se vuelve a leer
+
+            try:
+                inicio = time.perf_counter()
+                await asyncio.gather(*(cliente() for _ in range(clientes)))
+                duracion = time.perf_counter() - inicio
+                # 404 y 412 se distinguen en la misma transacción que el UPDATE, también en lote
+                datos = {"nombre": "contador", "descripcion": "x"}
+                respuesta = await client.put("/items/999", json=datos, headers={"If-Match": '"1"'})
+                assert respuesta.status_code == 404, respuesta.text
+                respuesta = await client.put("/items/1", json=datos, headers={"If-Match": '"1"'})
+                assert respuesta.status_code == 412, respuesta.text
+            finally:
+                await write_batcher.stop()
+        with engine.connect() as conn:
+            final = conn.execute(text("SELECT descripcion, version FROM items WHERE id = 1")).one()
+        return int(final.descripcion), final.version, conflictos, duracion
+
+    esperado = clientes * incrementos
+    for con_if_match, agrupado in ((False, False), (True, False), (True, True)):
+        contador, version, conflictos, duracion = asyncio.run(ejecutar(con_if_match, agrupado))
+        nombre = ("con If-Match" if con_if_match else "sin If-Match") + (" (en lote)" if agrupado else "")
+        print(
+            f"  {nombre:<24} contador {contador:4d}/{esperado}   versión {version:4d}   "
+            f"412: {conflictos:4d}   {esperado / duracion:6.0f} incrementos/s"
+        )
+        if con_if_match:
+            assert contador == esperado and version == esperado + 1, (contador, version)
+    print("  ✅ con If-Match no se pierde ningún incremento")
+
+
+class SalidaLenta(io.StringIO):
+    """Una salida que tarda en aceptar cada escritura (tubería llena, colector de logs lento)"""
+
+    def __init__(self, retardo: float):
+        super().__init__()
+        self.retardo = retardo
+
+    def write(self, texto: str) -> int:
+        time.sleep(self.retardo)
+        return super().write(texto)
+
+
+def bench_registro(peticiones: int = 2000, retardo_ms: float = 0.2):
+    """Coste por petición de registrar el alta de un usuario: print() vs logging con cola"""
+    print(f"📝 Logging en POST /users/ ({peticiones} registros, salida con {retardo_ms} ms por escritura)")
+    usuario = schemas.UserCreate(email="Ana@Bench.com", password="contraseña123")
+    log = logging.getLogger("app.users")
+
+    def antes(salida):
+        # Lo que hacían users.create_user y crud.create_user en cada alta
+        print(usuario.model_dump(), file=salida)
+        print("Creating user with email:", usuario.email, file=salida)
+
+    def despues(salida):
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("registro_recibido", extra=registro.campos(email=usuario.email))
+        log.info("usuario_creado", extra=registro.campos(user_id=1, email=usuario.email))
+
+    for nombre, funcion in (("print()", antes), ("logging con cola", despues)):
+        salida = SalidaLenta(retardo_ms / 1000)
+        registro.configurar_logging(salida=salida, nivel="DEBUG")
+        inicio = time.perf_counter()
+        for _ in range(peticiones):
+            funcion(salida)
+        coste = (time.perf_counter() - inicio) / peticiones * 1e6
+        registro.detener_logging()  # espera a que el hilo escriba todo
+        texto = salida.getvalue()
+        print(f"  {nombre:<18} {coste:8.1f} µs por petición en el event loop   {len(texto.splitlines()):5d} líneas")
+
+    assert "contraseña123" not in texto and "ana@bench.com" not in texto
+    lineas = [json.loads(linea) for linea in texto.splitlines()]
+    assert sum(linea["evento"] == "usuario_creado" for linea in lineas) == peticiones
+    print(f"  ✅ sin contraseñas ni emails completos; ejemplo: {texto.splitlines()[0]}")
+
+    # La contraseña no debe llegar al logging, ni siquiera antes de ocultarla
+    registros = []
+    espia = logging.Filter()
+    espia.filter = lambda record: registros.append(vars(record).copy()) or True
+    log.addFilter(espia)
+    try:
+        registro.configurar_logging(salida=io.StringIO(), nivel="DEBUG")
+        despues(None)
+        registro.detener_logging()
+    finally:
+        log.removeFilter(espia)
+    assert registros and all("password" not in r and "contraseña123" not in repr(r) for r in registros), registros
+    print("  ✅ la contraseña no llega a ningún registro de log")
+
+    # El muestreo se llama desde varios hilos a la vez y no debe crecer sin límite
+    muestreo = registro.FiltroMuestreo(100)
+    evento = logging.LogRecord("app.users", logging.DEBUG, __file__, 0, "registro_recibido", None, None)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        pasan = sum(pool.map(lambda _: sum(muestreo.filter(evento) for _ in range(1000)), range(8)))
+    assert pasan == 8000 // 100 and muestreo.vistos["registro_recibido"] == 8000, pasan
+    for i in range(3 * registro.MAX_EVENTOS_MUESTREO):
+        muestreo.filter(logging.LogRecord("app.users", logging.DEBUG, __file__, 0, f"evento_{i}", None, None))
+    assert len(muestreo.vistos) <= registro.MAX_EVENTOS_MUESTREO
+    print(f"  ✅ muestreo desde 8 hilos: {pasan} de 8000 DEBUG escritos; tras "
+          f"{3 * registro.MAX_EVENTOS_MUESTREO} mensajes distintos recuerda {len(muestreo.vistos)} "
+          f"(límite {registro.MAX_EVENTOS_MUESTREO})")
+    registro.configurar_logging()
+
+
+class ClienteSSE:
+    """Abre GET /events llamando a la app ASGI (httpx acumula todo el cuerpo antes de devolverlo)"""
+
+    def __init__(self, last_event_id: int | None = None):
+        self.last_event_id = last_event_id
+        self.eventos: asyncio.Queue = asyncio.Queue()
+        self.desconexion = asyncio.Event()
+        self._resto = ""
+
+    async def __aenter__(self):
+        cabeceras = [(b"host", b"bench")]
+        if self.last_event_id is not None:
+            cabeceras.append((b"last-event-id", str(self.last_event_id).encode()))
+        scope = {
+            "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": "/events", "raw_path": b"/events",
+            "root_path": "", "query_string": b"", "headers": cabeceras,
+            "client": ("127.0.0.1", 1), "server": ("bench", 80),
+        }
+        self._task = asyncio.create_task(app(scope, self._receive, self._send))
+        return self
+
+    async def __aexit__(self, *exc):
+        self.desconexion.set()
+        await self._task
+
+    async def _receive(self):
+        if not hasattr(self, "_pedida"):
+            self._pedida = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await self.desconexion.wait()
+        return {"type": "http.disconnect"}
+
+    async def _send(self, message):
+        if message["type"] != "http.response.body":
+            return
+        if not message.get("more_body", False):
+            await self.eventos.put(None)  # el servidor cerró el stream
+        self._resto += message.get("body", b"").decode()
+        *bloques, self._resto = self._resto.split("\n\n")
+        for bloque in bloques:
+            campos = dict(linea.split(": ", 1) for linea in bloque.splitlines() if not linea.startswith(":"))
+            if "event" in campos:
+                await self.eventos.put((int(campos["id"]), campos["event"], json.loads(campos["data"])))
+
+    async def recibir(self, n: int, timeout: float = 10.0) -> list:
+        return [await asyncio.wait_for(self.eventos.get(), timeout) for _ in range(n)]
+
+
+def bench_eventos(suscriptores: int = 50, items: int = 200):
+    """GET /events: reparto de avisos a muchos suscriptores, reanudación y clientes lentos"""
+    print(f"📡 Avisos de cambios por SSE ({suscriptores} suscriptores, {items} items creados)")
+    poblar(10)
+
+    async def ejecutar():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await difusor.start()
+            clientes = [ClienteSSE() for _ in range(suscriptores)]
+            for cliente in clientes:
+                await cliente.__aenter__()
+            await asyncio.sleep(0.1)  # deja que todos lean su posición inicial
+
+            # 1) Cada alta llega a todos los suscriptores, en orden
+            creados, latencias = [], []
+            inicio = time.perf_counter()
+            for n in range(items):
+                enviado = time.perf_counter()
+                respuesta = await client.post(f"/users/{n % 10 + 1}/items/", json={"nombre": f"item{n}"})
+                creados.append(respuesta.json()["id"])
+                (primero,) = await clientes[0].recibir(1)
+                latencias.append((time.perf_counter() - enviado) * 1000)
+                assert primero[1:] == ("items", {"tabla": "items", "operacion": "create", "id": creados[-1]})
+            duracion = time.perf_counter() - inicio
+            for cliente in clientes[1:]:
+                recibidos = await cliente.recibir(items)
+                assert [e[2]["id"] for e in recibidos] == creados
+            print(
+                f"  ✅ {suscriptores} suscriptores x {items} avisos, en orden   "
+                f"alta → aviso p50 {statistics.median(latencias):6.2f} ms   {items / duracion:5.0f} altas/s"
+            )
+            ultimo_id = recibidos[-1][0]
+            for cliente in clientes:
+                await cliente.__aexit__()
+
+            # 2) Un cliente que se desconectó reanuda con Last-Event-ID sin perder nada
+            actualizado = await client.put(f"/items/{creados[0]}", json={"nombre": "renombrado"})
+            assert actualizado.status_code == 200
+            await client.delete(f"/items/{creados[1]}")
+            async with ClienteSSE(last_event_id=ultimo_id - 2) as cliente:
+                recibidos = await cliente.recibir(4)
+            esperado = [
+                ("items", "create", creados[-2]), ("items", "create", creados[-1]),
+                ("items", "update", creados[0]), ("items", "delete", creados[1]),
+            ]
+            assert [(e[1], e[2]["operacion"], e[2]["id"]) for e in recibidos] == esperado, recibidos
+            print("  ✅ reanudación con Last-Event-ID: los 2 últimos avisos + 1 update + 1 delete")
+
+            # 3) Un suscriptor que no lee llena su buffer y se cierra sin frenar a los demás
+            buffer_original, difusor.buffer = difusor.buffer, 20
+            lento = difusor.suscribir()
+            try:
+                async with ClienteSSE() as rapido:
+                    await asyncio.sleep(0.1)
+                    for n in range(50):
+                        await client.post("/users/1/items/", json={"nombre": f"extra{n}"})
+                    assert len(await rapido.recibir(50)) == 50
+            finally:
+                difusor.buffer = buffer_original
+                difusor.desuscribir(lento)
+            assert lento.cerrada and len(lento.pendientes) <= 20
+            print("  ✅ un suscriptor lento se desconecta (buffer de 20) y el resto recibe los 50 avisos")
+            await difusor.stop()
+
+    asyncio.run(ejecutar())
+    print(f"  métricas: {difusor.stats()}")
+
+
+def bench_archivado(items: int = 300_000, num_users: int = 1000, dias: int = 365):
+    """Archivado de items antiguos: duración de cada lote y lecturas antes/después"""
+    print(f"🗄️  Archivado de items ({items} items repartidos en 3 años, se archivan los de más de {dias} días)")
+    poblar(num_users)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM items_archive"))
+        # created_at crece con el id, como en una tabla real
+        conn.execute(text("""
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :items)
+            INSERT INTO items (nombre, descripcion, created_at, propietario_id)
+            SELECT 'item' || i, 'bench', unixepoch('now', '-' || ((:items - i) * 1095 / :items) || ' days'),
+                   i % :num_users + 1
+            FROM n
+        """), {"items": items, "num_users": num_users})
+    consulta_conteos = text("SELECT (SELECT SUM(item_count) FROM users), (SELECT max(id) FROM cambios)")
+
+    def medir_lecturas(etiqueta: str):
+        with ReadSessionLocal() as db:
+            inicio = time.perf_counter()
+            total = db.execute(text("SELECT COUNT(*) FROM items")).scalar()
+            conteo = (time.perf_counter() - inicio) * 1000
+            tiempos = []
+            for _ in range(20):
+                inicio = time.perf_counter()
+                pagina = crud.get_items(db, skip=total - 100, limit=100)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            assert len(pagina) == 100
+        print(
+            f"  {etiqueta:<18} {total:7d} items en la tabla   COUNT(*) {conteo:7.2f} ms   "
+            f"última página {statistics.median(tiempos):7.2f} ms"
+        )
+
+    with engine.connect() as conn:
+        item_count_antes, cambio_antes = conn.execute(consulta_conteos).one()
+    medir_lecturas("antes de archivar")
+
+    duraciones = []
+    inicio = time.perf_counter()
+    archivado = archivar_items(dias=dias, batch_size=1000, pausa_ms=0)
+    while True:
+        inicio_lote = time.perf_counter()
+        if next(archivado, None) is None:
+            break
+        duraciones.append((time.perf_counter() - inicio_lote) * 1000)
+    total = time.perf_counter() - inicio
+    print(
+        f"  archivado          {len(duraciones)} lotes de 1000 en {total:5.2f} s   "
+        f"bloqueo de escritura por lote p50 {statistics.median(duraciones):6.2f} ms   máx {max(duraciones):6.2f} ms"
+    )
+    medir_lecturas("después")
+
+    with engine.connect() as conn:
+        calientes, archivados, max_archivado = conn.execute(text(
+            "SELECT (SELECT COUNT(*) FROM items), (SELECT COUNT(*) FROM items_archive), (SELECT max(id) FROM items_archive)"
+        )).one()
+        item_count_despues, cambio_despues = conn.execute(consulta_conteos).one()
+    with SessionLocal() as db:
+        diferencias = verificar_estadisticas(db)
+        nuevo = crud.create_user_item(db, schemas.ItemCreate(nombre="nuevo"), 1)
+        assert crud.get_item(db, max_archivado) is None
+        assert crud.get_item(db, max_archivado, archivados=True).id == max_archivado
+    assert calientes + archivados == items and archivados > 0
+    assert item_count_despues == item_count_antes and cambio_despues == cambio_antes
+    assert not diferencias, diferencias
+    assert nuevo.id > max_archivado
+    print("  ✅ ningún item perdido; item_count, estadísticas y /events sin cambios; los ids no se repiten")
+
+    # Se borran todos los items que quedan en items: el siguiente no debe recibir un id
+    # archivado, y su borrado es una baja de verdad (item_count, estadísticas y /events)
+    with SessionLocal() as db:
+        db.execute(text("DELETE FROM items"))
+        db.commit()
+        otro = crud.create_user_item(db, schemas.ItemCreate(nombre="otro"), 1)
+        ultimo_cambio = db.execute(text("SELECT max(id) FROM cambios")).scalar()
+        crud.delete_item(db, otro.id)
+        aviso = db.execute(
+            text("SELECT operacion, fila_id FROM cambios WHERE id > :id"), {"id": ultimo_cambio}
+        ).all()
+        derivas = recalcular_item_count(db)
+        diferencias = verificar_estadisticas(db)
+        db.rollback()
+    assert otro.id > max_archivado, (otro.id, max_archivado)
+    assert aviso == [("delete", otro.id)], aviso
+    assert derivas == 0 and not diferencias, (derivas, diferencias)
+    print(f"  ✅ con items vacía el item nuevo recibe el id {otro.id} (> {max_archivado}) y su borrado cuenta")
+
+
+def _fechas_en_rango(fechas: list[int], desde: int, hasta: int, limite: int) -> list[int]:
+    """Las fechas (ordenadas) de [desde, hasta) que devuelve la consulta con LIMIT"""
+    return fechas[bisect.bisect_left(fechas, desde):bisect.bisect_left(fechas, hasta)][:limite]
+
+
+def bench_fechas(filas: int = 500_000, consultas: int = 200):
+    """created_at como texto sin índice (antes) vs entero con índice: tamaño y consultas por rango"""
+    print(f"📅 Fechas como texto vs enteros ({filas} items, {consultas} consultas de un día)")
+    ahora = int(time.time())
+    # Un item cada ~3 minutos durante 3 años, con created_at creciente
+    paso = 3 * 365 * 86400 // filas
+    fechas = [ahora - (filas - i) * paso for i in range(1, filas + 1)]
+    esquemas = {
+        "texto (antes)": ("DATETIME", "datetime(:ahora - (:filas - i) * :paso, 'unixepoch')", False),
+        "entero + índice": ("INTEGER", ":ahora - (:filas - i) * :paso", True),
+    }
+    tiempos_por_esquema = {}
+    for nombre, (tipo, valor, indice) in esquemas.items():
+        ruta = os.path.join(_tmpdir, f"fechas_{tipo.lower()}.db")
+        if os.path.exists(ruta):
+            os.remove(ruta)  # de una ejecución anterior con otro número de filas
+        motor = create_engine(f"sqlite:///{ruta}")
+        with motor.begin() as conn:
+            conn.execute(text(f"""
+                CREATE TABLE items (
+                    id INTEGER PRIMARY KEY, nombre VARCHAR NOT NULL, descripcion VARCHAR,
+                    created_at {tipo} NOT NULL, propietario_id INTEGER
+                )
+            """))
+            conn.execute(text(f"""
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :filas)
+                INSERT INTO items (nombre, descripcion, created_at, propietario_id)
+                SELECT 'item' || i, 'bench', {valor}, i % 1000 + 1 FROM n
+            """), {"filas": filas, "ahora": ahora, "paso": paso})
+            if indice:
+                conn.execute(text("CREATE INDEX items_created_at ON items (created_at)"))
+        with motor.connect() as conn:
+            conn.execute(text("VACUUM"))
+            bytes_fecha = conn.execute(text("SELECT SUM(length(CAST(created_at AS BLOB))) FROM items")).scalar()
+            if tipo == "INTEGER":
+                # El tamaño real de un entero en el registro de SQLite
+                bytes_fecha = conn.execute(text(
+                    "SELECT SUM(CASE WHEN created_at < 2147483648 THEN 4 ELSE 6 END) FROM items"
+                )).scalar()
+            rango = "created_at >= :desde AND created_at < :hasta"
+            if tipo == "DATETIME":
+                rango = "created_at >= datetime(:desde, 'unixepoch') AND created_at < datetime(:hasta, 'unixepoch')"
+            tiempos = []
+            for n in range(consultas):
+                desde = ahora - (n + 1) * 5 * 86400
+                inicio = time.perf_counter()
+                resultado = conn.execute(
+                    text(f"SELECT * FROM items WHERE {rango} ORDER BY created_at, id LIMIT 100"),
+                    {"desde": desde, "hasta": desde + 86400}
+                ).all()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+                # Las mismas fechas, en orden, que las generadas en ese rango (hasta 100)
+                esperadas = _fechas_en_rango(fechas, desde, desde + 86400, 100)
+                if tipo == "DATETIME":
+                    esperadas = [
+                        datetime.fromtimestamp(f, timezone.utc).strftime("%Y-%m-%d %H:%M:%S") for f in esperadas
+                    ]
+                assert [fila.created_at for fila in resultado] == esperadas, (nombre, desde)
+            tiempos_por_esquema[nombre] = tiempos
+        motor.dispose()
+        print(
+            f"  {nombre:<18} archivo {os.path.getsize(ruta) / 2**20:6.1f} MiB   "
+            f"created_at {bytes_fecha / filas:5.1f} bytes/fila   "
+            f"rango de un día p50 {statistics.median(tiempos):7.3f} ms   p95 {_percentil(tiempos, 95):7.3f} ms"
+        )
+
+    # Respuesta de la API: el rango llega como filtro de GET /items/
+    poblar(1000)
+    fechas = [ahora - (filas // 5 - i) * paso * 5 for i in range(1, filas // 5 + 1)]
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :filas)
+            INSERT INTO items (nombre, descripcion, created_at, propietario_id)
+            SELECT 'item' || i, 'bench', :ahora - (:filas - i) * :paso, i % 1000 + 1 FROM n
+        """), {"filas": filas // 5, "ahora": ahora, "paso": paso * 5})
+
+    async def filtrar():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            tiempos = []
+            for n in range(consultas):
+                desde = ahora - (n + 1) * 5 * 86400
+                inicio = time.perf_counter()
+                respuesta = await client.get("/items/", params={
+                    "created_after": desde, "created_before": desde + 86400, "limit": 50
+                })
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+                assert respuesta.status_code == 200, respuesta.text
+                assert len(respuesta.json()) == len(_fechas_en_rango(fechas, desde, desde + 86400, 50))
+            return tiempos
+
+    tiempos = asyncio.run(filtrar())
+    print(f"  GET /items/?created_after=...&created_before=...   p50 {statistics.median(tiempos):6.2f} ms")
+    with ReadSessionLocal() as db:
+        plan = db.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM items WHERE created_at >= 0 AND created_at < 1 ORDER BY created_at, id"
+        )).all()
+    assert "items_created_at" in plan[0][-1], plan
+    print(f"  ✅ plan: {plan[0][-1]}")
+
+
+def _leer_pagina(modo: str, limit: int, resultado):
+    """
+    En un proceso nuevo: lee una página con get_items (o con mappings(), como
+    antes) y la convierte en el cuerpo de la respuesta con lo mismo que usa
+    FastAPI: serialize_response con el response_model de GET /items/ y JSONResponse
+    """
+    import tracemalloc
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+
+    def leer(db):
+        if modo == "mappings":
+            return db.execute(
+                text("SELECT * FROM items ORDER BY id LIMIT :limit OFFSET 0"), {"limit": limit}
+            ).mappings().all()
+        return crud.get_items(db, skip=0, limit=limit)
+
+    campo = next(ruta.response_field for ruta in app.routes if ruta.path == "/items/" and "GET" in ruta.methods)
+    loop = asyncio.new_event_loop()
+
+    def responder(filas) -> bytes:
+        return JSONResponse(loop.run_until_complete(serialize_response(field=campo, response_content=filas))).body
+
+    with ReadSessionLocal() as db:
+        responder(leer(db)[:1])  # calentamiento
+        rss_inicial = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        lecturas, respuestas = [], []
+        for _ in range(5):
+            inicio = time.perf_counter()
+            filas = leer(db)
+            lecturas.append((time.perf_counter() - inicio) * 1000)
+            inicio = time.perf_counter()
+            cuerpo = responder(filas)
+            respuestas.append((time.perf_counter() - inicio) * 1000)
+            del filas
+        rss = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_inicial) / 1024
+        tracemalloc.start()
+        filas = leer(db)
+        bytes_fila = tracemalloc.get_traced_memory()[0] / len(filas)
+        tracemalloc.stop()
+    loop.close()
+    resultado.put((bytes_fila, statistics.median(lecturas), statistics.median(respuestas), rss, hashlib.sha256(cuerpo).hexdigest()))
+
+
+def bench_filas(limit: int = 10_000, repeticiones: int = 3):
+    """get_items(limit=10000): memoria por fila y pico de RSS con RowMapping (antes) y con filas compactas"""
+    print(f"🧱 Filas de crud.get_items (limit={limit})")
+    poblar(100)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :limit)
+            INSERT INTO items (nombre, descripcion, propietario_id)
+            SELECT 'item' || i, 'descripción del item ' || i, i % 100 + 1 FROM n
+        """), {"limit": limit})
+
+    ctx = multiprocessing.get_context("fork")
+    cuerpos = set()
+    for modo, nombre in (("mappings", "RowMapping (antes)"), ("filas", "dataclass con __slots__")):
+        medidas = []
+        for _ in range(repeticiones):
+            # Un proceso por medida: ru_maxrss es el máximo de toda la vida del proceso
+            resultado = ctx.Queue()
+            proceso = ctx.Process(target=_leer_pagina, args=(modo, limit, resultado))
+            proceso.start()
+            medidas.append(resultado.get())
+            proceso.join()
+        bytes_fila, lectura, respuesta_ms, rss = (statistics.median(m) for m in list(zip(*medidas))[:4])
+        cuerpos.update(m[4] for m in medidas)
+        print(
+            f"  {nombre:<24} {bytes_fila:5.0f} bytes/fila   lectura {lectura:6.1f} ms   "
+            f"validar + JSON {respuesta_ms:6.1f} ms   pico de RSS +{rss:5.1f} MiB"
+        )
+    assert len(cuerpos) == 1, cuerpos
+    print("  ✅ la misma respuesta JSON con los dos tipos de fila")
+
+    # Lo medido es lo que responde la API: el mismo cuerpo que GET /items/
+    async def pedir():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await client.get("/items/", params={"limit": limit})
+
+    respuesta = asyncio.run(pedir())
+    assert respuesta.status_code == 200, respuesta.status_code
+    assert hashlib.sha256(respuesta.content).hexdigest() in cuerpos, "el cuerpo medido no es el de GET /items/"
+    # from_attributes está en el model_config: Pydantic lee las filas sin pedirlo en cada llamada
+    with ReadSessionLocal() as db:
+        schemas.Item.model_validate(crud.get_items(db, limit=1)[0])
+    print("  ✅ es el mismo cuerpo que devuelve GET /items/ y los schemas leen las filas por atributos")
+
+    # single-flight comparte la misma fila entre peticiones: nadie debe poder modificarla
+    with ReadSessionLocal() as db:
+        fila = crud.get_items(db, limit=1)[0]
+    try:
+        fila.nombre = "otro"
+    except dataclasses.FrozenInstanceError:
+        print("  ✅ filas inmutables, como los RowMapping")
+    else:
+        raise AssertionError("la fila compartida se pudo modificar")
+
+
+# Primeras peticiones de un worker recién arrancado (una de cada tipo).
+# items.id es AUTOINCREMENT: el id del item se conoce al insertarlo
+PRIMERAS_PETICIONES = [
+    ("GET", "/users/1"), ("GET", "/users/?limit=10"), ("GET", "/items/?limit=10"),
+    ("GET", "/items/{item_id}"), ("GET", "/items/?limit=10&archivados=true"), ("GET", "/stats"),
+    ("PUT", "/items/{item_id}"),
+]
+
+
+def _primeras_peticiones(calentar: bool, item_id: int, resultado):
+    """En un proceso nuevo: tiempos de las primeras peticiones, con o sin calentamiento"""
+    # Nada de lo que preparó el proceso padre: ni conexiones, ni sentencias compiladas
+    for motor in {engine, read_engine}:
+        motor.dispose(close=False)
+        motor._compiled_cache.clear()
+    filas.tipo_fila.cache_clear()
+
+    async def peticion(client, metodo, ruta):
+        inicio = time.perf_counter()
+        if metodo == "PUT":
+            response = await client.put(ruta, json={"nombre": "calentado", "descripcion": None})
+        else:
+            response = await client.get(ruta)
+        assert response.status_code == 200, (ruta, response.status_code)
+        return (time.perf_counter() - inicio) * 1000
+
+    async def run():
+        # Como en el lifespan (la primera llamada al threadpool importa el backend de anyio)
+        await run_in_threadpool(calentamiento.calentar if calentar else lambda: None)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # Sin base de datos: con uvicorn, el lifespan ya construyó la pila de middlewares
+            await client.get("/metrics/warmup")
+            return [await peticion(client, m, r.format(item_id=item_id)) for m, r in PRIMERAS_PETICIONES]
+
+    resultado.put((asyncio.run(run()), calentamiento.stats()))
+
+
+def bench_calentamiento(repeticiones: int = 10):
+    """Latencia de las primeras peticiones de un worker con y sin calentar los pools (medianas)"""
+    print(f"🔥 Primeras {len(PRIMERAS_PETICIONES)} peticiones de un worker nuevo ({repeticiones} procesos por modo)")
+    poblar(100)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO items (nombre, propietario_id) SELECT 'item', id FROM users"))
+        antes = conn.execute(text("SELECT (SELECT count(*) FROM cambios), (SELECT max(id) FROM cambios)")).one()
+        item_id = conn.execute(text("SELECT min(id) FROM items")).scalar()
+
+    ctx = multiprocessing.get_context("fork")
+    for calentar, nombre in ((False, "en frío"), (True, "tras calentar")):
+        tiempos, estado = [], None
+        for _ in range(repeticiones):
+            resultado = ctx.Queue()
+            proceso = ctx.Process(target=_primeras_peticiones, args=(calentar, item_id, resultado))
+            proceso.start()
+            # Si el proceso falla no envía nada: el plazo evita esperarlo para siempre
+            medidas, estado = resultado.get(timeout=60)
+            proceso.join()
+            tiempos.append(medidas)
+        medianas = [statistics.median(t) for t in zip(*tiempos)]
+        print(
+            f"  {nombre:<16} primera {medianas[0]:6.2f} ms   las {len(medianas)} seguidas {sum(medianas):6.2f} ms   "
+            f"más lenta de las demás {max(medianas[1:]):5.2f} ms"
+        )
+    print(f"  calentamiento: {estado}")
+    assert estado["ready"] and estado["errors"] == 0, estado
+
+    # Calentar no escribe nada: los únicos cambios son los de los PUT
+    with engine.connect() as conn:
+        despues = conn.execute(text("SELECT (SELECT count(*) FROM cambios), (SELECT max(id) FROM cambios)")).one()
+    assert despues[1] - antes[1] == 2 * repeticiones, (antes, despues)
+    print("  ✅ el calentamiento no modifica la base de datos")
+
+    # Cada conexión del pool debe haber preparado todas las sentencias, no solo algunas
+    vistas = collections.defaultdict(set)
+
+    def anotar(conn, cursor, statement, *args):
+        vistas[(conn.engine is engine, id(conn.connection.dbapi_connection))].add(statement)
+
+    for motor in {engine, read_engine}:
+        motor.dispose()
+        event.listen(motor, "before_cursor_execute", anotar)
+    try:
+        calentamiento.calentar()
+    finally:
+        for motor in {engine, read_engine}:
+            event.remove(motor, "before_cursor_execute", anotar)
+    for es_escritura, motor in ((True, engine), (False, read_engine)):
+        por_conexion = [len(v) for (escritura, _), v in vistas.items() if escritura == es_escritura]
+        distintas = len(set().union(*(v for (escritura, _), v in vistas.items() if escritura == es_escritura)))
+        print(f"  {'escritura' if es_escritura else 'lectura':<10} sentencias distintas por conexión: {por_conexion}")
+        assert len(por_conexion) == motor.pool.size(), por_conexion
+        assert por_conexion == [distintas] * len(por_conexion), (por_conexion, distintas)
+    print("  ✅ todas las conexiones del pool prepararon todas las sentencias")
+
+
+def bench_salud(repeticiones: int = 500):
+    """/healthz y /readyz: latencia y respuesta antes de calentar, con el pool agotado y con la base lenta"""
+    print(f"🩺 Comprobaciones de salud ({repeticiones} peticiones)")
+    poblar(10)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def readyz(status_esperado: int, motivo: str | None, pool: str | None = None):
+                inicio = time.perf_counter()
+                response = await client.get("/readyz")
+                ms = (time.perf_counter() - inicio) * 1000
+                cuerpo = response.json()
+                assert (response.status_code, cuerpo["reason"], cuerpo["pool"]) == (status_esperado, motivo, pool), cuerpo
+                return ms, cuerpo
+
+            calentamiento.listo = False
+            await readyz(503, "warming_up")
+            print("  ✅ antes de calentar: /readyz 503 warming_up")
+            await run_in_threadpool(calentamiento.calentar)
+
+            for ruta in ("/healthz", "/readyz"):
+                tiempos = []
+                for _ in range(repeticiones):
+                    inicio = time.perf_counter()
+                    response = await client.get(ruta)
+                    tiempos.append((time.perf_counter() - inicio) * 1000)
+                    assert response.status_code == 200, response.text
+                print(f"  {ruta:<10} p50 {statistics.median(tiempos):6.3f} ms   p99 {sorted(tiempos)[int(len(tiempos) * 0.99)]:6.3f} ms")
+            print(f"  {response.json()}")
+
+            # Todas las conexiones de un pool ocupadas: responde sin esperar al pool_timeout.
+            # El de lectura atiende todas las rutas GET: también cuenta
+            for nombre, motor in salud.MOTORES.items():
+                conexiones = [motor.connect() for _ in range(motor.pool.size() + motor.pool._max_overflow)]
+                ms, _ = await readyz(503, "pool_exhausted", nombre)
+                for conn in conexiones:
+                    conn.close()
+                print(f"  ✅ pool de {nombre} agotado: /readyz 503 pool_exhausted en {ms:.2f} ms")
+
+            control_admision.en_curso += control_admision.max_en_curso
+            await readyz(503, "in_flight")
+            control_admision.en_curso -= control_admision.max_en_curso
+            print("  ✅ sobrecarga: /readyz 503 in_flight")
+
+            # Base de datos que tarda más que el plazo, en cada pool
+            def lento(*args):
+                time.sleep(0.5)
+            for nombre, motor in salud.MOTORES.items():
+                plazo, salud.READYZ_TIMEOUT_MS = salud.READYZ_TIMEOUT_MS, 50
+                event.listen(motor, "before_cursor_execute", lento)
+                try:
+                    ms, _ = await readyz(503, "db_timeout", nombre)
+                finally:
+                    event.remove(motor, "before_cursor_execute", lento)
+                    salud.READYZ_TIMEOUT_MS = plazo
+                print(f"  ✅ pool de {nombre} lento (0.5 s, plazo 50 ms): /readyz 503 db_timeout en {ms:.2f} ms")
+                await asyncio.sleep(0.5)  # el SELECT 1 abandonado devuelve su conexión
+            await readyz(200, None)
+
+    asyncio.run(run())
+
+
+def bench_apagado(peticiones: int = 50, items_wal: int = 100_000):
+    """Apagado con escrituras en curso: ninguna se pierde y el WAL queda vacío"""
+    print(f"🛑 Apagado ordenado ({peticiones} escrituras en curso, WAL tras {items_wal} items)")
+    poblar(10)
+    for inicio in range(0, items_wal, 10_000):
+        with engine.begin() as conn:
+            conn.execute(text("""
+                WITH RECURSIVE n(i) AS (SELECT :desde UNION ALL SELECT i + 1 FROM n WHERE i < :hasta)
+                INSERT INTO items (nombre, descripcion, propietario_id)
+                SELECT 'item' || i, 'bench', i % 10 + 1 FROM n
+            """), {"desde": inicio, "hasta": inicio + 9_999})
+    wal = engine.url.database + "-wal"
+    with engine.connect() as conn:
+        items_antes = conn.execute(text("SELECT count(*) FROM items")).scalar()
+
+    # Cada INSERT tarda un poco más: así las peticiones siguen en curso al apagar
+    def lento(conn, cursor, statement, *args):
+        if statement.lstrip().startswith("INSERT INTO items"):
+            time.sleep(0.002)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await write_batcher.start()
+            # Otro worker con la base abierta: si no, SQLite borra el -wal al cerrar la última conexión
+            otro_worker = sqlite3.connect(engine.url.database)
+            otro_worker.execute("SELECT count(*) FROM users").fetchall()
+            async with app.router.lifespan_context(app):
+                print(f"  WAL antes de apagar: {os.path.getsize(wal) / 1024:8.0f} KiB")
+                event.listen(engine, "before_cursor_execute", lento)
+                tareas = [
+                    asyncio.create_task(client.post(
+                        f"/users/{i % 10 + 1}/items/", json={"nombre": f"apagado{i}", "descripcion": None}
+                    ))
+                    for i in range(peticiones)
+                ]
+                while control_admision.en_curso < peticiones:
+                    await asyncio.sleep(0)
+                en_curso = control_admision.en_curso
+                inicio = time.perf_counter()
+            duracion = (time.perf_counter() - inicio) * 1000
+            event.remove(engine, "before_cursor_execute", lento)
+            respuestas = await asyncio.gather(*tareas)
+            tardia = await client.get("/users/1")
+            tamano_wal = os.path.getsize(wal)
+            otro_worker.close()
+        return en_curso, duracion, respuestas, tardia, tamano_wal
+
+    try:
+        en_curso, duracion, respuestas, tardia, tamano_wal = asyncio.run(run())
+    finally:
+        control_admision.cerrando = False
+    print(f"  apagado en {duracion:6.1f} ms con {en_curso} peticiones en curso")
+    print(f"  WAL después:         {tamano_wal / 1024:8.0f} KiB")
+    assert all(r.status_code == 200 for r in respuestas), [r.status_code for r in respuestas]
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM items")).scalar() == items_antes + peticiones
+    print(f"  ✅ las {peticiones} escrituras en curso terminaron y están en la base")
+    assert tardia.status_code == 503, tardia.status_code
+    print(f"  ✅ petición durante el apagado: {tardia.status_code} {tardia.json()['detail']}")
+    assert tamano_wal == 0
+    print("  ✅ wal_checkpoint(TRUNCATE): el archivo -wal quedó vacío")
+
+    # Una petición que no termina: drenar se rinde al llegar al plazo
+    async def colgada():
+        control_admision.en_curso += 1
+        try:
+            inicio = time.perf_counter()
+            pendientes = await apagado.drenar(0.2)
+            return pendientes, (time.perf_counter() - inicio) * 1000
+        finally:
+            control_admision.en_curso -= 1
+            control_admision.cerrando = False
+
+    pendientes, ms = asyncio.run(colgada())
+    assert pendientes == 1
+    print(f"  ✅ una petición colgada no bloquea el apagado: plazo 200 ms, drenar tardó {ms:.0f} ms")
+
+
+BENCHMARKS = {
+    "escrituras": bench_escrituras,
+    "lecturas": bench_lecturas,
+    "validacion": bench_validacion,
+    "registros": bench_registros,
+    "importacion": bench_importacion,
+    "sobrecarga": bench_sobrecarga,
+    "coalescencia": bench_coalescencia,
+    "idempotencia": bench_idempotencia,
+    "versiones": bench_versiones,
+    "registro": bench_registro,
+    "eventos": bench_eventos,
+    "archivado": bench_archivado,
+    "fechas": bench_fechas,
+    "filas": bench_filas,
+    "calentamiento": bench_calentamiento,
+    "salud": bench_salud,
+    "apagado": bench_apagado,
+}
+
+
+def main():
+    nombres = sys.argv[1:] or list(BENCHMARKS)
+    for nombre in nombres:
+        if nombre not in BENCHMARKS:
+            print(f"❌ Benchmark desconocido: {nombre}. Opciones: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+        BENCHMARKS[nombre]()
+        print("")
+
+
+if __name__ == "__main__":
+    main()
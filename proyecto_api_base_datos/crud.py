@@ -1,52 +1,96 @@
+import logging
+from datetime import datetime, timezone
+
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 
 from schemas import UserCreate, ItemCreate
 
 from fastapi import HTTPException
 
+from filas import primera, todas
+from registro import campos
+
+log = logging.getLogger("app.crud")
+
 def get_user(db: Session, user_id: int):
     result = db.execute(text("SELECT * FROM users WHERE id = :user_id"), {"user_id": user_id})
-    user = result.mappings().first()
+    user = primera(result)
     return user if user else None
 
 def get_user_by_email(db: Session, email: str):
-    result = db.execute(text("SELECT * FROM users WHERE email = :email"), {"email": email})
-    user = result.mappings().first()
+    # lower(email) usa el índice users_email_lower: la búsqueda ignora mayúsculas
+    result = db.execute(text("SELECT * FROM users WHERE lower(email) = :email"), {"email": email.lower()})
+    user = primera(result)
     return user if user else None
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
+def a_epoch(fecha: datetime) -> int:
+    # created_at se guarda en segundos desde 1970 (UTC); sin zona horaria se asume UTC
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return int(fecha.timestamp())
+
+def _filtro_created_at(created_after: datetime | None, created_before: datetime | None) -> tuple[str, str, dict]:
+    """
+    WHERE y ORDER BY para un rango [created_after, created_before).
+    Con rango se ordena por (created_at, id): el índice sobre created_at ya está
+    en ese orden, así que SQLite recorre solo el rango y se detiene en LIMIT.
+    """
+    condiciones, params = [], {}
+    if created_after is not None:
+        condiciones.append("created_at >= :created_after")
+        params["created_after"] = a_epoch(created_after)
+    if created_before is not None:
+        condiciones.append("created_at < :created_before")
+        params["created_before"] = a_epoch(created_before)
+    if not condiciones:
+        return "", "id", params
+    return " WHERE " + " AND ".join(condiciones), "created_at, id", params
+
+def get_users(
+    db: Session, skip: int = 0, limit: int = 100,
+    created_after: datetime | None = None, created_before: datetime | None = None
+):
+    where, orden, params = _filtro_created_at(created_after, created_before)
     result = db.execute(
-        text("SELECT * FROM users ORDER BY id LIMIT :limit OFFSET :skip"),
-        {"skip": skip, "limit": limit}
+        text(f"SELECT * FROM users{where} ORDER BY {orden} LIMIT :limit OFFSET :skip"),
+        {"skip": skip, "limit": limit, **params}
     )
-    users = result.mappings().all()
+    users = todas(result)
     return users
 
 def create_user(db: Session, user: UserCreate):
+    """
+    Crea el usuario con una sola sentencia y devuelve None si el email ya existe.
+    El índice único users_email_lower decide el conflicto, así que dos registros
+    simultáneos con el mismo email no pueden crear dos cuentas.
+    """
     # Aquí deberías hashear la contraseña antes de almacenarla
     fake_hashed_password = user.password + "notreallyhashed"
-    print("Creating user with email:", user.email)
-    db.execute(
+    result = db.execute(
         text("""
             INSERT INTO users (email, hashed_password, es_activo) 
             VALUES (:email, :hashed_password, true) 
+            ON CONFLICT DO NOTHING
+            RETURNING *
         """),
         {"email": user.email, "hashed_password": fake_hashed_password}
     )
+    new_user = primera(result)
     db.commit()
-    result = db.execute(
-        text("SELECT * FROM users WHERE email = :email"),
-        {"email": user.email}
-    )
-    new_user = result.mappings().first()
+    if new_user is None:
+        log.debug("email_ya_registrado", extra=campos(email=user.email))
+    else:
+        log.info("usuario_creado", extra=campos(user_id=new_user.id, email=user.email))
     return new_user
 
-def create_user_item(db: Session, item: ItemCreate, user_id: int):
+def insert_user_item(db: Session, item: ItemCreate, user_id: int):
+    # Sin commit: lo usa create_user_item y también la cola de escrituras en lote
     result = db.execute(
         text("""
             INSERT INTO items (nombre, descripcion, propietario_id) 
             VALUES (:nombre, :descripcion, :propietario_id) 
+            RETURNING *
         """),
         {
             "nombre": item.nombre,
@@ -54,13 +98,32 @@ def create_user_item(db: Session, item: ItemCreate, user_id: int):
             "propietario_id": user_id
         }
     )
+    return primera(result)
+
+def create_user_item(db: Session, item: ItemCreate, user_id: int):
+    new_item = insert_user_item(db, item, user_id)
     db.commit()
+    return new_item
+
+def get_existing_user_ids(db: Session, user_ids: set[int]) -> set[int]:
+    # Una sola consulta para todo el lote: IN (...) con un parámetro por id
+    if not user_ids:
+        return set()
     result = db.execute(
-        text("SELECT * FROM items WHERE nombre = :nombre AND propietario_id = :propietario_id"),
-        {"nombre": item.nombre, "propietario_id": user_id}
+        text("SELECT id FROM users WHERE id IN :user_ids").bindparams(bindparam("user_ids", expanding=True)),
+        {"user_ids": list(user_ids)}
+    )
+    return set(result.scalars())
+
+def insert_items(db: Session, items: list[dict]):
+    # Sin commit: una sola sentencia preparada para todas las filas (executemany)
+    db.execute(
+        text("""
+            INSERT INTO items (nombre, descripcion, propietario_id) 
+            VALUES (:nombre, :descripcion, :propietario_id) 
+        """),
+        items
     )
-    new_item = result.mappings().first()
-    return new_item
 
 def update_user(db: Session, user_id: int, new_email: str):
     user = get_user(db, user_id)
@@ -68,11 +131,11 @@ def update_user(db: Session, user_id: int, new_email: str):
         raise HTTPException(status_code=404, detail="User not found")
     
     result = db.execute(
-        text("UPDATE users SET email = :email WHERE id = :user_id RETURNING *"),
+        text("UPDATE users SET email = :email, version = version + 1 WHERE id = :user_id RETURNING *"),
         {"email": new_email, "user_id": user_id}
     )
     db.commit()
-    updated_user = result.mappings().first()
+    updated_user = primera(result)
     return updated_user
 
 def deactivate_user(db: Session, user_id: int):
@@ -81,32 +144,49 @@ def deactivate_user(db: Session, user_id: int):
         raise HTTPException(status_code=404, detail="User not found")
     
     db.execute(
-        text("UPDATE users SET es_activo = false WHERE id = :user_id"),
+        text("UPDATE users SET es_activo = false, version = version + 1 WHERE id = :user_id"),
         {"user_id": user_id}
     )
     db.commit()
     return {"ok": True}
 
-def update_item(db: Session, item_id: int, item: ItemCreate):
-    db_item = get_item(db, item_id)
-    if db_item is None:
-        raise HTTPException(status_code=404, detail="Item not found")
-    
+def apply_item_update(db: Session, item_id: int, item: ItemCreate, version: int | None = None):
+    # Sin commit; devuelve (item, None) o, si el UPDATE no afectó ninguna fila, (None, 404)
+    # si el item no existe y (None, 412) si su versión ya no es `version`. La comprobación
+    # va en la misma transacción que el UPDATE: responde a lo que vio el UPDATE, también
+    # dentro de la cola de escrituras en lote.
+    # Con version es concurrencia optimista: una sola sentencia, sin leer antes ni bloquear
     result = db.execute(
         text("""
             UPDATE items 
-            SET nombre = :nombre, descripcion = :descripcion 
-            WHERE id = :item_id 
+            SET nombre = :nombre, descripcion = :descripcion, version = version + 1 
+            WHERE id = :item_id AND (:version IS NULL OR version = :version) 
+            RETURNING *
         """),
         {
             "nombre": item.nombre,
             "descripcion": item.descripcion,
-            "item_id": item_id
+            "item_id": item_id,
+            "version": version
         }
     )
+    updated_item = primera(result)
+    if updated_item is not None:
+        return updated_item, None
+    existe = db.execute(text("SELECT 1 FROM items WHERE id = :item_id"), {"item_id": item_id}).first()
+    return None, 412 if existe else 404
+
+def item_update_failure(status: int) -> HTTPException:
+    if status == 404:
+        return HTTPException(status_code=404, detail="Item not found")
+    return HTTPException(status_code=412, detail="El item fue modificado por otra petición")
+
+def update_item(db: Session, item_id: int, item: ItemCreate, version: int | None = None):
+    updated_item, fallo = apply_item_update(db, item_id, item, version)
+    if fallo is not None:
+        db.rollback()
+        raise item_update_failure(fallo)
     db.commit()
-    result = db.execute(text("SELECT * FROM items WHERE id = :item_id"), {"item_id": item_id})
-    updated_item = result.mappings().first()
     return updated_item
 
 def delete_item(db: Session, item_id: int):
@@ -118,15 +198,170 @@ def delete_item(db: Session, item_id: int):
     db.commit()
     return {"ok": True}
 
-def get_items(db: Session, skip: int = 0, limit: int = 100):
+def get_items(
+    db: Session, skip: int = 0, limit: int = 100, archivados: bool = False,
+    created_after: datetime | None = None, created_before: datetime | None = None
+):
+    # Por defecto solo la tabla principal; items_archive solo si se pide
+    tabla = "items_archive" if archivados else "items"
+    where, orden, params = _filtro_created_at(created_after, created_before)
     result = db.execute(
-        text("SELECT * FROM items ORDER BY id LIMIT :limit OFFSET :skip"),
-        {"skip": skip, "limit": limit}
+        text(f"SELECT * FROM {tabla}{where} ORDER BY {orden} LIMIT :limit OFFSET :skip"),
+        {"skip": skip, "limit": limit, **params}
     )
-    items = result.mappings().all()
+    items = todas(result)
     return items
 
-def get_item(db: Session, item_id: int):
-    result = db.execute(text("SELECT * FROM items WHERE id = :item_id"), {"item_id": item_id})
-    item = result.mappings().first()
-    return item if item else None
\ No newline at end of file
+def get_item(db: Session, item_id: int, archivados: bool = False):
+    tabla = "items_archive" if archivados else "items"
+    result = db.execute(text(f"SELECT * FROM {tabla} WHERE id = :item_id"), {"item_id": item_id})
+    item = primera(result)
+    return item if item else None
+
+def archive_old_items(db: Session, dias: int, limit: int) -> int:
+    """
+    Mueve a items_archive hasta `limit` items creados hace más de `dias` días.
+    Sin commit: cada lote es una transacción corta (ver archivado.py)
+    """
+    ids = db.execute(
+        text("""
+            SELECT id FROM items
+            WHERE created_at < unixepoch('now', '-' || :dias || ' days')
+            ORDER BY id LIMIT :limit
+        """),
+        {"dias": dias, "limit": limit}
+    ).scalars().all()
+    if not ids:
+        return 0
+    # Primero se copia: los triggers de borrado ignoran los ids que ya están archivados
+    # (items.id es AUTOINCREMENT, así que ningún item nuevo puede tener uno de esos ids)
+    db.execute(
+        text("""
+            INSERT INTO items_archive (id, nombre, descripcion, created_at, propietario_id, version)
+            SELECT id, nombre, descripcion, created_at, propietario_id, version FROM items WHERE id IN :ids
+        """).bindparams(bindparam("ids", expanding=True)),
+        {"ids": ids}
+    )
+    db.execute(
+        text("DELETE FROM items WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+        {"ids": ids}
+    )
+    return len(ids)
+
+def get_stats(db: Session, dias: int = 30):
+    # Solo lee las tablas de rollups: nunca hace GROUP BY sobre users o items
+    result = db.execute(
+        text("""
+            SELECT dia, metrica, valor FROM estadisticas_diarias
+            WHERE dia >= date('now', :desde)
+            ORDER BY dia
+        """),
+        {"desde": f"-{dias} days"}
+    )
+    por_dia = {"signups": [], "items": []}
+    for fila in result.mappings():
+        por_dia[fila["metrica"]].append({"dia": fila["dia"], "valor": fila["valor"]})
+    totales = dict(db.execute(text("SELECT metrica, valor FROM estadisticas_totales")).all())
+    return {
+        "signups_por_dia": por_dia["signups"],
+        "items_por_dia": por_dia["items"],
+        "users_activos": totales.get("users_activos", 0),
+        "users_inactivos": totales.get("users_inactivos", 0),
+    }
+
+def claim_idempotency_key(db: Session, clave: str, huella: bytes, ttl: int) -> bool:
+    """
+    Reserva la clave para esta petición. Devuelve False si ya existe y no ha
+    caducado (otra petición la procesó o la está procesando).
+    """
+    result = db.execute(
+        text("""
+            INSERT INTO idempotency_keys (clave, huella, expira)
+            VALUES (:clave, :huella, unixepoch() + :ttl)
+            ON CONFLICT(clave) DO UPDATE SET
+                huella = excluded.huella, status = NULL, content_type = NULL,
+                cuerpo = NULL, expira = excluded.expira
+            WHERE idempotency_keys.expira < unixepoch()
+            RETURNING clave
+        """),
+        {"clave": clave, "huella": huella, "ttl": ttl}
+    )
+    reservada = result.first() is not None
+    db.commit()
+    return reservada
+
+def get_idempotency_key(db: Session, clave: str):
+    result = db.execute(
+        text("SELECT huella, status, content_type, cuerpo FROM idempotency_keys WHERE clave = :clave"),
+        {"clave": clave}
+    )
+    return result.mappings().first()
+
+def save_idempotent_response(db: Session, clave: str, status: int, content_type: str, cuerpo: bytes):
+    db.execute(
+        text("""
+            UPDATE idempotency_keys SET status = :status, content_type = :content_type, cuerpo = :cuerpo
+            WHERE clave = :clave
+        """),
+        {"clave": clave, "status": status, "content_type": content_type, "cuerpo": cuerpo}
+    )
+    db.commit()
+
+def release_idempotency_key(db: Session, clave: str):
+    # La petición falló (5xx): un reintento debe volver a procesarse
+    db.execute(text("DELETE FROM idempotency_keys WHERE clave = :clave"), {"clave": clave})
+    db.commit()
+
+def delete_expired_idempotency_keys(db: Session) -> int:
+    result = db.execute(text("DELETE FROM idempotency_keys WHERE expira < unixepoch()"))
+    db.commit()
+    return result.rowcount
+
+def get_changes_since(db: Session, last_id: int, limit: int = 1000) -> list[dict]:
+    # Avisos de la tabla cambios posteriores a last_id (Last-Event-ID), en orden
+    result = db.execute(
+        text("SELECT id, tabla, operacion, fila_id FROM cambios WHERE id > :last_id ORDER BY id LIMIT :limit"),
+        {"last_id": last_id, "limit": limit}
+    )
+    return [dict(fila) for fila in result.mappings()]
+
+def get_change_bounds(db: Session) -> tuple[int, int]:
+    # (primer id conservado, último id); (0, 0) si todavía no hay cambios
+    primero, ultimo = db.execute(text(
+        # Dos subconsultas: así SQLite resuelve cada una con el índice de la clave primaria
+        "SELECT (SELECT min(id) FROM cambios), (SELECT max(id) FROM cambios)"
+    )).one()
+    return primero or 0, ultimo or 0
+
+# Sentencias que calentamiento.py ejecuta al arrancar en cada conexión del pool:
+# (función, argumentos). Los ids 0 y la clave vacía no existen, así que no
+# encuentran ni cambian nada; solo compilan la sentencia y la dejan preparada.
+# Cada combinación de created_after / created_before es un SQL distinto
+# (ver _filtro_created_at), así que se calientan las tres variantes con filtro
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+CALENTAMIENTO_LECTURAS = [
+    (get_user, {"user_id": 0}),
+    (get_user_by_email, {"email": ""}),
+    (get_users, {"limit": 0}),
+    (get_users, {"limit": 0, "created_after": _EPOCH}),
+    (get_users, {"limit": 0, "created_before": _EPOCH}),
+    (get_users, {"limit": 0, "created_after": _EPOCH, "created_before": _EPOCH}),
+    (get_items, {"limit": 0}),
+    (get_items, {"limit": 0, "created_after": _EPOCH}),
+    (get_items, {"limit": 0, "created_before": _EPOCH}),
+    (get_items, {"limit": 0, "created_after": _EPOCH, "created_before": _EPOCH}),
+    (get_items, {"limit": 0, "archivados": True}),
+    (get_item, {"item_id": 0}),
+    (get_item, {"item_id": 0, "archivados": True}),
+    (get_existing_user_ids, {"user_ids": {0}}),
+    (get_stats, {}),
+    (get_idempotency_key, {"clave": ""}),
+    (get_changes_since, {"last_id": 0, "limit": 0}),
+    (get_change_bounds, {}),
+]
+# Solo en el pool de escritura y siempre con rollback. Los INSERT no están: no
+# hay un parámetro que no inserte nada y sus triggers escribirían en otras tablas
+CALENTAMIENTO_ESCRITURAS = [
+    (apply_item_update, {"item_id": 0, "item": ItemCreate(nombre="")}),
+    (archive_old_items, {"dias": 0, "limit": 0}),
+]
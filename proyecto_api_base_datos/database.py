@@ -1,9 +1,13 @@
 from typing import Annotated
-from fastapi import Depends
-from sqlalchemy import create_engine, text
+from fastapi import Depends, Request
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import Session, sessionmaker
 from dotenv import load_dotenv
 import os
+import time
+
+from admision import esperas_pool, pool_de
 
 
 load_dotenv()
@@ -13,13 +17,74 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL is None:
     raise ValueError("La variable de entorno DATABASE_URL no está configurada.")
 
+# SQL_ECHO=false desactiva el log de cada consulta (útil en benchmarks y producción)
+SQL_ECHO = os.getenv("SQL_ECHO", "true").lower() == "true"
+
+# Durabilidad de SQLite: FULL espera al disco en cada commit, NORMAL es más
+# rápido y solo arriesga el último commit si se va la luz (no si falla el proceso)
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "FULL").upper()
+
+# Tamaño de los pools de escritura y de lectura
+WRITE_POOL_SIZE = int(os.getenv("WRITE_POOL_SIZE", "1"))
+WRITE_MAX_OVERFLOW = int(os.getenv("WRITE_MAX_OVERFLOW", "2"))
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "5"))
+READ_MAX_OVERFLOW = int(os.getenv("READ_MAX_OVERFLOW", "10"))
+
+url = make_url(DATABASE_URL)
+ES_SQLITE = url.get_backend_name() == "sqlite"
+# Una base SQLite en memoria no se puede abrir dos veces: sin separación
+SEPARAR_LECTURAS = not ES_SQLITE or url.database not in (None, "", ":memory:")
+
 #Crea el motor de la base de datos, es como el puente entre python y la base de datos
 #El motor se encarga de gestionar las conexiones y la comunicación con la base de datos
 #El argumento connect_args es específico para SQLite y evita problemas con hilos
-engine = create_engine(DATABASE_URL, echo=True, connect_args={"check_same_thread": False})  # Solo para SQLite
-# engine = create_engine(DATABASE_URL, echo=True)
-#Si usas otra base de datos como PostgreSQL o MySQL, no necesitas el argumento connect_args
-#Por ejemplo, para PostgreSQL sería:
+#
+#Usamos dos motores:
+# - engine: para las funciones de crud que escriben. SQLite solo admite un
+#   escritor a la vez, así que su pool es pequeño (el overflow evita bloquear
+#   el event loop mientras otra petición devuelve su conexión)
+# - read_engine: solo lectura (mode=ro) con varias conexiones para las rutas GET.
+#   Con WAL los lectores no esperan al escritor ni lo bloquean
+if ES_SQLITE and SEPARAR_LECTURAS:
+    engine = create_engine(
+        DATABASE_URL, echo=SQL_ECHO,
+        pool_size=WRITE_POOL_SIZE, max_overflow=WRITE_MAX_OVERFLOW,
+        connect_args={"check_same_thread": False}  # Solo para SQLite
+    )
+    READ_DATABASE_URL = f"sqlite:///file:{os.path.abspath(url.database)}?mode=ro&uri=true"
+    read_engine = create_engine(
+        READ_DATABASE_URL, echo=SQL_ECHO,
+        pool_size=READ_POOL_SIZE, max_overflow=READ_MAX_OVERFLOW,
+        connect_args={"check_same_thread": False}
+    )
+elif ES_SQLITE:
+    engine = create_engine(DATABASE_URL, echo=SQL_ECHO, connect_args={"check_same_thread": False})
+    read_engine = engine
+else:
+    #Si usas otra base de datos como PostgreSQL o MySQL, no necesitas el argumento connect_args
+    #READ_DATABASE_URL permite apuntar las lecturas a una réplica
+    engine = create_engine(DATABASE_URL, echo=SQL_ECHO)
+    read_engine = create_engine(os.getenv("READ_DATABASE_URL", DATABASE_URL), echo=SQL_ECHO)
+
+# Sin pool de lectura propio las dos esperas son la misma (ver admision.py)
+if read_engine is engine:
+    esperas_pool["read"] = esperas_pool["write"]
+
+if ES_SQLITE:
+    @event.listens_for(engine, "connect")
+    def configurar_sqlite(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if SEPARAR_LECTURAS:
+            cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        cursor.close()
+
+    if read_engine is not engine:
+        @event.listens_for(read_engine, "connect")
+        def configurar_sqlite_lectura(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA query_only = ON")
+            cursor.close()
 
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -27,9 +92,56 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+ReadSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=read_engine
+)
+
 # Dependencia para obtener la sesión de la base de datos
-def get_db():
-    with SessionLocal() as session:
-        yield session 
+# La sesión se elige según el método HTTP de la petición
+def get_db(request: Request):
+    pool = pool_de(request.method)
+    session_factory = ReadSessionLocal if pool == "read" else SessionLocal
+    with session_factory() as session:
+        # Se pide la conexión aquí (en el threadpool) para medir cuánto se espera al
+        # pool: el control de admisión deja de aceptar peticiones si la espera crece
+        inicio = time.perf_counter()
+        session.connection()
+        esperas_pool[pool].registrar(time.perf_counter() - inicio)
+        yield session
 
 DatabaseSession = Annotated[Session, Depends(get_db)]
+
+def estado_pools() -> dict:
+    """Conexiones en uso de cada pool (para las métricas)"""
+    pools = {"write": engine.pool, "read": read_engine.pool}
+    estado = {}
+    for nombre, pool in pools.items():
+        if nombre == "read" and read_engine is engine:
+            continue
+        # Solo QueuePool tiene tamaño fijo; SQLite en memoria usa otros pools
+        if hasattr(pool, "checkedout"):
+            estado[nombre] = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "max_overflow": pool._max_overflow,
+            }
+    return estado
+
+def cerrar_motores() -> tuple | None:
+    """
+    Al apagar: cierra las conexiones y, con WAL, pasa el log a la base con
+    wal_checkpoint(TRUNCATE) para que el archivo -wal quede vacío.
+    Devuelve (busy, páginas del log, páginas copiadas) o None sin WAL
+    """
+    # Primero los lectores: un lector con una transacción abierta impediría vaciar el WAL
+    if read_engine is not engine:
+        read_engine.dispose()
+    resultado = None
+    if ES_SQLITE and SEPARAR_LECTURAS:
+        with engine.connect() as conn:
+            resultado = tuple(conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)")).one())
+    engine.dispose()
+    return resultado
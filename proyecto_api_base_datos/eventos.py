@@ -0,0 +1,210 @@
+"""
+Avisos de cambios en tiempo real (Server-Sent Events)
+
+Las interfaces consultaban GET /items/ cada pocos segundos para ver si había
+items nuevos. Con GET /events reciben un aviso por cada alta, modificación o
+baja de users e items y solo piden lo que cambió.
+
+- Los triggers de models.py anotan cada cambio en la tabla cambios, en la misma
+  transacción que la escritura (también las del lote y la importación CSV).
+- Tras cada commit de SessionLocal se despierta al difusor, que lee los cambios
+  nuevos con una sola consulta y los reparte a todos los suscriptores. Cada
+  EVENTS_POLL_INTERVAL segundos vuelve a mirar por si escribió otro proceso.
+- Cada suscriptor tiene un buffer de EVENTS_BUFFER_SIZE avisos. Si un cliente
+  lento lo llena, se cierra su stream: el navegador reconecta solo con la
+  cabecera Last-Event-ID y recibe lo que se perdió desde la tabla.
+- Si el Last-Event-ID ya no está en la tabla (solo se guardan los últimos
+  avisos), se envía un evento "reset": el cliente debe recargar la lista.
+
+Formato de cada aviso:
+    id: 42
+    event: items
+    data: {"tabla": "items", "operacion": "create", "id": 7}
+"""
+
+import asyncio
+import collections
+import json
+import os
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event
+
+import crud
+from database import ReadSessionLocal, SessionLocal
+
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "256"))
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "1.0"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+# Avisos leídos por consulta
+LOTE_CAMBIOS = 1000
+
+
+def _leer(operacion, *args):
+    with ReadSessionLocal() as db:
+        return operacion(db, *args)
+
+
+def formato_sse(cambio: dict) -> str:
+    datos = {"tabla": cambio["tabla"], "operacion": cambio["operacion"], "id": cambio["fila_id"]}
+    return f"id: {cambio['id']}\nevent: {cambio['tabla']}\ndata: {json.dumps(datos)}\n\n"
+
+
+class Suscripcion:
+    """Buffer acotado de un cliente de /events"""
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self.pendientes: collections.deque = collections.deque()
+        self.hay_datos = asyncio.Event()
+        self.cerrada = False
+
+    def publicar(self, cambios: list[dict]) -> bool:
+        if len(self.pendientes) + len(cambios) > self.maximo:
+            return False
+        self.pendientes.extend(cambios)
+        self.hay_datos.set()
+        return True
+
+    def cerrar(self):
+        self.cerrada = True
+        self.hay_datos.set()
+
+
+class Difusor:
+    """Lee la tabla cambios y reparte los avisos nuevos a todas las suscripciones"""
+
+    def __init__(self, buffer: int, intervalo: float):
+        self.buffer = buffer
+        self.intervalo = intervalo
+        self.ultimo_id = 0
+        self.enviados = 0
+        self.cerradas_por_lentitud = 0
+        self._suscripciones: set[Suscripcion] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._despertar: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._despertar = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cierra los streams abiertos (los clientes reconectarán) y detiene la tarea"""
+        for suscripcion in list(self._suscripciones):
+            suscripcion.cerrar()
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def notificar(self):
+        """Despierta al difusor. Se llama tras cada commit, a veces desde el threadpool"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._despertar.set)
+
+    def suscribir(self) -> Suscripcion:
+        suscripcion = Suscripcion(self.buffer)
+        self._suscripciones.add(suscripcion)
+        return suscripcion
+
+    def desuscribir(self, suscripcion: Suscripcion):
+        self._suscripciones.discard(suscripcion)
+
+    async def _run(self):
+        _, self.ultimo_id = await run_in_threadpool(_leer, crud.get_change_bounds)
+        while True:
+            try:
+                await asyncio.wait_for(self._despertar.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._despertar.clear()
+            if not self._suscripciones:
+                # Nadie escucha: solo se avanza el último id (max(id) sobre la clave primaria)
+                _, self.ultimo_id = await run_in_threadpool(_leer, crud.get_change_bounds)
+                continue
+            while True:
+                cambios = await run_in_threadpool(_leer, crud.get_changes_since, self.ultimo_id, LOTE_CAMBIOS)
+                if not cambios:
+                    break
+                self.ultimo_id = cambios[-1]["id"]
+                for suscripcion in list(self._suscripciones):
+                    if suscripcion.publicar(cambios):
+                        self.enviados += len(cambios)
+                    else:
+                        # Cliente lento: se cierra su stream y se reanuda con Last-Event-ID
+                        self.cerradas_por_lentitud += 1
+                        self.desuscribir(suscripcion)
+                        suscripcion.cerrar()
+                if len(cambios) < LOTE_CAMBIOS:
+                    break
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "subscribers": len(self._suscripciones),
+            "last_event_id": self.ultimo_id,
+            "events_sent": self.enviados,
+            "closed_slow_subscribers": self.cerradas_por_lentitud,
+        }
+
+
+difusor = Difusor(EVENTS_BUFFER_SIZE, EVENTS_POLL_INTERVAL)
+
+# Cualquier commit del motor de escritura puede traer cambios nuevos
+event.listen(SessionLocal, "after_commit", lambda session: difusor.notificar())
+
+
+async def stream_eventos(last_event_id: int | None):
+    """Generador para StreamingResponse (text/event-stream)"""
+    await difusor.start()
+    # Primero se suscribe y después lee la tabla: así no se pierde nada entre medias
+    suscripcion = difusor.suscribir()
+    try:
+        primero, ultimo = await run_in_threadpool(_leer, crud.get_change_bounds)
+        yield "retry: 3000\n\n"
+        if last_event_id is None:
+            enviado = ultimo
+        elif primero and last_event_id < primero - 1:
+            # Esos avisos ya se borraron: el cliente debe recargar todo
+            yield f"id: {ultimo}\nevent: reset\ndata: {{}}\n\n"
+            enviado = ultimo
+        else:
+            enviado = last_event_id
+            while True:
+                cambios = await run_in_threadpool(_leer, crud.get_changes_since, enviado, LOTE_CAMBIOS)
+                if not cambios:
+                    break
+                yield "".join(formato_sse(cambio) for cambio in cambios)
+                enviado = cambios[-1]["id"]
+
+        while True:
+            try:
+                await asyncio.wait_for(suscripcion.hay_datos.wait(), EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"  # mantiene viva la conexión a través de proxies
+                continue
+            suscripcion.hay_datos.clear()
+            if suscripcion.cerrada:
+                return
+            nuevos = []
+            while suscripcion.pendientes:
+                cambio = suscripcion.pendientes.popleft()
+                if cambio["id"] > enviado:  # los ya enviados desde la tabla se saltan
+                    nuevos.append(formato_sse(cambio))
+                    enviado = cambio["id"]
+            if nuevos:
+                yield "".join(nuevos)
+    finally:
+        difusor.desuscribir(suscripcion)
@@ -0,0 +1,43 @@
+"""
+Filas compactas para los resultados de crud
+
+result.mappings() crea por cada fila un RowMapping (además de su Row y su
+tupla), y después Pydantic la lee como un diccionario. En una página de
+miles de filas eso es mucha memoria que se descarta enseguida.
+
+Aquí cada forma de consulta (su lista de columnas) tiene una dataclass con
+__slots__, generada la primera vez y reutilizada después: un solo objeto por
+fila, sin __dict__. Es inmutable (frozen), como el RowMapping al que sustituye:
+single-flight comparte la misma fila entre peticiones. Pydantic la lee con
+from_attributes (en el model_config de los schemas; FastAPI valida el
+response_model con validate_python(..., from_attributes=True)) y Jinja2 con
+fila.campo.
+"""
+
+import dataclasses
+import functools
+from itertools import starmap
+from typing import Iterator
+
+from sqlalchemy import Result
+
+
+@functools.cache
+def tipo_fila(columnas: tuple[str, ...]) -> type:
+    """Dataclass inmutable con __slots__ para esas columnas (una por forma de consulta)"""
+    return dataclasses.make_dataclass("Fila", columnas, slots=True, frozen=True)
+
+
+def todas(result: Result) -> list:
+    return list(starmap(tipo_fila(tuple(result.keys())), result))
+
+
+def primera(result: Result):
+    """La primera fila o None"""
+    fila = result.first()
+    return None if fila is None else tipo_fila(fila._fields)(*fila)
+
+
+def iterar(result: Result) -> Iterator:
+    """Para resultados con yield_per: convierte las filas a medida que llegan"""
+    return starmap(tipo_fila(tuple(result.keys())), result)
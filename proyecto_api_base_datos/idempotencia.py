@@ -0,0 +1,220 @@
+"""
+Idempotency-Key para los POST que crean recursos
+
+Las apps móviles reintentan POST /users/ y POST /users/{user_id}/items/ cuando
+vence el timeout, y cada reintento creaba otro item. Si la petición trae la
+cabecera Idempotency-Key, este middleware guarda la respuesta en la tabla
+idempotency_keys y la repite en los reintentos:
+
+- Un reintento con la misma clave recibe la respuesta guardada (con la
+  cabecera Idempotent-Replayed: true) sin validar, insertar ni hacer commit.
+- Los duplicados simultáneos esperan a la primera petición en lugar de
+  competir con ella: en el mismo proceso con un Future, entre procesos
+  consultando la tabla hasta que la respuesta está guardada.
+- La misma clave con otra petición (otro cuerpo o ruta) devuelve 422.
+- Las respuestas 5xx no se guardan: el reintento se vuelve a procesar, también
+  el que estaba esperando en otro proceso a la petición que falló. Lo mismo si
+  la app lanza una excepción o el cliente se desconecta antes de la respuesta.
+- Las claves caducan a los IDEMPOTENCY_TTL_SECONDS; las caducadas se
+  reutilizan y se borran cada IDEMPOTENCY_CLEANUP_EVERY reservas
+  (o con python mantenimiento.py limpiar-idempotencia).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+import crud
+from database import SessionLocal
+from registro import campos
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+IDEMPOTENCY_CLEANUP_EVERY = int(os.getenv("IDEMPOTENCY_CLEANUP_EVERY", "1000"))
+
+# Rutas POST que aceptan Idempotency-Key
+RUTAS_IDEMPOTENTES = re.compile(r"^/users/(\d+/items/)?$")
+MAX_LONGITUD_CLAVE = 255
+
+log = logging.getLogger("app.idempotencia")
+# La otra petición que tenía la clave falló y la liberó
+_LIBERADA = object()
+
+
+def _ejecutar(operacion, *args):
+    with SessionLocal() as db:
+        return operacion(db, *args)
+
+
+class MiddlewareIdempotencia:
+    """Middleware ASGI que guarda y repite respuestas según la cabecera Idempotency-Key"""
+
+    def __init__(self, app):
+        self.app = app
+        # clave -> Future con la respuesta de la petición que la está procesando
+        self._en_curso: dict[str, asyncio.Future] = {}
+        self.reservas = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not RUTAS_IDEMPOTENTES.match(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        clave = dict(scope["headers"]).get(b"idempotency-key")
+        if clave is None:
+            await self.app(scope, receive, send)
+            return
+        clave = clave.decode("latin-1")
+        if not 0 < len(clave) <= MAX_LONGITUD_CLAVE:
+            await _responder(send, 400, _json({"detail": "Idempotency-Key inválida"}))
+            return
+
+        cuerpo = await _leer_cuerpo(receive)
+        huella = hashlib.sha256(
+            b"\n".join([scope["path"].encode(), scope["query_string"], cuerpo])
+        ).digest()[:16]
+
+        while True:
+            futuro = self._en_curso.get(clave)
+            if futuro is not None:
+                # Duplicado simultáneo en este proceso: esperar a la primera petición
+                guardada = await asyncio.shield(futuro)
+                if guardada is None:
+                    continue  # la primera falló: esta se procesa de nuevo
+            else:
+                guardada = await self._procesar(scope, cuerpo, clave, huella, send)
+                if guardada is None:
+                    return  # respuesta ya enviada por la app
+            break
+
+        if guardada["huella"] != huella:
+            await _responder(send, 422, _json({"detail": "Idempotency-Key ya usada con otra petición"}))
+            return
+        await _responder(
+            send, guardada["status"], guardada["cuerpo"],
+            guardada["content_type"] or "application/json", repetida=True
+        )
+
+    async def _procesar(self, scope, cuerpo: bytes, clave: str, huella: bytes, send):
+        """Reserva la clave y ejecuta la petición, o devuelve la respuesta ya guardada"""
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_curso[clave] = futuro
+        reservada = False
+        try:
+            self.reservas += 1
+            if self.reservas % IDEMPOTENCY_CLEANUP_EVERY == 0:
+                await run_in_threadpool(_ejecutar, crud.delete_expired_idempotency_keys)
+            limite = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+            while not await run_in_threadpool(
+                _ejecutar, crud.claim_idempotency_key, clave, huella, IDEMPOTENCY_TTL_SECONDS
+            ):
+                guardada = await self._esperar_otro_proceso(clave, limite)
+                if guardada is _LIBERADA:
+                    continue  # la otra petición falló (5xx) y borró la clave: se reserva de nuevo
+                futuro.set_result(guardada)
+                if guardada is None:
+                    await _responder(
+                        send, 409, _json({"detail": "La petición original sigue en curso"}), reintentar=1
+                    )
+                return guardada
+
+            reservada = True
+            respuesta = await self._ejecutar_app(scope, cuerpo, send)
+            if respuesta["status"] >= 500:
+                await run_in_threadpool(_ejecutar, crud.release_idempotency_key, clave)
+                reservada = False
+                futuro.set_result(None)
+            else:
+                await run_in_threadpool(
+                    _ejecutar, crud.save_idempotent_response,
+                    clave, respuesta["status"], respuesta["content_type"], respuesta["cuerpo"]
+                )
+                reservada = False
+                futuro.set_result({**respuesta, "huella": huella})
+            return None
+        except BaseException:
+            if reservada:
+                # La app lanzó una excepción o el cliente se desconectó: como con un 5xx, se
+                # libera la clave para que el reintento se procese y no reciba 409 hasta que
+                # caduque. shield: el borrado termina aunque cancelen esta petición
+                try:
+                    await asyncio.shield(run_in_threadpool(_ejecutar, crud.release_idempotency_key, clave))
+                except Exception:
+                    log.warning("idempotencia_clave_no_liberada", exc_info=True, extra=campos(clave=clave))
+            if not futuro.done():
+                futuro.set_result(None)
+            raise
+        finally:
+            self._en_curso.pop(clave, None)
+
+    async def _esperar_otro_proceso(self, clave: str, limite: float):
+        """
+        Otro worker tiene la clave: se consulta la tabla hasta que guarde la
+        respuesta. Devuelve _LIBERADA si la borró sin guardar nada (respondió
+        5xx) y None si vence el plazo.
+        """
+        while True:
+            guardada = await run_in_threadpool(_ejecutar, crud.get_idempotency_key, clave)
+            if guardada is None:
+                return _LIBERADA
+            if guardada["status"] is not None:
+                return guardada
+            if time.monotonic() > limite:
+                return None
+            await asyncio.sleep(0.05)
+
+    async def _ejecutar_app(self, scope, cuerpo: bytes, send) -> dict:
+        """Pasa la petición a la app y copia la respuesta mientras se envía"""
+        respuesta = {"status": 500, "content_type": None, "cuerpo": b""}
+        partes = []
+        enviado = False
+
+        async def receive():
+            nonlocal enviado
+            if enviado:
+                return {"type": "http.disconnect"}
+            enviado = True
+            return {"type": "http.request", "body": cuerpo, "more_body": False}
+
+        async def send_copia(mensaje):
+            if mensaje["type"] == "http.response.start":
+                respuesta["status"] = mensaje["status"]
+                cabeceras = dict(mensaje.get("headers", []))
+                if b"content-type" in cabeceras:
+                    respuesta["content_type"] = cabeceras[b"content-type"].decode("latin-1")
+            elif mensaje["type"] == "http.response.body":
+                partes.append(mensaje.get("body", b""))
+            await send(mensaje)
+
+        await self.app(scope, receive, send_copia)
+        respuesta["cuerpo"] = b"".join(partes)
+        return respuesta
+
+
+async def _leer_cuerpo(receive) -> bytes:
+    partes = []
+    while True:
+        mensaje = await receive()
+        partes.append(mensaje.get("body", b""))
+        if not mensaje.get("more_body"):
+            return b"".join(partes)
+
+
+def _json(datos: dict) -> bytes:
+    return json.dumps(datos, ensure_ascii=False).encode()
+
+
+async def _responder(send, status: int, cuerpo: bytes, content_type: str = "application/json",
+                     repetida: bool = False, reintentar: int | None = None):
+    cabeceras = [(b"content-type", content_type.encode()), (b"content-length", str(len(cuerpo)).encode())]
+    if repetida:
+        cabeceras.append((b"idempotent-replayed", b"true"))
+    if reintentar is not None:
+        cabeceras.append((b"retry-after", str(reintentar).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": cabeceras})
+    await send({"type": "http.response.body", "body": cuerpo})
@@ -0,0 +1,138 @@
+"""
+Importación de items desde un CSV
+
+Los catálogos llegan como archivos CSV de cientos de miles de filas con la
+cabecera nombre,descripcion,propietario_id. Para no cargarlos en memoria:
+
+- El archivo subido ya está en un archivo temporal (multipart) y se lee fila a fila.
+- Las filas se procesan en lotes de IMPORT_BATCH_SIZE:
+  1. Se validan juntas con schemas.ItemImport (las reglas de ItemCreate + propietario_id)
+  2. Se comprueban los propietarios con una sola consulta por lote
+  3. Se insertan en una transacción por lote (un commit por lote, no por fila)
+- El informe se envía en streaming (NDJSON) mientras avanza la importación:
+  una línea {"linea": n, "errores": {...}} por cada fila rechazada y una
+  última línea {"total", "importados", "rechazados", "completo"}.
+- Si el archivo deja de poderse leer a mitad (bytes que no son UTF-8, una fila
+  que el módulo csv no entiende), la respuesta ya empezó con un 200: el error
+  se envía como una línea más {"linea": n, "errores": {"archivo": ...}}. Las
+  filas anteriores a la línea n quedan importadas, desde ella no se importa
+  nada y el resumen lleva "completo": false.
+
+Los lotes ya guardados no se deshacen si una fila posterior falla: cada fila
+válida se importa y cada fila inválida aparece en el informe.
+"""
+
+import csv
+import io
+import json
+import os
+from typing import IO, Iterator
+
+from pydantic import TypeAdapter, ValidationError
+
+import crud
+from schemas import ItemImport
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+
+# Columnas obligatorias de la cabecera (descripcion es opcional)
+COLUMNAS_REQUERIDAS = {"nombre", "propietario_id"}
+
+# Se construye una vez: validar la lista de un lote es más rápido que fila a fila
+validador_filas = TypeAdapter(list[ItemImport])
+
+
+class CabeceraInvalida(ValueError):
+    """El CSV no tiene las columnas necesarias"""
+
+
+def abrir_csv(archivo: IO[bytes]) -> csv.DictReader:
+    """
+    Envuelve el archivo binario subido en un lector CSV incremental.
+    utf-8-sig descarta el BOM que añaden algunas hojas de cálculo.
+    """
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+    lector = csv.DictReader(texto)
+    faltan = COLUMNAS_REQUERIDAS - set(lector.fieldnames or ())
+    if faltan:
+        texto.detach()
+        raise CabeceraInvalida(f"Faltan columnas en la cabecera: {', '.join(sorted(faltan))}")
+    return lector
+
+
+def _errores_por_fila(e: ValidationError) -> dict[int, dict[str, str]]:
+    # Al validar una lista, loc es (indice, campo)
+    errores: dict[int, dict[str, str]] = {}
+    for error in e.errors():
+        loc = error["loc"]
+        campo = str(loc[1]) if len(loc) > 1 else "fila"
+        errores.setdefault(loc[0], {})[campo] = error["msg"]
+    return errores
+
+
+def _procesar_lote(db, filas: list[dict], lineas: list[int]) -> tuple[list[str], int]:
+    """Valida, comprueba propietarios e inserta un lote. Devuelve (informe, importados)"""
+    errores: dict[int, dict[str, str]] = {}
+    try:
+        items = validador_filas.validate_python(filas)
+        indices = list(range(len(filas)))
+    except ValidationError as e:
+        errores = _errores_por_fila(e)
+        indices = [i for i in range(len(filas)) if i not in errores]
+        items = validador_filas.validate_python([filas[i] for i in indices])
+
+    existentes = crud.get_existing_user_ids(db, {item.propietario_id for item in items})
+    validos = []
+    for indice, item in zip(indices, items):
+        if item.propietario_id in existentes:
+            validos.append(item.model_dump())
+        else:
+            errores[indice] = {"propietario_id": f"No existe el usuario {item.propietario_id}"}
+
+    if validos:
+        crud.insert_items(db, validos)
+        db.commit()
+
+    informe = [
+        json.dumps({"linea": lineas[indice], "errores": campos}, ensure_ascii=False) + "\n"
+        for indice, campos in sorted(errores.items())
+    ]
+    return informe, len(validos)
+
+
+def _leer_filas(lector: csv.DictReader, error: list) -> Iterator[dict]:
+    """Filas del CSV; si el archivo no se puede seguir leyendo, deja el error en `error` y termina"""
+    try:
+        for fila in lector:
+            # Una descripción vacía significa "sin descripción"
+            if not fila.get("descripcion"):
+                fila["descripcion"] = None
+            yield fila
+    except (UnicodeDecodeError, csv.Error) as e:
+        error.append({"linea": lector.line_num + 1, "errores": {"archivo": f"No se pudo leer el CSV: {e}"}})
+
+
+def importar_items(db, lector: csv.DictReader, batch_size: int = IMPORT_BATCH_SIZE) -> Iterator[str]:
+    """Generador para StreamingResponse: procesa el CSV por lotes y devuelve NDJSON"""
+    total = importados = 0
+    filas: list[dict] = []
+    lineas: list[int] = []
+    error: list[dict] = []
+    for fila in _leer_filas(lector, error):
+        filas.append(fila)
+        lineas.append(lector.line_num)
+        if len(filas) == batch_size:
+            informe, n = _procesar_lote(db, filas, lineas)
+            yield "".join(informe)
+            total += len(filas)
+            importados += n
+            filas, lineas = [], []
+    if filas:
+        informe, n = _procesar_lote(db, filas, lineas)
+        yield "".join(informe)
+        total += len(filas)
+        importados += n
+    if error:
+        yield json.dumps(error[0], ensure_ascii=False) + "\n"
+    resumen = {"total": total, "importados": importados, "rechazados": total - importados, "completo": not error}
+    yield json.dumps(resumen, ensure_ascii=False) + "\n"
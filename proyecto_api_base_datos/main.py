@@ -1,14 +1,47 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 
+from admision import MiddlewareAdmision
+from apagado import apagar
+from batch_writes import WRITE_BATCH_ENABLED, write_batcher
+from calentamiento import calentamiento
+from eventos import difusor
+from idempotencia import MiddlewareIdempotencia
 from models import crear_tablas
+from registro import configurar_logging
 from users import router as users
 
+# Logs en JSON escritos desde un hilo aparte (ver registro.py)
+configurar_logging()
 crear_tablas()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Abre las conexiones y prepara las sentencias de crud antes de aceptar peticiones
+    await run_in_threadpool(calentamiento.calentar)
+    # La cola de escrituras en lote solo se inicia si está habilitada
+    if WRITE_BATCH_ENABLED:
+        await write_batcher.start()
+    await difusor.start()
+    yield
+    # Apagado ordenado (ver apagado.py): espera a las peticiones en curso, guarda
+    # el lote pendiente, cierra los streams de /events y vacía el WAL
+    await apagar(write_batcher.stop, difusor.stop)
+
+
 app = FastAPI(title="Ejemplo API con FastAPI y SQLAlchemy", 
               version="0.1.0", 
-              description="Un ejemplo simple de una API con FastAPI y SQLAlchemy para mostrar conexión a base de datos y operaciones CRUD"
+              description="Un ejemplo simple de una API con FastAPI y SQLAlchemy para mostrar conexión a base de datos y operaciones CRUD",
+              lifespan=lifespan
               )
 
 
+# Repite la respuesta guardada si un POST se reintenta con la misma Idempotency-Key
+app.add_middleware(MiddlewareIdempotencia)
+# Rechaza peticiones con 503/429 antes de tocar la base de datos si hay sobrecarga
+# (el último middleware agregado es el primero en recibir la petición)
+app.add_middleware(MiddlewareAdmision)
 app.include_router(users)
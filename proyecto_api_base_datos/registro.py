@@ -0,0 +1,160 @@
+"""
+Logging estructurado sin bloquear el event loop
+
+Antes las rutas hacían print(): una escritura síncrona en stdout dentro del
+event loop (si stdout va a una tubería lenta, todas las peticiones esperan) y
+con datos sensibles (user.model_dump() incluía la contraseña).
+
+- Los eventos se registran con logging y campos: log.info("usuario_creado", extra=campos(user_id=1))
+- Un QueueHandler solo mete el registro en una cola; un QueueListener lo
+  formatea como JSON (una línea por evento) y lo escribe en un hilo aparte.
+- Antes de encolar se ocultan los campos sensibles (password, tokens...) y se
+  enmascaran los emails, así los secretos nunca llegan a la cola ni a la salida.
+- Los eventos DEBUG se muestrean: se escribe 1 de cada LOG_DEBUG_SAMPLE_EVERY
+  por tipo de evento (el primero siempre).
+
+Configuración: LOG_LEVEL (INFO por defecto), LOG_DEBUG_SAMPLE_EVERY (100).
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_DEBUG_SAMPLE_EVERY = int(os.getenv("LOG_DEBUG_SAMPLE_EVERY", "100"))
+
+# Claves cuyo valor nunca se escribe
+CAMPOS_SENSIBLES = {"password", "hashed_password", "token", "authorization", "cookie", "secret"}
+OCULTO = "[REDACTED]"
+# Mensajes DEBUG distintos que recuerda el muestreo antes de empezar de cero
+MAX_EVENTOS_MUESTREO = 1000
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def campos(**valores) -> dict:
+    """Campos estructurados de un evento: log.info("evento", extra=campos(clave=valor))"""
+    return {"campos": valores}
+
+
+def enmascarar_email(email: str) -> str:
+    usuario, arroba, dominio = email.partition("@")
+    if not arroba:
+        return OCULTO
+    return f"{usuario[:1]}***@{dominio}"
+
+
+def redactar(valor, clave: str = ""):
+    """Copia del valor con los campos sensibles ocultos (recorre dicts y listas)"""
+    if clave.lower() in CAMPOS_SENSIBLES:
+        return OCULTO
+    if isinstance(valor, dict):
+        return {k: redactar(v, str(k)) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [redactar(v, clave) for v in valor]
+    if isinstance(valor, str) and "email" in clave.lower():
+        return enmascarar_email(valor)
+    return valor
+
+
+class FiltroRedaccion(logging.Filter):
+    """Oculta los campos sensibles antes de que el registro entre en la cola"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if hasattr(record, "campos"):
+            record.campos = redactar(record.campos)
+        return True
+
+
+class FiltroMuestreo(logging.Filter):
+    """Deja pasar 1 de cada `cada` eventos DEBUG con el mismo mensaje"""
+
+    def __init__(self, cada: int):
+        super().__init__()
+        self.cada = max(1, cada)
+        self.vistos: dict[str, int] = {}
+        # filter() se ejecuta en el hilo que registra (event loop o threadpool)
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        with self.lock:
+            n = self.vistos.get(record.msg, 0)
+            if not n and len(self.vistos) >= MAX_EVENTOS_MUESTREO:
+                # Mensajes con datos variables no deben hacer crecer el dict sin fin
+                self.vistos.clear()
+            self.vistos[record.msg] = n + 1
+        if n % self.cada:
+            return False
+        record.muestreo = self.cada
+        return True
+
+
+class FormateadorJSON(logging.Formatter):
+    """Una línea JSON por evento; se ejecuta en el hilo del QueueListener"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        evento = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "nivel": record.levelname,
+            "logger": record.name,
+            "evento": record.getMessage(),
+            **getattr(record, "campos", {}),
+        }
+        if hasattr(record, "muestreo"):
+            evento["muestreo"] = record.muestreo
+        if record.exc_text:
+            evento["error"] = record.exc_text
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # El QueueHandler de la biblioteca formatea el mensaje antes de encolarlo;
+    # aquí solo se resuelve la traza de la excepción (no se puede enviar a otro hilo)
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configurar_logging(salida=None, nivel: str = LOG_LEVEL, muestreo: int = LOG_DEBUG_SAMPLE_EVERY):
+    """
+    Configura el logger "app" (y sus hijos) con la cola y el hilo de escritura.
+    Se puede llamar otra vez (por ejemplo en los benchmarks) para cambiar la salida.
+    """
+    global _listener
+    detener_logging()
+    cola: queue.SimpleQueue = queue.SimpleQueue()
+    handler = _QueueHandler(cola)
+    handler.addFilter(FiltroMuestreo(muestreo))
+    handler.addFilter(FiltroRedaccion())
+
+    escritor = logging.StreamHandler(salida or sys.stderr)
+    escritor.setFormatter(FormateadorJSON())
+    _listener = logging.handlers.QueueListener(cola, escritor, respect_handler_level=True)
+    _listener.start()
+
+    logger = logging.getLogger("app")
+    logger.handlers[:] = [handler]
+    logger.setLevel(nivel)
+    logger.propagate = False
+    return logger
+
+
+def detener_logging():
+    """Escribe lo que quede en la cola y detiene el hilo"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(detener_logging)
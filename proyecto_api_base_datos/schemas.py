@@ -1,7 +1,54 @@
 
-from pydantic import BaseModel, EmailStr, field_validator
+from typing import Annotated
+from pydantic import BaseModel, ConfigDict, EmailStr, StringConstraints
+from pydantic_core import core_schema
 
-from datetime import datetime
+from datetime import date, datetime
+
+
+class MensajeError:
+    """
+    Restricción que comprueba pydantic-core (sin llamar a Python) con nuestro mensaje.
+
+    password: Annotated[str, MensajeError('password_corta', 'Mínimo 8', min_length=8)]
+    produce el mismo 'msg' que un @field_validator con raise ValueError('Mínimo 8'),
+    pero con un 'type' propio. Los errores de tipo siguen siendo los de Pydantic.
+    """
+
+    # Restricción de pydantic-core -> palabra clave de JSON Schema
+    JSON_SCHEMA = {
+        "string": {"min_length": "minLength", "max_length": "maxLength", "pattern": "pattern"},
+        "integer": {"ge": "minimum", "le": "maximum", "gt": "exclusiveMinimum", "lt": "exclusiveMaximum"},
+        "array": {"min_length": "minItems", "max_length": "maxItems"},
+    }
+
+    def __init__(self, tipo: str, mensaje: str, **restricciones):
+        self.tipo = tipo
+        self.mensaje = mensaje
+        self.restricciones = restricciones
+
+    def __get_pydantic_core_schema__(self, source, handler):
+        esquema = handler(source)
+        pasos = esquema["steps"] if esquema["type"] == "chain" else [esquema]
+        restringido = {"type": pasos[0]["type"], **self.restricciones}
+        return core_schema.chain_schema([
+            *pasos,
+            core_schema.custom_error_schema(
+                restringido,
+                custom_error_type=self.tipo,
+                custom_error_message=f"Value error, {self.mensaje}",
+            ),
+        ])
+
+    def __get_pydantic_json_schema__(self, esquema, handler):
+        json_schema = handler(esquema)
+        claves = self.JSON_SCHEMA.get(json_schema.get("type"), {})
+        for nombre, valor in self.restricciones.items():
+            if nombre in claves:
+                json_schema[claves[nombre]] = valor
+                # Mensaje por palabra clave (convención "errorMessage" de ajv-errors)
+                json_schema.setdefault("errorMessage", {})[claves[nombre]] = f"Value error, {self.mensaje}"
+        return json_schema
 
 
 
@@ -12,31 +59,46 @@ class ItemBase(BaseModel):
 class ItemCreate(ItemBase):
     pass
 
+class ItemImport(ItemCreate):
+    # Una fila del CSV de importación: el item y su propietario
+    propietario_id: int
+
 class Item(ItemBase):
     id: int
     propietario_id: int
+    version: int = 1
 
-    class Config:
-        orm_mode = True #Para que Pydantic pueda trabajar con objetos ORM de SQLAlchemy  
+    # Para que Pydantic pueda leer objetos con atributos (ORM, filas de crud)
+    model_config = ConfigDict(from_attributes=True)
 
 
 class UserBase(BaseModel):
-    email: EmailStr
+    # En minúsculas: Ana@x.com y ana@x.com son la misma cuenta
+    email: Annotated[EmailStr, StringConstraints(to_lower=True)]
 
 class UserCreate(UserBase):
-    password: str
-
-    @field_validator('password')
-    def password_length(cls, value):
-        if len(value) < 8:
-            raise ValueError('La contraseña debe tener al menos 8 caracteres.')
-        return value
+    password: Annotated[str, MensajeError(
+        'password_corta', 'La contraseña debe tener al menos 8 caracteres.', min_length=8
+    )]
     
 class User(UserBase):
     id: int
     es_activo: bool
     created_at: datetime
+    item_count: int = 0
+    version: int = 1
     items: list[Item] = []
 
-    class Config:
-        orm_mode = True  #Para que Pydantic pueda trabajar con objetos ORM de SQLAlchemy
\ No newline at end of file
+    # Para que Pydantic pueda leer objetos con atributos (ORM, filas de crud)
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ConteoDiario(BaseModel):
+    dia: date
+    valor: int
+
+class Stats(BaseModel):
+    signups_por_dia: list[ConteoDiario]
+    items_por_dia: list[ConteoDiario]
+    users_activos: int
+    users_inactivos: int
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""
+Lecturas compartidas (single-flight)
+
+En un pico de tráfico muchos clientes piden a la vez lo mismo, por ejemplo
+GET /users/1 o GET /items/?skip=0&limit=100, y cada petición lanzaba su propia
+consulta. Con esta capa la primera petición ejecuta la consulta y las que
+llegan mientras sigue en curso esperan ese mismo resultado.
+
+- La clave es la función de crud y sus argumentos (sin la sesión).
+- La consulta se ejecuta en el threadpool con su propia sesión de lectura,
+  así no bloquea el event loop ni depende de la sesión de una petición.
+- Si el cliente que la lanzó se desconecta, la consulta sigue para los demás.
+- No es una caché: en cuanto termina, la siguiente petición vuelve a consultar.
+
+Los resultados se comparten entre peticiones, así que solo sirve para funciones
+que devuelven filas inmutables (las dataclasses frozen de filas.py), como
+get_user o get_items.
+"""
+
+import asyncio
+import os
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+from admision import esperas_pool
+from database import ReadSessionLocal
+
+READ_COALESCING_ENABLED = os.getenv("READ_COALESCING_ENABLED", "true").lower() == "true"
+
+
+class SingleFlight:
+    """Agrupa las llamadas idénticas y simultáneas a una función de lectura de crud"""
+
+    def __init__(self, session_factory, enabled: bool = True, pool: str = "read"):
+        self.session_factory = session_factory
+        # Pool de session_factory: su espera alimenta el control de admisión
+        self.pool = pool
+        self.enabled = enabled
+        self._in_flight: dict[tuple, asyncio.Task] = {}
+        self.executions = 0
+        self.shared = 0
+
+    async def run(self, fn, **kwargs):
+        """Equivale a fn(db, **kwargs) con una sesión nueva"""
+        if not self.enabled:
+            self.executions += 1
+            return await run_in_threadpool(self._execute, fn, kwargs)
+
+        key = (fn, tuple(sorted(kwargs.items())))
+        task = self._in_flight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.create_task(run_in_threadpool(self._execute, fn, kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.shared += 1
+        # shield: cancelar una petición no cancela la consulta de las demás
+        return await asyncio.shield(task)
+
+    def _execute(self, fn, kwargs: dict):
+        with self.session_factory() as db:
+            # Igual que get_db: la espera al pool alimenta el control de admisión
+            inicio = time.perf_counter()
+            db.connection()
+            esperas_pool[self.pool].registrar(time.perf_counter() - inicio)
+            return fn(db, **kwargs)
+
+    def stats(self) -> dict:
+        total = self.executions + self.shared
+        return {
+            "enabled": self.enabled,
+            "executions": self.executions,
+            "shared": self.shared,
+            "shared_ratio": round(self.shared / total, 3) if total else 0.0,
+            "in_flight": len(self._in_flight),
+        }
+
+
+single_flight = SingleFlight(ReadSessionLocal, READ_COALESCING_ENABLED, pool="read")
@@ -1,44 +1,59 @@
+import logging
+from datetime import datetime
 from typing import Annotated
 
 from pydantic import ValidationError
 
-from fastapi import APIRouter, Request, Form, HTTPException
+from fastapi import APIRouter, Request, Form, Header, HTTPException, Response, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 import crud, schemas
-from models import crear_tablas
-from database import DatabaseSession
+from database import DatabaseSession, estado_pools
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles 
 
 from schemas import UserCreate
+from admision import control_admision
+from batch_writes import write_batcher
+from single_flight import single_flight
+import importacion
+from eventos import difusor, stream_eventos
+from calentamiento import calentamiento
+from salud import disponibilidad
+from registro import campos
 
 
-# Crear las tablas en la base de datos al iniciar la aplicación
-# Si las tablas ya existen, no se vuelven a crear
-crear_tablas()
-
 router = APIRouter()
 
+log = logging.getLogger("app.users")
+
 templates = Jinja2Templates(directory="templates")
 
 
 
 @router.post("/users/", response_model=schemas.User)
 async def create_user(user: schemas.UserCreate, db: DatabaseSession): 
-    print(user.model_dump())  
-    db_user = crud.get_user_by_email(db, email=user.email)
-    if db_user:
+    # Solo el email: la contraseña no entra en el registro, ni siquiera para ocultarla.
+    # Sin DEBUG activo no se construye nada
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("registro_recibido", extra=campos(email=user.email))
+    db_user = crud.create_user(db=db, user=user)
+    if db_user is None:
         raise HTTPException(status_code=400, detail="El email ya está registrado")
-    return crud.create_user(db=db, user=user)
+    return db_user
 
 @router.get("/users/", response_model=list[schemas.User])
-async def read_users(db: DatabaseSession, skip: int = 0, limit: int = 100):
-    users = crud.get_users(db, skip=skip, limit=limit)
+async def read_users(
+    skip: int = 0, limit: int = 100, created_after: datetime | None = None, created_before: datetime | None = None
+):
+    users = await single_flight.run(
+        crud.get_users, skip=skip, limit=limit, created_after=created_after, created_before=created_before
+    )
     return users
 
 @router.get("/users/{user_id}", response_model=schemas.User)
-async def read_user(user_id: int, db: DatabaseSession):
-    db_user = crud.get_user(db, user_id=user_id)
+async def read_user(user_id: int):
+    db_user = await single_flight.run(crud.get_user, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
@@ -50,18 +65,119 @@ async def create_item_for_user(
     db_user = crud.get_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
+    if write_batcher.running:
+        # Devolvemos la conexión al pool mientras esperamos a que se guarde el lote
+        db.close()
+        return await write_batcher.submit(crud.insert_user_item, item, user_id)
     return crud.create_user_item(db=db, item=item, user_id=user_id)
 
 @router.get("/items/", response_model=list[schemas.Item])
-async def read_items(db: DatabaseSession, skip: int = 0, limit: int = 100):
-    return crud.get_items(db, skip=skip, limit=limit)
+async def read_items(
+    skip: int = 0, limit: int = 100, archivados: bool = False,
+    created_after: datetime | None = None, created_before: datetime | None = None
+):
+    # created_after / created_before: rango [desde, hasta) ordenado por fecha de creación
+    return await single_flight.run(
+        crud.get_items, skip=skip, limit=limit, archivados=archivados,
+        created_after=created_after, created_before=created_before
+    )
+
+@router.post("/items/import")
+async def import_items(archivo: UploadFile, db: DatabaseSession):
+    # El CSV se lee por lotes mientras se envía el informe (NDJSON). La sesión de
+    # la dependencia sigue abierta hasta que termina el stream
+    try:
+        lector = importacion.abrir_csv(archivo.file)
+    except (importacion.CabeceraInvalida, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(importacion.importar_items(db, lector), media_type="application/x-ndjson")
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+def version_de_if_match(if_match: str | None) -> int | None:
+    # None = actualizar sin condición (sin If-Match o con If-Match: *)
+    if if_match is None or if_match.strip() == "*":
+        return None
+    valor = if_match.strip()
+    if len(valor) > 2 and valor[0] == valor[-1] == '"' and valor[1:-1].isdigit():
+        return int(valor[1:-1])
+    # Un ETag que no es nuestro nunca coincide: 412
+    return 0
+
+@router.get("/items/{item_id}", response_model=schemas.Item)
+async def read_item(
+    item_id: int, response: Response, archivados: bool = False,
+    if_none_match: Annotated[str | None, Header()] = None
+):
+    db_item = await single_flight.run(crud.get_item, item_id=item_id, archivados=archivados)
+    if db_item is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    if if_none_match == etag(db_item.version):
+        return Response(status_code=304, headers={"ETag": etag(db_item.version)})
+    response.headers["ETag"] = etag(db_item.version)
+    return db_item
 
 @router.put("/items/{item_id}", response_model=schemas.Item)
-async def update_item(item_id: int, item: schemas.ItemCreate, db: DatabaseSession):
-    db_item = crud.get_item(db, item_id=item_id)
-    if db_item is None:
-            raise HTTPException(status_code=404, detail="Item not found")
-    return crud.update_item(db=db, item_id=item_id, item=item)  
+async def update_item(
+    item_id: int, item: schemas.ItemCreate, db: DatabaseSession, response: Response,
+    if_match: Annotated[str | None, Header()] = None
+):
+    # Con If-Match el UPDATE solo se aplica si la versión no cambió (si no, 412)
+    version = version_de_if_match(if_match)
+    if write_batcher.running:
+        # Devolvemos la conexión al pool mientras esperamos a que se guarde el lote
+        db.close()
+        updated_item, fallo = await write_batcher.submit(crud.apply_item_update, item_id, item, version)
+        if fallo is not None:
+            raise crud.item_update_failure(fallo)
+    else:
+        updated_item = crud.update_item(db=db, item_id=item_id, item=item, version=version)
+    response.headers["ETag"] = etag(updated_item.version)
+    return updated_item
+
+@router.get("/events")
+async def events(last_event_id: Annotated[int | None, Header()] = None):
+    # El navegador reenvía Last-Event-ID al reconectar y recibe lo que se perdió
+    return StreamingResponse(
+        stream_eventos(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/stats", response_model=schemas.Stats)
+async def read_stats(db: DatabaseSession, dias: int = 30):
+    return crud.get_stats(db, dias=dias)
+
+@router.get("/healthz")
+async def healthz():
+    # Liveness: sin base de datos
+    return {"status": "ok"}
+
+@router.get("/readyz")
+async def readyz():
+    status, cuerpo = await disponibilidad()
+    return JSONResponse(cuerpo, status_code=status)
+
+@router.get("/metrics/write-batch")
+async def write_batch_metrics():
+    return write_batcher.stats()
+
+@router.get("/metrics/single-flight")
+async def single_flight_metrics():
+    return single_flight.stats()
+
+@router.get("/metrics/events")
+async def events_metrics():
+    return difusor.stats()
+
+@router.get("/metrics/warmup")
+async def warmup_metrics():
+    return calentamiento.stats()
+
+@router.get("/metrics/admission")
+async def admission_metrics():
+    return {**control_admision.stats(), "pools": estado_pools()}
 
 @router.delete("/items/{item_id}")
 async def delete_item(item_id: int, db: DatabaseSession):
@@ -0,0 +1,165 @@
+"""
+Benchmarks de la aplicación web
+
+Usa una base de datos SQLite temporal y el TestClient de FastAPI, así que no
+hace falta tener el servidor corriendo.
+
+Uso:
+    python benchmark.py              # ejecuta todos los benchmarks
+    python benchmark.py plantillas   # solo uno
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# La configuración se lee al importar database.py: hay que fijarla antes
+_tmpdir = tempfile.mkdtemp(prefix="bench_web_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+os.environ["SQL_ECHO"] = "false"
+# Los benchmarks solo muestran sus resultados (los eventos INFO irían a stderr)
+os.environ["LOG_LEVEL"] = "WARNING"
+os.environ.setdefault("JINJA_CACHE_DIR", os.path.join(_tmpdir, "jinja_cache"))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+import main as app_main
+from database import engine
+from main import app
+from plantillas import fragment_cache, estadisticas_cache
+
+client = TestClient(app)
+
+
+def poblar(num_users: int, items_por_usuario: int = 0):
+    """Inserta datos de prueba directamente con SQL"""
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM items"))
+        conn.execute(text("DELETE FROM users"))
+        conn.execute(
+            text("INSERT INTO users (email, hashed_password, es_activo) VALUES (:email, 'x', true)"),
+            [{"email": f"user{i}@bench.com"} for i in range(num_users)]
+        )
+        if items_por_usuario:
+            ids = [row[0] for row in conn.execute(text("SELECT id FROM users"))]
+            conn.execute(
+                text("INSERT INTO items (nombre, descripcion, propietario_id) VALUES (:nombre, 'bench', :pid)"),
+                [{"nombre": f"item{n}", "pid": uid} for uid in ids for n in range(items_por_usuario)]
+            )
+
+
+def medir(funcion, repeticiones: int):
+    """Devuelve los tiempos de cada repetición en milisegundos"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+
+def reportar(nombre: str, tiempos: list[float]):
+    tiempos = sorted(tiempos)
+    p95 = tiempos[int(len(tiempos) * 0.95) - 1]
+    print(f"  {nombre:<40} media {statistics.mean(tiempos):8.2f} ms   p95 {p95:8.2f} ms")
+
+
+def bench_plantillas(repeticiones: int = 50):
+    """Render de /users con y sin la caché de fragmentos"""
+    print("📄 Render de plantillas (GET /users, 100 filas)")
+    poblar(100)
+
+    def sin_cache():
+        fragment_cache.clear()
+        client.get("/users")
+
+    reportar("sin caché de fragmentos", medir(sin_cache, repeticiones))
+    fragment_cache.clear()
+    reportar("con caché de fragmentos", medir(lambda: client.get("/users"), repeticiones))
+    print(f"  métricas: {estadisticas_cache()}")
+
+    # Con el fragmento sin filtro ya en caché, un rango vacío no puede reutilizarlo
+    futuro = "2999-01-01T00:00:00Z"
+    for params, esperado in (({"created_after": futuro}, False), ({"created_before": futuro}, True)):
+        assert ("user0@bench.com" in client.get("/users", params=params).text) is esperado, params
+    print("  ✅ created_after / created_before forman parte de la clave de la caché")
+
+
+async def _ttfb(path: str, query: str):
+    """
+    Llama a la app ASGI directamente (TestClient acumula todo el cuerpo) y
+    devuelve (ms hasta el primer byte, ms totales, bytes)
+    """
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": query.encode(), "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    inicio = time.perf_counter()
+    primer_byte = None
+    total_bytes = 0
+
+    peticion_enviada = False
+    desconexion = asyncio.Event()
+
+    async def receive():
+        nonlocal peticion_enviada
+        if not peticion_enviada:
+            peticion_enviada = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # StreamingResponse espera un posible http.disconnect mientras envía
+        await desconexion.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal primer_byte, total_bytes
+        if message["type"] == "http.response.body" and message.get("body"):
+            if primer_byte is None:
+                primer_byte = time.perf_counter()
+            total_bytes += len(message["body"])
+
+    await app(scope, receive, send)
+    fin = time.perf_counter()
+    return (primer_byte - inicio) * 1000, (fin - inicio) * 1000, total_bytes
+
+
+def bench_streaming(filas: int = 20000, repeticiones: int = 5):
+    """Tiempo hasta el primer byte de /items con página completa vs streaming"""
+    print(f"🌊 Streaming de listas (GET /items, {filas} filas)")
+    poblar(filas // 10, items_por_usuario=10)
+
+    # El umbral se lee en main.py: se cambia para forzar cada modo
+    for nombre, umbral in (("página completa", filas + 1), ("streaming", 0)):
+        app_main.STREAM_THRESHOLD = umbral
+        resultados = []
+        for _ in range(repeticiones):
+            fragment_cache.clear()
+            resultados.append(asyncio.run(_ttfb("/items", f"limit={filas}")))
+        ttfb = statistics.mean(r[0] for r in resultados)
+        total = statistics.mean(r[1] for r in resultados)
+        print(f"  {nombre:<40} primer byte {ttfb:8.2f} ms   total {total:8.2f} ms   {resultados[0][2]} bytes")
+
+
+BENCHMARKS = {
+    "plantillas": bench_plantillas,
+    "streaming": bench_streaming,
+}
+
+
+def main():
+    nombres = sys.argv[1:] or list(BENCHMARKS)
+    for nombre in nombres:
+        if nombre not in BENCHMARKS:
+            print(f"❌ Benchmark desconocido: {nombre}. Opciones: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+        BENCHMARKS[nombre]()
+        print("")
+
+
+if __name__ == "__main__":
+    main()
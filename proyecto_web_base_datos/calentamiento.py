@@ -0,0 +1,97 @@
+"""
+Calentamiento de los pools de conexiones al arrancar
+
+Tras cada despliegue, las primeras peticiones de cada worker abrían las
+conexiones (con sus PRAGMA) y compilaban por primera vez cada text() de
+crud.py: un pico de latencia en el p99 en cada actualización.
+
+Antes de aceptar peticiones, el lifespan llama a calentar():
+- Abre a la vez el tamaño mínimo de cada pool (pool_size); si el pool no tiene
+  tamaño fijo (SQLite en memoria), una conexión.
+- En cada conexión ejecuta todas las sentencias de crud.CALENTAMIENTO_LECTURAS
+  (y en el pool de escritura también crud.CALENTAMIENTO_ESCRITURAS) con
+  parámetros que no encuentran nada, y al final deshace la transacción. Cada
+  conexión guarda sus sentencias preparadas: todas deben pasar por todas.
+- Al terminar las conexiones vuelven al pool y se marca listo. Mientras tanto
+  el servidor no acepta peticiones: el lifespan todavía no ha llegado al yield.
+
+Un fallo en una sentencia no impide arrancar: se registra y se cuenta en errors.
+Configuración: WARMUP_ENABLED (true por defecto).
+"""
+
+import logging
+import os
+import time
+
+from sqlalchemy.orm import Session
+
+import crud
+from database import engine, read_engine
+from registro import campos
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+
+log = logging.getLogger("app.calentamiento")
+
+
+class Calentamiento:
+    """Estado del calentamiento (para las métricas y la comprobación de disponibilidad)"""
+
+    def __init__(self):
+        self.listo = False
+        self.conexiones = 0
+        self.sentencias = 0
+        self.errores = 0
+        self.duracion_ms = 0.0
+
+    def _calentar_pool(self, motor, sentencias: list):
+        # Solo QueuePool tiene tamaño fijo; SQLite en memoria usa otros pools
+        minimo = motor.pool.size() if hasattr(motor.pool, "checkedout") else 1
+        # Todas a la vez: si se soltaran una a una, el pool devolvería siempre la misma
+        conexiones = [motor.connect() for _ in range(minimo)]
+        try:
+            self.conexiones += len(conexiones)
+            for conn in conexiones:
+                # Una sesión sobre esa conexión: todas las sentencias pasan por ella y
+                # no vuelve al pool hasta el final (con SessionLocal, cada rollback la
+                # devolvería y la siguiente sentencia iría a otra). Al cerrarse la
+                # sesión se deshace su transacción
+                with Session(bind=conn) as session:
+                    for funcion, argumentos in sentencias:
+                        try:
+                            funcion(session, **argumentos)
+                            self.sentencias += 1
+                        except Exception:
+                            self.errores += 1
+                            log.warning(
+                                "calentamiento_fallido", exc_info=True, extra=campos(sentencia=funcion.__name__)
+                            )
+                            session.rollback()
+        finally:
+            for conn in conexiones:
+                conn.close()
+
+    def calentar(self):
+        """Síncrono: se llama con run_in_threadpool desde el lifespan"""
+        inicio = time.perf_counter()
+        self.__init__()  # cada llamada empieza de cero
+        if WARMUP_ENABLED:
+            self._calentar_pool(engine, crud.CALENTAMIENTO_LECTURAS + crud.CALENTAMIENTO_ESCRITURAS)
+            if read_engine is not engine:
+                self._calentar_pool(read_engine, crud.CALENTAMIENTO_LECTURAS)
+        self.duracion_ms = (time.perf_counter() - inicio) * 1000
+        self.listo = True
+        log.info("calentamiento_terminado", extra=campos(**self.stats()))
+
+    def stats(self) -> dict:
+        return {
+            "enabled": WARMUP_ENABLED,
+            "ready": self.listo,
+            "connections": self.conexiones,
+            "statements": self.sentencias,
+            "errors": self.errores,
+            "duration_ms": round(self.duracion_ms, 2),
+        }
+
+
+calentamiento = Calentamiento()
@@ -1,3 +1,6 @@
+import logging
+from datetime import datetime, timezone
+
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
@@ -5,41 +8,92 @@ from schemas import UserCreate, ItemCreate
 
 from fastapi import HTTPException
 
+from filas import iterar, primera, todas
+from registro import campos
+
+log = logging.getLogger("app.crud")
+
+def a_epoch(fecha: datetime) -> int:
+    # created_at se guarda en segundos desde 1970 (UTC); sin zona horaria se asume UTC
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return int(fecha.timestamp())
+
+def _filtro_created_at(created_after: datetime | None, created_before: datetime | None) -> tuple[str, str, dict]:
+    """
+    WHERE y ORDER BY para un rango [created_after, created_before).
+    Con rango se ordena por (created_at, id): el índice sobre created_at ya está
+    en ese orden, así que SQLite recorre solo el rango y se detiene en LIMIT.
+    """
+    condiciones, params = [], {}
+    if created_after is not None:
+        condiciones.append("created_at >= :created_after")
+        params["created_after"] = a_epoch(created_after)
+    if created_before is not None:
+        condiciones.append("created_at < :created_before")
+        params["created_before"] = a_epoch(created_before)
+    if not condiciones:
+        return "", "id", params
+    return " WHERE " + " AND ".join(condiciones), "created_at, id", params
+
 def get_user(db: Session, user_id: int):
     result = db.execute(text("SELECT * FROM users WHERE id = :user_id"), {"user_id": user_id})
-    user = result.mappings().first()
+    user = primera(result)
     return user if user else None
 
 def get_user_by_email(db: Session, email: str):
-    result = db.execute(text("SELECT * FROM users WHERE email = :email"), {"email": email})
-    user = result.mappings().first()
+    # lower(email) usa el índice users_email_lower: la búsqueda ignora mayúsculas
+    result = db.execute(text("SELECT * FROM users WHERE lower(email) = :email"), {"email": email.lower()})
+    user = primera(result)
     return user if user else None
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
+def get_users(
+    db: Session, skip: int = 0, limit: int = 100,
+    created_after: datetime | None = None, created_before: datetime | None = None
+):
+    where, orden, params = _filtro_created_at(created_after, created_before)
     result = db.execute(
-        text("SELECT * FROM users ORDER BY id LIMIT :limit OFFSET :skip"),
-        {"skip": skip, "limit": limit}
+        text(f"SELECT * FROM users{where} ORDER BY {orden} LIMIT :limit OFFSET :skip"),
+        {"skip": skip, "limit": limit, **params}
     )
-    users = result.mappings().all()
+    users = todas(result)
     return users
 
+def iter_users(
+    db: Session, skip: int = 0, limit: int = 100, batch_size: int = 500,
+    created_after: datetime | None = None, created_before: datetime | None = None
+):
+    # yield_per lee las filas del cursor por lotes en lugar de cargarlas todas
+    where, orden, params = _filtro_created_at(created_after, created_before)
+    result = db.execute(
+        text(f"SELECT * FROM users{where} ORDER BY {orden} LIMIT :limit OFFSET :skip").execution_options(yield_per=batch_size),
+        {"skip": skip, "limit": limit, **params}
+    )
+    yield from iterar(result)
+
 def create_user(db: Session, user: UserCreate):
+    """
+    Crea el usuario con una sola sentencia y devuelve None si el email ya existe.
+    El índice único users_email_lower decide el conflicto, así que dos registros
+    simultáneos con el mismo email no pueden crear dos cuentas.
+    """
     # Aquí deberías hashear la contraseña antes de almacenarla
     fake_hashed_password = user.password + "notreallyhashed"
-    print("Creating user with email:", user.email)
-    db.execute(
+    result = db.execute(
         text("""
             INSERT INTO users (email, hashed_password, es_activo) 
             VALUES (:email, :hashed_password, true) 
+            ON CONFLICT DO NOTHING
+            RETURNING *
         """),
         {"email": user.email, "hashed_password": fake_hashed_password}
     )
+    new_user = primera(result)
     db.commit()
-    result = db.execute(
-        text("SELECT * FROM users WHERE email = :email"),
-        {"email": user.email}
-    )
-    new_user = result.mappings().first()
+    if new_user is None:
+        log.debug("email_ya_registrado", extra=campos(email=user.email))
+    else:
+        log.info("usuario_creado", extra=campos(user_id=new_user.id, email=user.email))
     return new_user
 
 def create_user_item(db: Session, item: ItemCreate, user_id: int):
@@ -59,7 +113,7 @@ def create_user_item(db: Session, item: ItemCreate, user_id: int):
         text("SELECT * FROM items WHERE nombre = :nombre AND propietario_id = :propietario_id"),
         {"nombre": item.nombre, "propietario_id": user_id}
     )
-    new_item = result.mappings().first()
+    new_item = primera(result)
     return new_item
 
 def update_user(db: Session, user_id: int, new_email: str):
@@ -106,7 +160,7 @@ def update_item(db: Session, item_id: int, item: ItemCreate):
     )
     db.commit()
     result = db.execute(text("SELECT * FROM items WHERE id = :item_id"), {"item_id": item_id})
-    updated_item = result.mappings().first()
+    updated_item = primera(result)
     return updated_item
 
 def delete_item(db: Session, item_id: int):
@@ -118,17 +172,32 @@ def delete_item(db: Session, item_id: int):
     db.commit()
     return {"ok": True}
 
-def get_items(db: Session, skip: int = 0, limit: int = 100):
+def get_items(
+    db: Session, skip: int = 0, limit: int = 100,
+    created_after: datetime | None = None, created_before: datetime | None = None
+):
+    where, orden, params = _filtro_created_at(created_after, created_before)
     result = db.execute(
-        text("SELECT * FROM items ORDER BY id LIMIT :limit OFFSET :skip"),
-        {"skip": skip, "limit": limit}
+        text(f"SELECT * FROM items{where} ORDER BY {orden} LIMIT :limit OFFSET :skip"),
+        {"skip": skip, "limit": limit, **params}
     )
-    items = result.mappings().all()
+    items = todas(result)
     return items
 
+def iter_items(
+    db: Session, skip: int = 0, limit: int = 100, batch_size: int = 500,
+    created_after: datetime | None = None, created_before: datetime | None = None
+):
+    where, orden, params = _filtro_created_at(created_after, created_before)
+    result = db.execute(
+        text(f"SELECT * FROM items{where} ORDER BY {orden} LIMIT :limit OFFSET :skip").execution_options(yield_per=batch_size),
+        {"skip": skip, "limit": limit, **params}
+    )
+    yield from iterar(result)
+
 def get_item(db: Session, item_id: int):
     result = db.execute(text("SELECT * FROM items WHERE id = :item_id"), {"item_id": item_id})
-    item = result.mappings().first()
+    item = primera(result)
     return item if item else None
 
 def get_items_by_user(db: Session, user_id: int):
@@ -136,5 +205,57 @@ def get_items_by_user(db: Session, user_id: int):
         text("SELECT * FROM items WHERE propietario_id = :user_id ORDER BY id"),
         {"user_id": user_id}
     )
-    items = result.mappings().all()
-    return items
\ No newline at end of file
+    items = todas(result)
+    return items
+
+def get_table_version(db: Session, tabla: str):
+    result = db.execute(
+        text("SELECT version FROM versiones_tabla WHERE tabla = :tabla"),
+        {"tabla": tabla}
+    )
+    return result.scalar() or 0
+
+def get_stats(db: Session, dias: int = 30):
+    # Solo lee las tablas de rollups: nunca hace GROUP BY sobre users o items
+    result = db.execute(
+        text("""
+            SELECT dia, metrica, valor FROM estadisticas_diarias
+            WHERE dia >= date('now', :desde)
+            ORDER BY dia
+        """),
+        {"desde": f"-{dias} days"}
+    )
+    por_dia = {"signups": [], "items": []}
+    for fila in result.mappings():
+        por_dia[fila["metrica"]].append({"dia": fila["dia"], "valor": fila["valor"]})
+    totales = dict(db.execute(text("SELECT metrica, valor FROM estadisticas_totales")).all())
+    return {
+        "signups_por_dia": por_dia["signups"],
+        "items_por_dia": por_dia["items"],
+        "users_activos": totales.get("users_activos", 0),
+        "users_inactivos": totales.get("users_inactivos", 0),
+    }
+# Sentencias que calentamiento.py ejecuta al arrancar en cada conexión del pool:
+# (función, argumentos). Los ids 0 no existen, así que no encuentran nada; solo
+# compilan la sentencia y la dejan preparada.
+# Cada combinación de created_after / created_before es un SQL distinto
+# (ver _filtro_created_at), así que se calientan las tres variantes con filtro
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+CALENTAMIENTO_LECTURAS = [
+    (get_user, {"user_id": 0}),
+    (get_user_by_email, {"email": ""}),
+    (get_users, {"limit": 0}),
+    (get_users, {"limit": 0, "created_after": _EPOCH}),
+    (get_users, {"limit": 0, "created_before": _EPOCH}),
+    (get_users, {"limit": 0, "created_after": _EPOCH, "created_before": _EPOCH}),
+    (get_items, {"limit": 0}),
+    (get_items, {"limit": 0, "created_after": _EPOCH}),
+    (get_items, {"limit": 0, "created_before": _EPOCH}),
+    (get_items, {"limit": 0, "created_after": _EPOCH, "created_before": _EPOCH}),
+    (get_item, {"item_id": 0}),
+    (get_items_by_user, {"user_id": 0}),
+    (get_table_version, {"tabla": "users"}),
+    (get_stats, {}),
+]
+# Las escrituras de esta app leen antes de escribir y hacen commit: no se ejecutan
+CALENTAMIENTO_ESCRITURAS = []
@@ -1,6 +1,9 @@
+from contextlib import asynccontextmanager
+from datetime import datetime
+
 from fastapi import FastAPI, Request, Form, HTTPException, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import ValidationError
 from typing import Optional, Annotated
@@ -8,22 +11,47 @@ from sqlalchemy.orm import Session
 import crud
 import schemas
 from models import crear_tablas
-from database import get_db
+from database import get_db, estado_pools
+from admision import MiddlewareAdmision, control_admision
+from apagado import SHUTDOWN_DRAIN_SECONDS, apagar
+from calentamiento import calentamiento
+from salud import disponibilidad
+from registro import configurar_logging
+from plantillas import (
+    templates, CargaDiferida, FilasEnStreaming, StreamingTemplateResponse,
+    STREAM_THRESHOLD, ESQUEMAS_FORMULARIO, estadisticas_cache
+)
+
+# Logs en JSON escritos desde un hilo aparte (ver registro.py)
+configurar_logging()
 
 # Crear las tablas en la base de datos al iniciar la aplicación
 crear_tablas()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Abre las conexiones y prepara las sentencias de crud antes de aceptar peticiones
+    await run_in_threadpool(calentamiento.calentar)
+    yield
+    # Apagado ordenado (ver apagado.py): espera a las peticiones en curso y vacía el WAL
+    await apagar()
+
+
 app = FastAPI(
     title="Aplicación Web CRUD con FastAPI",
     version="1.0.0", 
-    description="Una aplicación web completa con operaciones CRUD usando FastAPI, SQLAlchemy y Jinja2"
+    description="Una aplicación web completa con operaciones CRUD usando FastAPI, SQLAlchemy y Jinja2",
+    lifespan=lifespan
 )
 
+# Rechaza peticiones con 503/429 antes de tocar la base de datos si hay sobrecarga
+app.add_middleware(MiddlewareAdmision)
+
 # Configurar archivos estáticos y plantillas
 import os
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 app.mount("/static", StaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static")
-templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
 
 # Función auxiliar para manejar mensajes
 def get_messages(request: Request):
@@ -34,19 +62,47 @@ def get_messages(request: Request):
 
 # Ruta principal
 @app.get("/", response_class=HTMLResponse)
-async def home(request: Request):
+async def home(request: Request, db: Annotated[Session, Depends(get_db)]):
+    stats = crud.get_stats(db, dias=14)
     return templates.TemplateResponse(
         "index.html", 
-        {"request": request}
+        {"request": request, "stats": stats}
     )
 
+# Estadísticas en JSON (leídas de las tablas de rollups)
+@app.get("/stats", response_model=schemas.Stats)
+async def read_stats(db: Annotated[Session, Depends(get_db)], dias: int = 30):
+    return crud.get_stats(db, dias=dias)
+
 # Rutas de usuarios
 @app.get("/users", response_class=HTMLResponse)
-async def list_users(request: Request, db: Annotated[Session, Depends(get_db)]):
-    users = crud.get_users(db)
+async def list_users(
+    request: Request,
+    db: Annotated[Session, Depends(get_db)],
+    skip: int = 0,
+    limit: int = 100,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None
+):
+    # Listas grandes: se envían en streaming directamente desde el cursor
+    if limit > STREAM_THRESHOLD:
+        users = FilasEnStreaming(crud.iter_users(
+            db, skip=skip, limit=limit, created_after=created_after, created_before=created_before
+        ))
+        return StreamingTemplateResponse(
+            "users.html",
+            {"request": request, "users": users, "streaming": True}
+        )
+
+    # La tabla se cachea por versión: si no hubo escrituras no se consulta la lista
+    users_version = crud.get_table_version(db, "users")
+    users = CargaDiferida(lambda: crud.get_users(
+        db, skip=skip, limit=limit, created_after=created_after, created_before=created_before
+    ))
     return templates.TemplateResponse(
         "users.html", 
-        {"request": request, "users": users}
+        {"request": request, "users": users, "users_version": users_version,
+         "skip": skip, "limit": limit, "created_after": created_after, "created_before": created_before}
     )
 
 @app.get("/users/create", response_class=HTMLResponse)
@@ -67,9 +123,8 @@ async def create_user(
         # Validar datos usando Pydantic
         user_data = schemas.UserCreate(email=email, password=password)
         
-        # Verificar si el email ya existe
-        existing_user = crud.get_user_by_email(db, email=user_data.email)
-        if existing_user:
+        # Crear el usuario (None si el email ya existe)
+        if crud.create_user(db=db, user=user_data) is None:
             return templates.TemplateResponse(
                 "user_form.html",
                 {
@@ -78,9 +133,6 @@ async def create_user(
                     "form_data": {"email": email}
                 }
             )
-        
-        # Crear el usuario
-        crud.create_user(db=db, user=user_data)
         return RedirectResponse(url="/users", status_code=303)
         
     except ValidationError as e:
@@ -138,9 +190,12 @@ async def edit_user(
         if not user:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
+        # Validar y normalizar el email (minúsculas) igual que al crear
+        email = schemas.UserBase(email=email).email
+        
         # Verificar si el email ya existe en otro usuario
         existing_user = crud.get_user_by_email(db, email=email)
-        if existing_user and existing_user['id'] != user_id:
+        if existing_user and existing_user.id != user_id:
             return templates.TemplateResponse(
                 "user_form.html",
                 {
@@ -154,6 +209,16 @@ async def edit_user(
         crud.update_user(db=db, user_id=user_id, new_email=email)
         return RedirectResponse(url=f"/users/{user_id}", status_code=303)
         
+    except ValidationError as e:
+        errors = [error['msg'] for error in e.errors()]
+        return templates.TemplateResponse(
+            "user_form.html",
+            {
+                "request": request,
+                "user": user,
+                "errors": errors
+            }
+        )
     except Exception as e:
         return templates.TemplateResponse(
             "user_form.html",
@@ -166,11 +231,31 @@ async def edit_user(
 
 # Rutas de items
 @app.get("/items", response_class=HTMLResponse)
-async def list_items(request: Request, db: Annotated[Session, Depends(get_db)]):
-    items = crud.get_items(db)
+async def list_items(
+    request: Request,
+    db: Annotated[Session, Depends(get_db)],
+    skip: int = 0,
+    limit: int = 100,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None
+):
+    if limit > STREAM_THRESHOLD:
+        items = FilasEnStreaming(crud.iter_items(
+            db, skip=skip, limit=limit, created_after=created_after, created_before=created_before
+        ))
+        return StreamingTemplateResponse(
+            "items.html",
+            {"request": request, "items": items, "streaming": True}
+        )
+
+    items_version = crud.get_table_version(db, "items")
+    items = CargaDiferida(lambda: crud.get_items(
+        db, skip=skip, limit=limit, created_after=created_after, created_before=created_before
+    ))
     return templates.TemplateResponse(
         "items.html",
-        {"request": request, "items": items}
+        {"request": request, "items": items, "items_version": items_version,
+         "skip": skip, "limit": limit, "created_after": created_after, "created_before": created_before}
     )
 
 @app.get("/items/create", response_class=HTMLResponse)
@@ -241,7 +326,7 @@ async def create_user_item_form(request: Request, user_id: int, db: Annotated[Se
     
     return templates.TemplateResponse(
         "item_form.html",
-        {"request": request, "user_id": user_id, "user_email": user['email']}
+        {"request": request, "user_id": user_id, "user_email": user.email}
     )
 
 @app.post("/users/{user_id}/items/create")
@@ -275,7 +360,7 @@ async def create_user_item(
             {
                 "request": request,
                 "user_id": user_id,
-                "user_email": user['email'],
+                "user_email": user.email,
                 "errors": errors,
                 "form_data": {"nombre": nombre, "descripcion": descripcion}
             }
@@ -286,7 +371,7 @@ async def create_user_item(
             {
                 "request": request,
                 "user_id": user_id,
-                "user_email": user['email'] if 'user' in locals() else None,
+                "user_email": user.email if 'user' in locals() else None,
                 "errors": [f"Error al crear item: {str(e)}"],
                 "form_data": {"nombre": nombre, "descripcion": descripcion}
             }
@@ -349,6 +434,40 @@ async def delete_item(item_id: int, db: Annotated[Session, Depends(get_db)]):
     except HTTPException:
         return RedirectResponse(url="/items", status_code=303)
 
+# Comprobaciones para el balanceador: sin plantillas ni sesión de base de datos
+@app.get("/healthz")
+async def healthz():
+    # Liveness: sin base de datos
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    status, cuerpo = await disponibilidad()
+    return JSONResponse(cuerpo, status_code=status)
+
+# Métricas de la caché de plantillas
+@app.get("/metrics/templates")
+async def template_metrics():
+    return estadisticas_cache()
+
+# Resultado del calentamiento de los pools al arrancar
+@app.get("/metrics/warmup")
+async def warmup_metrics():
+    return calentamiento.stats()
+
+# Métricas del control de admisión y de los pools de conexiones
+@app.get("/metrics/admission")
+async def admission_metrics():
+    return {**control_admision.stats(), "pools": estado_pools()}
+
+# JSON Schema de los formularios (las mismas reglas que valida el servidor)
+@app.get("/schemas/{nombre}")
+async def read_schema(nombre: str):
+    if nombre not in ESQUEMAS_FORMULARIO:
+        raise HTTPException(status_code=404, detail="Esquema no encontrado")
+    return ESQUEMAS_FORMULARIO[nombre]
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Mismo plazo que el lifespan para las peticiones en curso al apagar (ver apagado.py)
+    uvicorn.run(app, host="0.0.0.0", port=8000, timeout_graceful_shutdown=SHUTDOWN_DRAIN_SECONDS)
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Tareas de mantenimiento de la base de datos
+
+Uso:
+    python mantenimiento.py recalcular-contadores
+    python mantenimiento.py verificar-estadisticas [--reparar]
+"""
+
+import argparse
+
+from sqlalchemy.orm import Session
+
+from database import engine
+from models import (
+    crear_tablas, recalcular_estadisticas, recalcular_item_count, verificar_estadisticas
+)
+
+
+def recalcular_contadores(args):
+    """Reconstruye users.item_count a partir de la tabla items"""
+    with Session(engine) as session:
+        corregidos = recalcular_item_count(session)
+        session.commit()
+    print(f"✅ Contadores recalculados ({corregidos} usuarios tenían un valor incorrecto)")
+
+
+def verificar(args):
+    """Compara los rollups de estadísticas con un recálculo completo"""
+    with Session(engine) as session:
+        diferencias = verificar_estadisticas(session)
+        for diferencia in diferencias:
+            print(f"❌ {diferencia}")
+        if not diferencias:
+            print("✅ Las estadísticas coinciden con el recálculo completo")
+            return
+        if args.reparar:
+            recalcular_estadisticas(session)
+            session.commit()
+            print("🔧 Estadísticas recalculadas")
+        else:
+            raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tareas de mantenimiento de la base de datos")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    subparsers.add_parser(
+        "recalcular-contadores", help="Reconstruye users.item_count desde items"
+    ).set_defaults(func=recalcular_contadores)
+
+    verificar_parser = subparsers.add_parser(
+        "verificar-estadisticas", help="Compara los rollups con un recálculo completo"
+    )
+    verificar_parser.add_argument(
+        "--reparar", action="store_true", help="Recalcula los rollups si hay diferencias"
+    )
+    verificar_parser.set_defaults(func=verificar)
+
+    args = parser.parse_args()
+    crear_tablas()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,292 @@
 # Crear las tablas usando SQL raw con text() al importar el módulo
+import logging
+
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 from database import engine
+from registro import campos
+
+log = logging.getLogger("app.models")
+
+
+def _sumar_dia(metrica: str, fila: str, delta: str) -> str:
+    return f"""
+        INSERT INTO estadisticas_diarias (dia, metrica, valor)
+        VALUES (date({fila}.created_at, 'unixepoch'), '{metrica}', {delta})
+        ON CONFLICT(dia, metrica) DO UPDATE SET valor = valor + ({delta});
+    """
+
+
+def _sumar_estado(fila: str, delta: str) -> str:
+    return f"""
+        UPDATE estadisticas_totales SET valor = valor + ({delta})
+        WHERE metrica = CASE WHEN {fila}.es_activo THEN 'users_activos' ELSE 'users_inactivos' END;
+    """
+
+
+TRIGGERS_ESTADISTICAS = [
+    f"""CREATE TRIGGER IF NOT EXISTS "stats_users_insert" AFTER INSERT ON "users"
+        BEGIN {_sumar_dia('signups', 'NEW', '1')} {_sumar_estado('NEW', '1')} END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS "stats_users_delete" AFTER DELETE ON "users"
+        BEGIN {_sumar_dia('signups', 'OLD', '-1')} {_sumar_estado('OLD', '-1')} END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS "stats_users_estado" AFTER UPDATE OF es_activo ON "users"
+        WHEN OLD.es_activo IS NOT NEW.es_activo
+        BEGIN {_sumar_estado('OLD', '-1')} {_sumar_estado('NEW', '1')} END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS "stats_items_insert" AFTER INSERT ON "items"
+        BEGIN {_sumar_dia('items', 'NEW', '1')} END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS "stats_items_delete" AFTER DELETE ON "items"
+        BEGIN {_sumar_dia('items', 'OLD', '-1')} END;""",
+]
+
+# Recalcular desde cero: las mismas cifras que mantienen los triggers
+CONSULTAS_ESTADISTICAS = {
+    "diarias": """
+        SELECT date(created_at, 'unixepoch') AS dia, 'signups' AS metrica, COUNT(*) AS valor FROM users GROUP BY dia
+        UNION ALL
+        SELECT date(created_at, 'unixepoch') AS dia, 'items' AS metrica, COUNT(*) AS valor FROM items GROUP BY dia
+    """,
+    "totales": """
+        SELECT 'users_activos' AS metrica, COUNT(*) AS valor FROM users WHERE es_activo
+        UNION ALL
+        SELECT 'users_inactivos' AS metrica, COUNT(*) AS valor FROM users WHERE NOT es_activo
+    """,
+}
+
+
+# Tablas principales. created_at es un entero: segundos desde 1970 (UTC).
+# {tabla} permite crear la copia que usa la migración de fechas
+TABLAS = {
+    "users": """
+        CREATE TABLE IF NOT EXISTS "{tabla}" (
+            "id" INTEGER NOT NULL,
+            "email" VARCHAR NOT NULL,
+            "hashed_password" VARCHAR NOT NULL,
+            "es_activo" BOOLEAN NOT NULL,
+            "created_at" INTEGER NOT NULL DEFAULT (unixepoch()),
+            "item_count" INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY("id")
+        );
+    """,
+    "items": """
+        CREATE TABLE IF NOT EXISTS "{tabla}" (
+            "id" INTEGER NOT NULL,
+            "nombre" VARCHAR NOT NULL,
+            "descripcion" VARCHAR,
+            "created_at" INTEGER NOT NULL DEFAULT (unixepoch()),
+            "propietario_id" INTEGER,
+            PRIMARY KEY("id"),
+            FOREIGN KEY("propietario_id") REFERENCES "users"("id")
+        );
+    """,
+}
+
 
 def crear_tablas():
     with Session(engine) as session:
+        for tabla, definicion in TABLAS.items():
+            session.execute(text(definicion.format(tabla=tabla)))
+        # item_count en users: contador exacto mantenido por triggers para
+        # leer "items por usuario" sin COUNT(*)
+        if _agregar_columna_si_falta(session, "users", "item_count", "INTEGER NOT NULL DEFAULT 0"):
+            recalcular_item_count(session)
+        # Fechas guardadas como texto por versiones anteriores: pasan a enteros.
+        # Borra los triggers (se vuelven a crear a continuación)
+        for tabla in TABLAS:
+            _migrar_fechas_a_epoch(session, tabla)
+        session.execute(text('CREATE INDEX IF NOT EXISTS "users_created_at" ON "users" ("created_at")'))
+        session.execute(text('CREATE INDEX IF NOT EXISTS "items_created_at" ON "items" ("created_at")'))
+        session.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS "items_count_insert" AFTER INSERT ON "items"
+            BEGIN
+                UPDATE users SET item_count = item_count + 1 WHERE id = NEW.propietario_id;
+            END;
+        """))
+        session.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS "items_count_delete" AFTER DELETE ON "items"
+            BEGIN
+                UPDATE users SET item_count = item_count - 1 WHERE id = OLD.propietario_id;
+            END;
+        """))
+        session.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS "items_count_update" AFTER UPDATE OF propietario_id ON "items"
+            WHEN OLD.propietario_id IS NOT NEW.propietario_id
+            BEGIN
+                UPDATE users SET item_count = item_count - 1 WHERE id = OLD.propietario_id;
+                UPDATE users SET item_count = item_count + 1 WHERE id = NEW.propietario_id;
+            END;
+        """))
+        # Estadísticas agregadas (rollups): se actualizan en cada escritura
+        # para que /stats no tenga que hacer GROUP BY sobre users e items
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS "estadisticas_diarias" (
+                "dia" DATE NOT NULL,
+                "metrica" VARCHAR NOT NULL,
+                "valor" INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY("dia", "metrica")
+            );
+        """))
         session.execute(text("""
-            CREATE TABLE IF NOT EXISTS "users" (
-                "id" INTEGER NOT NULL,
-                "email" VARCHAR NOT NULL,
-                "hashed_password" VARCHAR NOT NULL,
-                "es_activo" BOOLEAN NOT NULL,
-                "created_at" DATETIME NOT NULL DEFAULT (datetime('now')),
-                PRIMARY KEY("id")
+            CREATE TABLE IF NOT EXISTS "estadisticas_totales" (
+                "metrica" VARCHAR NOT NULL,
+                "valor" INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY("metrica")
             );
         """))
+        if session.execute(text("SELECT COUNT(*) FROM estadisticas_totales")).scalar() == 0:
+            recalcular_estadisticas(session)
+        for trigger in TRIGGERS_ESTADISTICAS:
+            session.execute(text(trigger))
+        # Email único sin distinguir mayúsculas. Antes de crear el índice se
+        # unifican las cuentas que ya existían repetidas con otras mayúsculas
+        if not _existe_indice(session, "users_email_lower"):
+            unificar_emails_duplicados(session)
+        session.execute(text(
+            'CREATE UNIQUE INDEX IF NOT EXISTS "users_email_lower" ON "users" (lower("email"))'
+        ))
+        # Contador de versión por tabla: lo incrementan los triggers en cada
+        # escritura y se usa como clave de la caché de fragmentos HTML
         session.execute(text("""
-            CREATE TABLE IF NOT EXISTS "items" (
-                "id" INTEGER NOT NULL,
-                "nombre" VARCHAR NOT NULL,
-                "descripcion" VARCHAR,
-                "created_at" DATETIME NOT NULL DEFAULT (datetime('now')),
-                "propietario_id" INTEGER,
-                PRIMARY KEY("id"),
-                FOREIGN KEY("propietario_id") REFERENCES "users"("id")
+            CREATE TABLE IF NOT EXISTS "versiones_tabla" (
+                "tabla" VARCHAR NOT NULL,
+                "version" INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY("tabla")
             );
         """))
-        session.commit()
\ No newline at end of file
+        for tabla in ("users", "items"):
+            session.execute(
+                text("INSERT OR IGNORE INTO versiones_tabla (tabla, version) VALUES (:tabla, 0)"),
+                {"tabla": tabla}
+            )
+            for operacion in ("INSERT", "UPDATE", "DELETE"):
+                session.execute(text(f"""
+                    CREATE TRIGGER IF NOT EXISTS "{tabla}_version_{operacion.lower()}"
+                    AFTER {operacion} ON "{tabla}"
+                    BEGIN
+                        UPDATE versiones_tabla SET version = version + 1 WHERE tabla = '{tabla}';
+                    END;
+                """))
+        session.commit()
+
+
+def _agregar_columna_si_falta(session: Session, tabla: str, columna: str, definicion: str) -> bool:
+    """Migración simple: agrega la columna si la tabla ya existía sin ella"""
+    columnas = {fila[1] for fila in session.execute(text(f'PRAGMA table_info("{tabla}")'))}
+    if columna in columnas:
+        return False
+    session.execute(text(f'ALTER TABLE "{tabla}" ADD COLUMN "{columna}" {definicion}'))
+    return True
+
+
+def _migrar_fechas_a_epoch(session: Session, tabla: str) -> bool:
+    """
+    Migración: created_at pasa de texto ('2026-01-05 10:00:00', 19 bytes) a
+    segundos desde 1970 (INTEGER, 4-6 bytes). SQLite no permite cambiar el tipo
+    ni el DEFAULT de una columna, así que se crea la tabla nueva, se copian las
+    filas y se renombra. Los índices se vuelven a crear después.
+    """
+    columnas = {fila[1]: fila[2] for fila in session.execute(text(f'PRAGMA table_info("{tabla}")'))}
+    if columnas.get("created_at") == "INTEGER":
+        return False
+    # Los triggers de otras tablas que usan esta impedirían el RENAME
+    for (trigger,) in session.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).all():
+        session.execute(text(f'DROP TRIGGER "{trigger}"'))
+    nueva = f"{tabla}_migracion"
+    session.execute(text(f'DROP TABLE IF EXISTS "{nueva}"'))
+    session.execute(text(TABLAS[tabla].format(tabla=nueva)))
+    lista = ", ".join(f'"{columna}"' for columna in columnas)
+    valores = ", ".join(
+        "CASE WHEN typeof(created_at) = 'integer' THEN created_at ELSE unixepoch(created_at) END"
+        if columna == "created_at" else f'"{columna}"'
+        for columna in columnas
+    )
+    session.execute(text(f'INSERT INTO "{nueva}" ({lista}) SELECT {valores} FROM "{tabla}"'))
+    session.execute(text(f'DROP TABLE "{tabla}"'))
+    session.execute(text(f'ALTER TABLE "{nueva}" RENAME TO "{tabla}"'))
+    log.info("fechas_migradas_a_epoch", extra=campos(tabla=tabla))
+    return True
+
+
+def _existe_indice(session: Session, nombre: str) -> bool:
+    return session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :nombre"),
+        {"nombre": nombre}
+    ).first() is not None
+
+
+def unificar_emails_duplicados(session: Session) -> int:
+    """
+    Migración: une las cuentas cuyo email solo se diferencia en mayúsculas y pasa
+    todos los emails a minúsculas. Se conserva la cuenta más antigua (menor id),
+    que recibe los items de las demás y queda activa si alguna lo estaba.
+    Devuelve cuántas cuentas repetidas se eliminaron.
+    """
+    grupos: dict[str, list[tuple[int, str]]] = {}
+    for user_id, email in session.execute(text("SELECT id, email FROM users ORDER BY id")):
+        grupos.setdefault(email.lower(), []).append((user_id, email))
+
+    unir = []
+    renombrar = []
+    for email, cuentas in grupos.items():
+        (conservar, email_actual), *repetidas = cuentas
+        unir.extend({"conservar": conservar, "repetida": user_id} for user_id, _ in repetidas)
+        if email_actual != email:
+            renombrar.append({"user_id": conservar, "email": email})
+
+    if unir:
+        # Los triggers de item_count y de estadísticas se encargan de los contadores
+        session.execute(
+            text("UPDATE items SET propietario_id = :conservar WHERE propietario_id = :repetida"), unir
+        )
+        session.execute(text("""
+            UPDATE users SET es_activo = es_activo OR (SELECT es_activo FROM users WHERE id = :repetida)
+            WHERE id = :conservar
+        """), unir)
+        session.execute(text("DELETE FROM users WHERE id = :repetida"), unir)
+        log.info("emails_unificados", extra=campos(cuentas_eliminadas=len(unir)))
+    if renombrar:
+        session.execute(text("UPDATE users SET email = :email WHERE id = :user_id"), renombrar)
+    return len(unir)
+
+
+def recalcular_item_count(session: Session) -> int:
+    """Reconstruye users.item_count desde items y devuelve cuántos usuarios se corrigieron"""
+    conteo_real = 'SELECT COUNT(*) FROM items WHERE items.propietario_id = users.id'
+    corregidos = session.execute(
+        text(f"SELECT COUNT(*) FROM users WHERE item_count != ({conteo_real})")
+    ).scalar()
+    session.execute(text(f"UPDATE users SET item_count = ({conteo_real})"))
+    return corregidos
+
+
+def recalcular_estadisticas(session: Session):
+    """Reconstruye las tablas de estadísticas con un recálculo completo"""
+    session.execute(text("DELETE FROM estadisticas_diarias"))
+    session.execute(text("DELETE FROM estadisticas_totales"))
+    session.execute(text(
+        f"INSERT INTO estadisticas_diarias (dia, metrica, valor) {CONSULTAS_ESTADISTICAS['diarias']}"
+    ))
+    session.execute(text(
+        f"INSERT INTO estadisticas_totales (metrica, valor) {CONSULTAS_ESTADISTICAS['totales']}"
+    ))
+
+
+def verificar_estadisticas(session: Session) -> list[str]:
+    """Compara los rollups con un recálculo completo y devuelve las diferencias"""
+    diferencias = []
+    for tabla, clave in (("diarias", ("dia", "metrica")), ("totales", ("metrica",))):
+        esperado = {
+            tuple(fila[c] for c in clave): fila["valor"]
+            for fila in session.execute(text(CONSULTAS_ESTADISTICAS[tabla])).mappings()
+        }
+        actual = {
+            tuple(fila[c] for c in clave): fila["valor"]
+            for fila in session.execute(text(f"SELECT * FROM estadisticas_{tabla}")).mappings()
+        }
+        for k in sorted(set(esperado) | set(actual)):
+            # Un día sin filas equivale a un rollup en 0
+            if esperado.get(k, 0) != actual.get(k, 0):
+                diferencias.append(
+                    f"estadisticas_{tabla} {'/'.join(map(str, k))}: "
+                    f"rollup={actual.get(k, 0)} recálculo={esperado.get(k, 0)}"
+                )
+    return diferencias
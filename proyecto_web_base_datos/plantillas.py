@@ -0,0 +1,253 @@
+"""
+Configuración de las plantillas Jinja2 de la aplicación web
+
+- Caché de bytecode en disco: las plantillas se compilan una sola vez y todos
+  los workers de uvicorn reutilizan el resultado.
+- Etiqueta {% cache "nombre", version %} ... {% endcache %} para guardar en
+  memoria fragmentos costosos que cambian poco (por ejemplo la tabla de usuarios).
+- Modo streaming para listas grandes: el HTML se envía a medida que se
+  leen las filas del cursor, sin construir la página completa en memoria.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi.responses import StreamingResponse
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, nodes
+from jinja2.ext import Extension
+
+import schemas
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Directorio compartido por todos los workers para el bytecode compilado
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", os.path.join(BASE_DIR, ".jinja_cache"))
+# Número máximo de fragmentos HTML guardados en memoria (por worker)
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", "256"))
+# A partir de cuántas filas una lista se envía en modo streaming
+STREAM_THRESHOLD = int(os.getenv("STREAM_THRESHOLD", "500"))
+# Tamaño aproximado de cada trozo enviado al navegador en modo streaming
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "16384"))
+
+
+class BytecodeCacheConMetricas(FileSystemBytecodeCache):
+    """Caché de bytecode en disco que cuenta aciertos y fallos"""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(directory)
+        self.hits = 0
+        self.misses = 0
+
+    def load_bytecode(self, bucket):
+        super().load_bytecode(bucket)
+        if bucket.code is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+
+class FragmentCache:
+    """Caché LRU en memoria para fragmentos de HTML ya renderizados"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._fragmentos: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, clave):
+        with self._lock:
+            html = self._fragmentos.get(clave)
+            if html is None:
+                self.misses += 1
+                return None
+            self._fragmentos.move_to_end(clave)
+            self.hits += 1
+            return html
+
+    def set(self, clave, html: str):
+        with self._lock:
+            self._fragmentos[clave] = html
+            self._fragmentos.move_to_end(clave)
+            while len(self._fragmentos) > self.max_entries:
+                self._fragmentos.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._fragmentos.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._fragmentos)
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Agrega la etiqueta {% cache "nombre", version %} ... {% endcache %}
+
+    El contenido se renderiza una vez y se reutiliza mientras la versión no
+    cambie. La versión suele ser el contador de la tabla que se muestra
+    (ver crud.get_table_version), así cualquier escritura invalida el fragmento.
+    """
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render_fragmento", args), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_fragmento(self, nombre, version, caller):
+        clave = (nombre, version)
+        html = fragment_cache.get(clave)
+        if html is None:
+            html = caller()
+            fragment_cache.set(clave, html)
+        return html
+
+
+class CargaDiferida:
+    """
+    Envuelve una consulta para ejecutarla solo si la plantilla la usa.
+
+    Si el fragmento está en caché, Jinja2 nunca recorre la lista y la
+    consulta a la base de datos no se ejecuta.
+    """
+
+    def __init__(self, cargar):
+        self._cargar = cargar
+        self._filas = None
+
+    def _obtener(self):
+        if self._filas is None:
+            self._filas = self._cargar()
+        return self._filas
+
+    def __iter__(self):
+        return iter(self._obtener())
+
+    def __len__(self):
+        return len(self._obtener())
+
+    def __bool__(self):
+        return len(self._obtener()) > 0
+
+
+class FilasEnStreaming:
+    """
+    Envuelve un iterador de filas para usarlo en plantillas en modo streaming.
+
+    Lee solo la primera fila para que {% if users %} funcione; el resto se
+    consume a medida que Jinja2 genera el HTML.
+    """
+
+    def __init__(self, filas):
+        self._filas = iter(filas)
+        self._primera = next(self._filas, None)
+
+    def __bool__(self):
+        return self._primera is not None
+
+    def __iter__(self):
+        if self._primera is not None:
+            yield self._primera
+            yield from self._filas
+
+
+bytecode_cache = BytecodeCacheConMetricas(JINJA_CACHE_DIR)
+fragment_cache = FragmentCache(FRAGMENT_CACHE_SIZE)
+
+env = Environment(
+    loader=FileSystemLoader(os.path.join(BASE_DIR, "templates")),
+    autoescape=True,
+    bytecode_cache=bytecode_cache,
+    extensions=[FragmentCacheExtension],
+)
+templates = Jinja2Templates(env=env)
+
+# JSON Schema de los modelos que validan formularios. static/validacion.js lo
+# lee del atributo data-esquema y aplica las mismas reglas en el navegador
+ESQUEMAS_FORMULARIO = {
+    modelo.__name__: modelo.model_json_schema()
+    for modelo in (schemas.UserCreate, schemas.ItemCreate)
+}
+_ESQUEMAS_JSON = {
+    nombre: json.dumps(esquema, ensure_ascii=False)
+    for nombre, esquema in ESQUEMAS_FORMULARIO.items()
+}
+env.globals["esquema_json"] = _ESQUEMAS_JSON.__getitem__
+
+
+def fecha(segundos: int | None) -> str:
+    """created_at se guarda en segundos desde 1970 (UTC); se muestra como antes"""
+    if not segundos:
+        return "N/A"
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(segundos))
+
+
+env.filters["fecha"] = fecha
+
+
+def _agrupar_trozos(partes, chunk_size: int):
+    """
+    generate() produce trozos muy pequeños (uno por expresión); se agrupan
+    para no pagar un cambio de hilo por cada uno. El primer trozo se envía
+    de inmediato para que el navegador empiece a pintar la cabecera.
+    """
+    buffer = []
+    tamano = 0
+    primero = True
+    for parte in partes:
+        buffer.append(parte)
+        tamano += len(parte)
+        if primero or tamano >= chunk_size:
+            yield "".join(buffer)
+            buffer.clear()
+            tamano = 0
+            primero = False
+    if buffer:
+        yield "".join(buffer)
+
+
+def StreamingTemplateResponse(name: str, context: dict) -> StreamingResponse:
+    """Renderiza la plantilla con generate() y envía cada trozo en cuanto está listo"""
+    template = env.get_template(name)
+    partes = _agrupar_trozos(template.generate(context), STREAM_CHUNK_SIZE)
+    return StreamingResponse(partes, media_type="text/html; charset=utf-8")
+
+
+def _tasa(hits: int, misses: int) -> float:
+    total = hits + misses
+    return round(hits / total, 4) if total else 0.0
+
+
+def estadisticas_cache() -> dict:
+    """Métricas de aciertos de las dos cachés de plantillas"""
+    return {
+        "bytecode": {
+            "hits": bytecode_cache.hits,
+            "misses": bytecode_cache.misses,
+            "hit_rate": _tasa(bytecode_cache.hits, bytecode_cache.misses),
+        },
+        "fragmentos": {
+            "hits": fragment_cache.hits,
+            "misses": fragment_cache.misses,
+            "hit_rate": _tasa(fragment_cache.hits, fragment_cache.misses),
+            "entradas": len(fragment_cache),
+            "max_entradas": fragment_cache.max_entries,
+        },
+    }
@@ -0,0 +1,99 @@
+"""
+Comprobaciones de salud para el balanceador de carga
+
+- GET /healthz (liveness): responde mientras el proceso atiende peticiones. No
+  toca la base de datos: si la base va lenta, reiniciar el worker no lo arregla.
+- GET /readyz (readiness): 200 si este worker puede atender peticiones y 503 si
+  no, para que el balanceador deje de enviarle tráfico. No está listo si:
+  - el worker se está apagando (shutting_down, ver apagado.py)
+  - el calentamiento de los pools no ha terminado (warming_up)
+  - el control de admisión está rechazando peticiones (in_flight, o pool_wait
+    si la espera media de algún pool supera el límite)
+  - todas las conexiones de un pool están en uso (pool_exhausted): se responde
+    sin pedir una, porque esa espera duraría hasta el pool_timeout
+  - un SELECT 1 por cada pool no responde en READYZ_TIMEOUT_MS (db_timeout) o
+    falla (db_error)
+  Se comprueban el pool de escritura y el de lectura (read_engine), que atiende
+  todas las rutas GET. "pool" indica cuál falló. El cuerpo incluye siempre el
+  estado de los pools y la espera media para obtener una conexión.
+
+Ninguna de las dos usa plantillas ni la dependencia get_db, y el control de
+admisión no las limita (ver ADMISSION_EXEMPT_PATHS).
+"""
+
+import logging
+import os
+import time
+
+import anyio
+from sqlalchemy import text
+
+from admision import control_admision, esperas_pool
+from calentamiento import calentamiento
+from database import engine, estado_pools, read_engine
+from registro import campos
+
+READYZ_TIMEOUT_MS = float(os.getenv("READYZ_TIMEOUT_MS", "1000"))
+
+log = logging.getLogger("app.salud")
+
+
+# Los motores que se comprueban, con el nombre de su pool en estado_pools
+MOTORES = {"write": engine}
+if read_engine is not engine:
+    MOTORES["read"] = read_engine
+
+
+def _select_1(motor):
+    with motor.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+def _pool_agotado(estado: dict) -> bool:
+    return estado["checked_out"] >= estado["size"] + estado["max_overflow"]
+
+
+async def _comprobar_base() -> tuple[str | None, str | None, float]:
+    """(motivo del fallo o None, pool que falló, ms que tardaron los SELECT 1)"""
+    inicio = time.perf_counter()
+    motivo = nombre = None
+    try:
+        # Un solo plazo para todos los pools.
+        # abandon_on_cancel: al vencer el plazo se responde ya, aunque el hilo siga esperando
+        with anyio.fail_after(READYZ_TIMEOUT_MS / 1000):
+            for nombre, motor in MOTORES.items():
+                await anyio.to_thread.run_sync(_select_1, motor, abandon_on_cancel=True)
+    except TimeoutError:
+        motivo = "db_timeout"
+    except Exception:
+        log.warning("readyz_db_error", exc_info=True, extra=campos(pool=nombre))
+        motivo = "db_error"
+    return motivo, (nombre if motivo else None), (time.perf_counter() - inicio) * 1000
+
+
+async def disponibilidad() -> tuple[int, dict]:
+    """(status HTTP, cuerpo JSON) de /readyz"""
+    pools = estado_pools()
+    db_ms = pool = None
+    agotados = [nombre for nombre in MOTORES if nombre in pools and _pool_agotado(pools[nombre])]
+    motivo = control_admision.sobrecarga() if control_admision.activo else None
+    if control_admision.cerrando:
+        motivo = "shutting_down"
+    elif not calentamiento.listo:
+        motivo = "warming_up"
+    elif motivo == "pool_wait":
+        pool = control_admision.pool_lento()
+    elif motivo is None and agotados:
+        motivo, pool = "pool_exhausted", agotados[0]
+    elif motivo is None:
+        motivo, pool, db_ms = await _comprobar_base()
+    cuerpo = {
+        "status": "ready" if motivo is None else "unavailable",
+        "reason": motivo,
+        "pool": pool,
+        "db_ms": None if db_ms is None else round(db_ms, 2),
+        "in_flight": control_admision.en_curso,
+        "pool_wait_ms": {nombre: round(espera.media_ms(), 2) for nombre, espera in esperas_pool.items()},
+        "pools": pools,
+    }
+    return (200 if motivo is None else 503), cuerpo
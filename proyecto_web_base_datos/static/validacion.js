@@ -0,0 +1,196 @@
+/*
+ * 🛡️ VALIDACIÓN EN EL NAVEGADOR A PARTIR DEL JSON SCHEMA DE PYDANTIC
+ *
+ * Cada formulario con el atributo data-esquema lleva el JSON Schema del modelo
+ * de Pydantic que lo valida en el servidor (model_json_schema()). Este script
+ * lee ese esquema y aplica las mismas reglas con los mismos mensajes antes de
+ * enviar el formulario, así la mayoría de los errores no necesitan ir al servidor.
+ *
+ * ⚠️ El servidor SIEMPRE vuelve a validar: esto es solo una ayuda para el usuario.
+ * Si el navegador no ejecuta JavaScript, el formulario funciona igual que antes.
+ *
+ * Reglas que entiende (las que generan nuestros modelos):
+ * - atributo required del <input> -> "Field required" (el HTML ya lo exigía)
+ * - minLength, maxLength, pattern -> textos (str)
+ * - minimum, maximum              -> números enteros (int)
+ * - format: "email"               -> los errores más comunes de EmailStr
+ * Los mensajes propios vienen en "errorMessage" (ver MensajeError en Python).
+ *
+ * Cómo se muestran los errores:
+ * - data-errores="lista": en la lista .alert-error del formulario
+ * - por defecto: un <div class="error"> debajo de cada campo
+ */
+(function () {
+    "use strict";
+
+    // 📝 Los mismos textos que devuelve Pydantic en el servidor
+    var MENSAJES = {
+        requerido: "Field required",
+        entero: "Input should be a valid integer, unable to parse string as an integer",
+        minLength: function (n) { return "String should have at least " + n + " characters"; },
+        maxLength: function (n) { return "String should have at most " + n + " characters"; },
+        pattern: function (p) { return "String should match pattern '" + p + "'"; },
+        minimum: function (n) { return "Input should be greater than or equal to " + n; },
+        maximum: function (n) { return "Input should be less than or equal to " + n; },
+        email: "value is not a valid email address: "
+    };
+
+    // Optional[str] aparece como {"anyOf": [{"type": "string"}, {"type": "null"}]}
+    function sinNulos(propiedad) {
+        if (!propiedad.anyOf) {
+            return propiedad;
+        }
+        for (var i = 0; i < propiedad.anyOf.length; i++) {
+            if (propiedad.anyOf[i].type !== "null") {
+                return propiedad.anyOf[i];
+            }
+        }
+        return propiedad;
+    }
+
+    function mensaje(propiedad, regla, porDefecto) {
+        return (propiedad.errorMessage && propiedad.errorMessage[regla]) || porDefecto;
+    }
+
+    // 📧 Solo los casos más comunes; el resto lo decide email-validator en el servidor
+    function errorEmail(valor) {
+        var arroba = valor.lastIndexOf("@");
+        if (arroba === -1) {
+            return MENSAJES.email + "An email address must have an @-sign.";
+        }
+        if (arroba === 0) {
+            return MENSAJES.email + "There must be something before the @-sign.";
+        }
+        if (arroba === valor.length - 1) {
+            return MENSAJES.email + "There must be something after the @-sign.";
+        }
+        if (valor.slice(arroba + 1).indexOf(".") === -1) {
+            return MENSAJES.email + "The part after the @-sign is not valid. It should have a period.";
+        }
+        return null;
+    }
+
+    function errorTexto(valor, propiedad) {
+        // Pydantic cuenta caracteres, no unidades UTF-16 (importa con emojis)
+        var largo = Array.from(valor).length;
+        if (propiedad.minLength !== undefined && largo < propiedad.minLength) {
+            return mensaje(propiedad, "minLength", MENSAJES.minLength(propiedad.minLength));
+        }
+        if (propiedad.maxLength !== undefined && largo > propiedad.maxLength) {
+            return mensaje(propiedad, "maxLength", MENSAJES.maxLength(propiedad.maxLength));
+        }
+        if (propiedad.pattern !== undefined && !new RegExp(propiedad.pattern, "u").test(valor)) {
+            return mensaje(propiedad, "pattern", MENSAJES.pattern(propiedad.pattern));
+        }
+        if (propiedad.format === "email") {
+            return errorEmail(valor);
+        }
+        return null;
+    }
+
+    function errorEntero(valor, propiedad) {
+        if (!/^\s*[-+]?\d+\s*$/.test(valor)) {
+            return MENSAJES.entero;
+        }
+        var numero = Number(valor);
+        if (propiedad.minimum !== undefined && numero < propiedad.minimum) {
+            return mensaje(propiedad, "minimum", MENSAJES.minimum(propiedad.minimum));
+        }
+        if (propiedad.maximum !== undefined && numero > propiedad.maximum) {
+            return mensaje(propiedad, "maximum", MENSAJES.maximum(propiedad.maximum));
+        }
+        return null;
+    }
+
+    function errorCampo(campo, propiedad) {
+        var valor = campo.value;
+        if (valor === "" && campo.required) {
+            return MENSAJES.requerido;
+        }
+        // Un campo opcional vacío llega como None: no hay reglas que aplicar
+        if (valor === "" && propiedad.anyOf) {
+            return null;
+        }
+        // Un texto vacío sí se valida: FastAPI se lo pasa a Pydantic tal cual
+        propiedad = sinNulos(propiedad);
+        if (propiedad.type === "string") {
+            return errorTexto(valor, propiedad);
+        }
+        if (propiedad.type === "integer") {
+            return errorEntero(valor, propiedad);
+        }
+        return null;
+    }
+
+    // 🔍 Valida solo los campos del esquema que están en el formulario
+    // (por ejemplo, al editar un usuario no hay campo de contraseña)
+    function validarFormulario(formulario, esquema) {
+        var errores = [];
+        Object.keys(esquema.properties || {}).forEach(function (nombre) {
+            var campo = formulario.elements[nombre];
+            if (!campo) {
+                return;
+            }
+            var error = errorCampo(campo, esquema.properties[nombre]);
+            if (error) {
+                errores.push({campo: campo, mensaje: error});
+            }
+        });
+        return errores;
+    }
+
+    function mostrarEnLista(formulario, errores) {
+        var alerta = formulario.querySelector(".alert-error");
+        if (!alerta) {
+            alerta = document.createElement("div");
+            alerta.className = "alert alert-error";
+            formulario.insertBefore(alerta, formulario.firstChild);
+        }
+        var lista = document.createElement("ul");
+        lista.style.margin = "0";
+        lista.style.paddingLeft = "1.5rem";
+        errores.forEach(function (error) {
+            var item = document.createElement("li");
+            item.textContent = error.mensaje;
+            lista.appendChild(item);
+        });
+        alerta.replaceChildren(lista);
+        Array.prototype.forEach.call(formulario.querySelectorAll(".form-control"), function (campo) {
+            campo.classList.remove("error");
+        });
+        errores.forEach(function (error) {
+            error.campo.classList.add("error");
+        });
+    }
+
+    function mostrarDebajo(formulario, errores) {
+        Array.prototype.forEach.call(formulario.querySelectorAll("div.error"), function (div) {
+            div.remove();
+        });
+        errores.forEach(function (error) {
+            var div = document.createElement("div");
+            div.className = "error";
+            div.textContent = "⚠️ " + error.mensaje;
+            error.campo.insertAdjacentElement("afterend", div);
+        });
+    }
+
+    Array.prototype.forEach.call(document.querySelectorAll("form[data-esquema]"), function (formulario) {
+        var esquema = JSON.parse(formulario.dataset.esquema);
+        // Nuestros mensajes sustituyen a los globos de validación del navegador
+        formulario.noValidate = true;
+        formulario.addEventListener("submit", function (evento) {
+            var errores = validarFormulario(formulario, esquema);
+            if (errores.length === 0) {
+                return;  // ✅ Todo bien: se envía y el servidor valida de nuevo
+            }
+            evento.preventDefault();
+            if (formulario.dataset.errores === "lista") {
+                mostrarEnLista(formulario, errores);
+            } else {
+                mostrarDebajo(formulario, errores);
+            }
+            errores[0].campo.focus();
+        });
+    });
+})();
@@ -0,0 +1,357 @@
+"""
+⏱️ BENCHMARKS DE VALIDACIÓN
+
+Mide cuántos registros por segundo podemos validar con distintas técnicas.
+No necesita el servidor: llama directamente a los modelos y a la app.
+
+Uso:
+    python benchmark.py            # ejecuta todos los benchmarks
+    python benchmark.py lote       # solo uno
+
+Benchmarks disponibles:
+- lote:     registros/s de la validación por lotes (/validate/batch)
+- modelos:  instancias/s y memoria de cada modelo, datos válidos e inválidos
+- comparar: @field_validator de Python vs restricciones de pydantic-core
+- perfil:   perfil con cProfile de las validaciones más costosas
+"""
+
+import contextlib
+import cProfile
+import csv
+import io
+import json
+import pstats
+import sys
+import time
+import tracemalloc
+from typing import Annotated, List
+
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, EmailStr, Field, ValidationError, field_validator
+
+import validacion_lote
+from main import app
+from modelos_pydantic import MensajeError, User
+
+# ejemplos_practica.py imprime sus ejemplos al importarse: los silenciamos
+with contextlib.redirect_stdout(io.StringIO()):
+    import ejemplos_practica as ej
+
+
+def generar_registros(cantidad: int, proporcion_invalidos: float = 0.1) -> list[dict]:
+    """Crea registros de prueba; una parte tiene email o contraseña inválidos"""
+    cada = int(1 / proporcion_invalidos) if proporcion_invalidos else 0
+    registros = []
+    for i in range(cantidad):
+        if cada and i % cada == 0:
+            registros.append({"email": f"usuario{i}", "password": "123"})
+        else:
+            registros.append({"email": f"usuario{i}@colegio.edu", "password": "contraseña123"})
+    return registros
+
+
+def reportar(nombre: str, cantidad: int, segundos: float):
+    print(f"  {nombre:<45} {cantidad / segundos:12,.0f} registros/s")
+
+
+def medir(funcion) -> float:
+    inicio = time.perf_counter()
+    funcion()
+    return time.perf_counter() - inicio
+
+
+def bench_lote(cantidad: int = 50_000):
+    """Un User por registro vs TypeAdapter(list[User]) vs el endpoint /validate/batch"""
+    print(f"📦 Validación por lotes ({cantidad:,} registros, 10% inválidos)")
+    registros = generar_registros(cantidad)
+    cuerpo = json.dumps(registros).encode()
+
+    def uno_por_uno():
+        for registro in registros:
+            try:
+                User(**registro)
+            except ValidationError:
+                pass
+
+    reportar("User(**registro) uno por uno", cantidad, medir(uno_por_uno))
+    reportar("TypeAdapter.validate_python", cantidad,
+             medir(lambda: validacion_lote.validar_bloque(registros)))
+    reportar("validar_json (from_json + validate_python)", cantidad,
+             medir(lambda: validacion_lote.validar_json(cuerpo)))
+    reportar("streaming por bloques", cantidad,
+             medir(lambda: list(validacion_lote.validar_en_streaming(registros))))
+
+    client = TestClient(app)
+    reportar("POST /validate/batch (JSON)", cantidad,
+             medir(lambda: client.post("/validate/batch", content=cuerpo,
+                                       headers={"content-type": "application/json"})))
+    ndjson = "\n".join(json.dumps(r) for r in registros)
+    reportar("POST /validate/batch (archivo NDJSON)", cantidad,
+             medir(lambda: client.post("/validate/batch",
+                                       files={"archivo": ("usuarios.ndjson", ndjson)})))
+
+    # 💥 Archivos que dejan de poderse leer a mitad: el 200 ya salió, el error va en el cuerpo
+    csv_valido = "email,password\n" + "".join(f"ana{i}@colegio.edu,contraseña123\n" for i in range(3000))
+    casos = {
+        "CSV con bytes que no son UTF-8": ("usuarios.csv", csv_valido.encode() + b"\xff\xfe,x\n", None, 3000),
+        "CSV con un campo enorme": ("usuarios.csv", csv_valido + '"' + "x" * (csv.field_size_limit() + 1) + '"\n', None, 3000),
+        "NDJSON en streaming sin UTF-8": (None, ndjson.encode() + b"\n\xff\xfe\n", "application/x-ndjson", cantidad),
+    }
+    for caso, (nombre, contenido, tipo, leidos) in casos.items():
+        if tipo is None:
+            respuesta = client.post("/validate/batch", files={"archivo": (nombre, contenido)})
+        else:
+            respuesta = client.post("/validate/batch", content=contenido, headers={"content-type": tipo})
+        *_, linea_error, resumen = [json.loads(linea) for linea in respuesta.text.splitlines()]
+        assert respuesta.status_code == 200 and resumen["completo"] is False, (caso, respuesta.text[-300:])
+        # Todos los registros anteriores a la línea ilegible se validan
+        assert "archivo" in linea_error["errores"] and linea_error["indice"] == resumen["total"] == leidos, (caso, linea_error)
+        print(f"  ✅ {caso}: línea de error en el registro {linea_error['indice']} y resumen con completo=false")
+    resumen = json.loads(client.post(
+        "/validate/batch", files={"archivo": ("usuarios.csv", csv_valido)}
+    ).text.splitlines()[-1])
+    assert resumen == {"total": 3000, "validos": 3000, "invalidos": 0, "completo": True}, resumen
+
+    # 📊 CSV exportado desde Excel / LibreOffice: empieza con un BOM
+    for nombre, contenido in (("usuarios.csv", csv_valido), ("usuarios.ndjson", ndjson)):
+        sin_bom, con_bom = (
+            client.post("/validate/batch", files={"archivo": (nombre, prefijo + contenido)}).text
+            for prefijo in ("", "\ufeff")
+        )
+        assert con_bom == sin_bom, (nombre, con_bom[-300:])
+    print("  ✅ archivos con BOM: la cabecera se lee bien y cada registro se valida normalmente")
+
+
+# ========== INSTANCIAS POR SEGUNDO Y MEMORIA POR MODELO ==========
+
+DIRECCION = {"calle": "Av. Principal", "numero": 123, "ciudad": "Madrid", "codigo_postal": "28001"}
+
+# (modelo, datos válidos, datos inválidos): el caso inválido falla en el validador personalizado
+CASOS_MODELOS = [
+    ("User", User,
+     {"email": "ana@colegio.edu", "password": "contraseña123"},
+     {"email": "ana@colegio.edu", "password": "123"}),
+    ("Estudiante", ej.Estudiante,
+     {"nombre": "Ana", "edad": 16, "email": "ana@colegio.edu"},
+     {"nombre": "Ana", "edad": "dieciséis", "email": "ana@colegio.edu"}),
+    ("Usuario", ej.Usuario,
+     {"nombre": "maria", "edad": 15, "email": "maria@test.com", "telefono": "1234-5678"},
+     {"nombre": "maria", "edad": 12, "email": "maria@test.com", "telefono": "1234-5678"}),
+    ("Direccion", ej.Direccion, DIRECCION, {**DIRECCION, "codigo_postal": "280"}),
+    ("EstudianteCompleto", ej.EstudianteCompleto,
+     {"nombre": "Carlos", "apellido": "López", "edad": 17, "email": "carlos@colegio.edu",
+      "direccion": DIRECCION, "curso": "tercero", "fecha_inscripcion": "2024-01-15"},
+     {"nombre": "Carlos", "apellido": "López", "edad": 17, "email": "carlos@colegio.edu",
+      "direccion": {**DIRECCION, "codigo_postal": "280"}, "curso": "tercero",
+      "fecha_inscripcion": "2024-01-15"}),
+    ("EstudianteConMaterias", ej.EstudianteConMaterias,
+     {"nombre": "Laura", "email": "laura@colegio.edu",
+      "materias": [{"nombre": "Matemáticas", "creditos": 5}, {"nombre": "Historia", "creditos": 3}]},
+     {"nombre": "Laura", "email": "laura@colegio.edu", "materias": []}),
+]
+
+
+def instancias_por_segundo(modelo, datos: dict, repeticiones: int, rondas: int = 3) -> float:
+    """La mejor de varias rondas: así el ruido de la máquina afecta menos"""
+    validar = modelo.model_validate
+    mejor = float("inf")
+    for _ in range(rondas):
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            try:
+                validar(datos)
+            except ValidationError:
+                pass
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return repeticiones / mejor
+
+
+def memoria_por_validacion(modelo, datos: dict, repeticiones: int = 1000) -> tuple[float, int]:
+    """
+    Devuelve (bytes retenidos por instancia, pico de bytes de una validación).
+    Los retenidos miden el tamaño del objeto creado; el pico incluye lo temporal.
+    """
+    validar = modelo.model_validate
+    tracemalloc.start()
+    instancias = []
+    for _ in range(repeticiones):
+        try:
+            instancias.append(validar(datos))
+        except ValidationError:
+            pass
+    retenidos, _ = tracemalloc.get_traced_memory()
+    instancias.clear()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    try:
+        validar(datos)
+    except ValidationError:
+        pass
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return retenidos / repeticiones, pico - base
+
+
+def bench_modelos(repeticiones: int = 5_000):
+    """Instancias por segundo y memoria de cada modelo, con datos válidos e inválidos"""
+    print(f"🏗️ Modelos ({repeticiones:,} validaciones por caso)")
+    print(f"  {'modelo':<24}{'caso':<10}{'instancias/s':>14}{'bytes/instancia':>17}{'pico bytes':>12}")
+    for nombre, modelo, validos, invalidos in CASOS_MODELOS:
+        for caso, datos in (("válido", validos), ("inválido", invalidos)):
+            velocidad = instancias_por_segundo(modelo, datos, repeticiones)
+            retenidos, pico = memoria_por_validacion(modelo, datos)
+            print(f"  {nombre:<24}{caso:<10}{velocidad:>14,.0f}{retenidos:>17,.0f}{pico:>12,}")
+
+
+# ========== VALIDADOR DE PYTHON VS RESTRICCIÓN DECLARATIVA ==========
+# Cada par valida la misma regla: con un @field_validator (código Python que
+# se ejecuta por cada instancia) o con una restricción que aplica pydantic-core.
+# Con MensajeError el error es idéntico: lo comprobamos antes de medir.
+
+class PasswordPython(BaseModel):
+    password: str
+
+    @field_validator('password')
+    @classmethod
+    def validar(cls, v):
+        if len(v) < 8:
+            raise ValueError('La contraseña debe tener al menos 8 caracteres.')
+        return v
+
+class PasswordCore(BaseModel):
+    password: Annotated[str, MensajeError(
+        'password_corta', 'La contraseña debe tener al menos 8 caracteres.', min_length=8
+    )]
+
+
+class EdadPython(BaseModel):
+    edad: int
+
+    @field_validator('edad')
+    @classmethod
+    def validar(cls, v):
+        if v < 13 or v > 100:
+            raise ValueError('La edad debe estar entre 13 y 100 años')
+        return v
+
+class EdadCore(BaseModel):
+    edad: Annotated[int, MensajeError(
+        'edad_fuera_de_rango', 'La edad debe estar entre 13 y 100 años', ge=13, le=100
+    )]
+
+
+class CodigoPostalPython(BaseModel):
+    codigo_postal: str
+
+    @field_validator('codigo_postal')
+    @classmethod
+    def validar(cls, v):
+        if not v.isdigit() or len(v) != 5:
+            raise ValueError('Código postal debe tener exactamente 5 dígitos')
+        return v
+
+class CodigoPostalCore(BaseModel):
+    codigo_postal: Annotated[str, MensajeError(
+        'codigo_postal_invalido', 'Código postal debe tener exactamente 5 dígitos',
+        pattern=r'^\d{5}$',
+    )]
+
+
+class MateriasPython(BaseModel):
+    materias: List[str]
+
+    @field_validator('materias')
+    @classmethod
+    def validar(cls, v):
+        if len(v) == 0 or len(v) > 8:
+            raise ValueError('Entre 1 y 8 materias')
+        return v
+
+class MateriasCore(BaseModel):
+    materias: Annotated[List[str], MensajeError(
+        'materias_fuera_de_rango', 'Entre 1 y 8 materias', min_length=1, max_length=8
+    )]
+
+
+class EmailValidator(BaseModel):
+    email: EmailStr
+
+class EmailPatron(BaseModel):
+    # Solo comprueba la forma usuario@dominio.ext: no sustituye a EmailStr,
+    # sirve para ver cuánto cuesta llamar a email-validator en cada valor
+    email: str = Field(pattern=r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+PARES_COMPARACION = [
+    ("password (longitud)", PasswordPython, PasswordCore,
+     {"password": "contraseña123"}, {"password": "123"}),
+    ("edad (rango)", EdadPython, EdadCore, {"edad": 16}, {"edad": 12}),
+    ("codigo_postal (regex)", CodigoPostalPython, CodigoPostalCore,
+     {"codigo_postal": "28001"}, {"codigo_postal": "280"}),
+    ("materias (largo de lista)", MateriasPython, MateriasCore,
+     {"materias": ["Matemáticas", "Historia"]}, {"materias": []}),
+    ("email (EmailStr vs patrón)", EmailValidator, EmailPatron,
+     {"email": "ana@colegio.edu"}, {"email": "ana.colegio.edu"}),
+]
+
+
+def errores(modelo, datos: dict) -> list[tuple]:
+    """(loc, msg, input) de cada error: lo que ven main.py y las respuestas 422"""
+    try:
+        modelo.model_validate(datos)
+    except ValidationError as e:
+        return [(error['loc'], error['msg'], error['input']) for error in e.errors()]
+    return []
+
+
+def bench_comparar(repeticiones: int = 50_000):
+    """Mismo modelo con @field_validator de Python vs restricción de pydantic-core"""
+    print(f"⚖️  Validador de Python vs restricción declarativa ({repeticiones:,} validaciones)")
+    print(f"  {'regla':<28}{'caso':<10}{'python/s':>12}{'core/s':>12}{'ganancia':>10}")
+    for regla, python, core, validos, invalidos in PARES_COMPARACION:
+        if core is not EmailPatron:
+            # El patrón de email es otra regla; el resto debe fallar exactamente igual
+            for datos in (validos, invalidos):
+                assert errores(python, datos) == errores(core, datos), f"{regla}: errores distintos"
+        for caso, datos in (("válido", validos), ("inválido", invalidos)):
+            v_python = instancias_por_segundo(python, datos, repeticiones)
+            v_core = instancias_por_segundo(core, datos, repeticiones)
+            print(f"  {regla:<28}{caso:<10}{v_python:>12,.0f}{v_core:>12,.0f}{v_core / v_python:>9.2f}x")
+
+
+def bench_perfil(repeticiones: int = 5_000):
+    """Perfil con cProfile: dónde se va el tiempo al validar User y EstudianteCompleto"""
+    for nombre, modelo, validos, _ in CASOS_MODELOS:
+        if nombre not in ("User", "EstudianteCompleto"):
+            continue
+        print(f"🔬 Perfil de {nombre} ({repeticiones:,} validaciones)")
+        perfil = cProfile.Profile()
+        perfil.enable()
+        for _ in range(repeticiones):
+            modelo.model_validate(validos)
+        perfil.disable()
+        salida = io.StringIO()
+        pstats.Stats(perfil, stream=salida).sort_stats("tottime").print_stats(8)
+        print("\n".join("  " + linea for linea in salida.getvalue().strip().splitlines()[-12:]))
+
+
+BENCHMARKS = {
+    "lote": bench_lote,
+    "modelos": bench_modelos,
+    "comparar": bench_comparar,
+    "perfil": bench_perfil,
+}
+
+
+def main():
+    nombres = sys.argv[1:] or list(BENCHMARKS)
+    for nombre in nombres:
+        if nombre not in BENCHMARKS:
+            print(f"❌ Benchmark desconocido: {nombre}. Opciones: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+        BENCHMARKS[nombre]()
+        print("")
+
+
+if __name__ == "__main__":
+    main()
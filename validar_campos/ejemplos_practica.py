@@ -9,9 +9,13 @@ practiquen y experimenten con Pydantic y validación de datos.
 """
 
 from pydantic import BaseModel, EmailStr, field_validator, ValidationError
-from typing import Optional, Literal, List
+from typing import Annotated, Optional, Literal, List
 from datetime import date
 
+# Restricciones que comprueba pydantic-core con nuestros propios mensajes
+# (ver la explicación en modelos_pydantic.py)
+from modelos_pydantic import MensajeError
+
 
 # ========== EJEMPLO 1: MODELO BÁSICO ==========
 print("🔍 EJEMPLO 1: Validación básica")
@@ -54,9 +58,18 @@ print("=" * 50)
 class Usuario(BaseModel):
     """Usuario con validaciones más complejas"""
     nombre: str
-    edad: int
+    # La edad debe estar entre 13 y 100 años: una restricción por cada mensaje
+    edad: Annotated[
+        int,
+        MensajeError('edad_minima', 'Debes tener al menos 13 años', ge=13),
+        MensajeError('edad_maxima', 'La edad no puede ser mayor a 100 años', le=100),
+    ]
     email: EmailStr
-    telefono: Optional[str] = None
+    # Al menos 8 dígitos; se permiten espacios y guiones entre ellos
+    telefono: Optional[Annotated[str, MensajeError(
+        'telefono_invalido', 'Teléfono debe tener al menos 8 dígitos',
+        pattern=r'^[ -]*(\d[ -]*){8,}$',
+    )]] = None
     
     @field_validator('nombre')
     @classmethod
@@ -66,27 +79,13 @@ class Usuario(BaseModel):
             raise ValueError('El nombre debe tener al menos 2 caracteres')
         return v.strip().title()  # Capitaliza el nombre
     
-    @field_validator('edad')
-    @classmethod
-    def validar_edad(cls, v):
-        """La edad debe estar entre 13 y 100 años"""
-        if v < 13:
-            raise ValueError('Debes tener al menos 13 años')
-        if v > 100:
-            raise ValueError('La edad no puede ser mayor a 100 años')
-        return v
-    
     @field_validator('telefono')
     @classmethod
-    def validar_telefono(cls, v):
-        """Teléfono debe tener formato básico"""
+    def limpiar_telefono(cls, v):
+        """El formato ya lo validó el patrón: aquí solo quitamos espacios y guiones"""
         if v is None:
             return v
-        # Remover espacios y guiones
-        telefono_limpio = v.replace(' ', '').replace('-', '')
-        if not telefono_limpio.isdigit() or len(telefono_limpio) < 8:
-            raise ValueError('Teléfono debe tener al menos 8 dígitos')
-        return telefono_limpio
+        return v.replace(' ', '').replace('-', '')
 
 # Pruebas
 casos_prueba = [
@@ -116,15 +115,11 @@ class Direccion(BaseModel):
     calle: str
     numero: int
     ciudad: str
-    codigo_postal: str
-    
-    @field_validator('codigo_postal')
-    @classmethod
-    def validar_codigo_postal(cls, v):
-        """Código postal debe tener 5 dígitos"""
-        if not v.isdigit() or len(v) != 5:
-            raise ValueError('Código postal debe tener exactamente 5 dígitos')
-        return v
+    # Código postal debe tener 5 dígitos
+    codigo_postal: Annotated[str, MensajeError(
+        'codigo_postal_invalido', 'Código postal debe tener exactamente 5 dígitos',
+        pattern=r'^\d{5}$',
+    )]
 
 class EstudianteCompleto(BaseModel):
     """Estudiante con información más completa"""
@@ -175,29 +170,20 @@ print("=" * 50)
 class Materia(BaseModel):
     """Modelo para materias"""
     nombre: str
-    creditos: int
-    
-    @field_validator('creditos')
-    @classmethod
-    def validar_creditos(cls, v):
-        if v <= 0 or v > 10:
-            raise ValueError('Los créditos deben estar entre 1 y 10')
-        return v
+    creditos: Annotated[int, MensajeError(
+        'creditos_fuera_de_rango', 'Los créditos deben estar entre 1 y 10', ge=1, le=10
+    )]
 
 class EstudianteConMaterias(BaseModel):
     """Estudiante con lista de materias"""
     nombre: str
     email: EmailStr
-    materias: List[Materia]  # Lista de objetos Materia
-    
-    @field_validator('materias')
-    @classmethod
-    def validar_materias(cls, v):
-        if len(v) == 0:
-            raise ValueError('El estudiante debe tener al menos una materia')
-        if len(v) > 8:
-            raise ValueError('El estudiante no puede tener más de 8 materias')
-        return v
+    # Lista de objetos Materia, de 1 a 8 elementos
+    materias: Annotated[
+        List[Materia],
+        MensajeError('sin_materias', 'El estudiante debe tener al menos una materia', min_length=1),
+        MensajeError('demasiadas_materias', 'El estudiante no puede tener más de 8 materias', max_length=8),
+    ]
 
 # Ejemplo con lista de materias
 try:
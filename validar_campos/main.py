@@ -27,7 +27,10 @@ from pydantic import ValidationError
 # - FastAPI: La clase principal para crear nuestra aplicación
 # - Request: Representa la petición HTTP que llega al servidor
 # - Form: Indica que un parámetro viene de un formulario HTML
-from fastapi import FastAPI, Request, Form
+from fastapi import FastAPI, Request, Form, File, UploadFile, HTTPException
+
+# 🌊 Respuestas especiales: StreamingResponse envía el resultado por partes
+from fastapi.responses import StreamingResponse
 
 # 🎨 Jinja2Templates: Nos permite usar plantillas HTML dinámicas
 # Con esto podemos insertar datos de Python dentro de nuestro HTML
@@ -40,8 +43,20 @@ from fastapi.staticfiles import StaticFiles
 # Este modelo define qué datos esperamos del usuario y cómo validarlos
 from modelos_pydantic import User
 
+# 📝 Logging que no bloquea el servidor (ver registro.py)
+import logging
+from registro import campos, configurar_logging
+
+# 📦 Validación de muchos usuarios a la vez (ver validacion_lote.py)
+import json
+import validacion_lote
+
 # ========== CONFIGURACIÓN DE LA APLICACIÓN ==========
 
+# 📝 Los eventos se escriben en JSON desde otro hilo, nunca desde el event loop
+configurar_logging()
+log = logging.getLogger("app.login")
+
 # 🏗️ Creamos nuestra aplicación FastAPI
 # - title: El nombre de nuestra aplicación
 # - version: La versión actual
@@ -58,6 +73,15 @@ app = FastAPI(
 # datos de Python (como mensajes de error) dentro del HTML
 templates = Jinja2Templates(directory="templates")
 
+# 🧾 JSON SCHEMA DE LOS MODELOS
+# Pydantic puede describir las reglas de un modelo en formato JSON Schema.
+# Lo calculamos una sola vez y lo usamos en dos sitios:
+# - GET /schemas/{nombre}: para quien quiera consultarlo
+# - data-esquema del formulario: static/validacion.js lo lee y valida en el navegador
+ESQUEMAS = {"User": User.model_json_schema()}
+ESQUEMAS_JSON = {nombre: json.dumps(esquema, ensure_ascii=False) for nombre, esquema in ESQUEMAS.items()}
+templates.env.globals["esquema_json"] = ESQUEMAS_JSON.__getitem__
+
 # 📁 Montamos la carpeta de archivos estáticos
 # Esto permite que el navegador acceda a nuestros archivos CSS
 # Cuando escribas "/static/archivo.css" en HTML, FastAPI buscará en la carpeta "static"
@@ -131,12 +155,10 @@ async def procesar_login(
         usuario = User(email=email, password=password)
         
         # ✅ Si llegamos aquí, significa que los datos son válidos
-        print(f"✅ Usuario válido creado: {usuario.email}")  # Para depuración
+        log.info("login_valido", extra=campos(email=usuario.email))
         
     except ValidationError as e:
         # 🚨 MANEJO DE ERRORES: Si Pydantic encuentra datos inválidos
-        print(f"❌ Error de validación detectado: {e}")  # Para depuración
-        
         # 📋 Procesamos los errores para mostrarlos de forma amigable
         errors = {}
         for error in e.errors():
@@ -146,7 +168,8 @@ async def procesar_login(
             mensaje_error = error['msg']
             errors[campo_con_error] = mensaje_error
             
-        print(f"📋 Errores procesados: {errors}")  # Para depuración
+        # 🔍 Para depuración: solo los mensajes, nunca la contraseña que escribió el usuario
+        log.debug("login_invalido", extra=campos(email=email, campos_con_error=list(errors)))
         
         # 🔄 Devolvemos el formulario con los errores para que el usuario los vea
         return templates.TemplateResponse(
@@ -159,4 +182,84 @@ async def procesar_login(
     return templates.TemplateResponse(
         "everythingok.html", 
         {"request": request}
-    )
\ No newline at end of file
+    )
+
+
+# 🧾 RUTA DEL JSON SCHEMA - Las mismas reglas que usa Pydantic, en JSON
+@app.get("/schemas/{nombre}")
+async def obtener_esquema(nombre: str):
+    """📄 Devuelve el JSON Schema de un modelo (por ejemplo /schemas/User)"""
+    if nombre not in ESQUEMAS:
+        raise HTTPException(status_code=404, detail=f"No existe el esquema {nombre}")
+    return ESQUEMAS[nombre]
+
+
+class StreamingMientrasLlega(StreamingResponse):
+    """
+    🔁 StreamingResponse que puede leer el cuerpo de la petición mientras responde
+
+    StreamingResponse normal (con servidores ASGI < 2.4, como uvicorn) escucha
+    receive() en paralelo para enterarse de si el cliente se desconecta, y así
+    se come los trozos del cuerpo que todavía no hemos leído. Aquí no escucha:
+    si el cliente se va, request.stream() lanza ClientDisconnect y el
+    generador termina.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+# 📦 RUTA DE VALIDACIÓN POR LOTES - Valida miles de usuarios en una sola petición
+# Acepta tres formas de enviar los datos:
+# - Content-Type: application/json    -> una lista JSON de usuarios
+# - Content-Type: application/x-ndjson -> un usuario JSON por línea
+# - Un archivo subido en el campo "archivo" (.csv con cabecera email,password, o NDJSON)
+@app.post("/validate/batch")
+async def validar_lote(
+    request: Request,
+    archivo: Annotated[UploadFile | None, File()] = None
+):
+    """
+    📋 Valida muchos usuarios y devuelve los errores de cada registro.
+
+    Los errores tienen la misma forma que en procesar_login, pero agrupados
+    por la posición del registro: {indice: {"email": "...", "password": "..."}}
+
+    Retorna (con las mismas claves en los dos formatos):
+    - JSON: {"total", "validos", "invalidos", "completo", "errores"}
+    - NDJSON y archivos: una línea {"indice", "errores"} por registro inválido
+      y una línea final {"total", "validos", "invalidos", "completo"}. Si el
+      archivo no se puede leer hasta el final, antes del resumen llega una línea
+      {"indice", "errores": {"archivo": ...}} y "completo" es false
+    """
+    # 📁 ARCHIVO SUBIDO: ya está guardado en un archivo temporal, así que lo
+    # leemos línea a línea y enviamos los resultados a medida que se validan
+    if archivo is not None:
+        texto = validacion_lote.lineas_de_archivo(archivo.file)
+        es_csv = (archivo.filename or "").endswith(".csv") or archivo.content_type == "text/csv"
+        registros = validacion_lote.leer_csv(texto) if es_csv else validacion_lote.leer_ndjson(texto)
+        return StreamingResponse(
+            validacion_lote.validar_en_streaming(registros),
+            media_type="application/x-ndjson"
+        )
+
+    tipo = request.headers.get("content-type", "").split(";")[0].strip()
+
+    # 🌊 NDJSON: leemos el cuerpo por trozos mientras llega y enviamos los
+    # resultados de cada bloque en cuanto están: la memoria no crece con la entrada.
+    # La respuesta solo contiene los registros inválidos y el resumen.
+    if tipo in ("application/x-ndjson", "application/jsonl"):
+        lineas = validacion_lote.lineas_de_stream(request.stream())
+        return StreamingMientrasLlega(
+            validacion_lote.validar_en_streaming_async(lineas),
+            media_type="application/x-ndjson"
+        )
+
+    # 📄 JSON: pydantic-core lee la lista una sola vez y la validamos entera
+    try:
+        return validacion_lote.validar_json(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"El cuerpo debe ser una lista JSON: {e}")
+
@@ -17,7 +17,72 @@ Pydantic se encarga automáticamente de validar que los datos cumplan con las re
 """
 
 # ========== IMPORTACIONES ==========
-from pydantic import BaseModel, EmailStr, field_validator
+from typing import Annotated
+
+from pydantic import BaseModel, EmailStr
+from pydantic_core import core_schema
+
+
+# ========== RESTRICCIONES CON MENSAJE PROPIO ==========
+class MensajeError:
+    """
+    ⚡ Restricción que comprueba pydantic-core (en Rust) con NUESTRO mensaje de error
+
+    Un @field_validator es una función de Python que se llama por cada campo de
+    cada instancia. Las restricciones como Field(min_length=8) o Field(ge=13) las
+    comprueba pydantic-core sin volver a Python, pero su mensaje es en inglés
+    ("String should have at least 8 characters").
+
+    MensajeError junta lo mejor de las dos cosas:
+        password: Annotated[str, MensajeError('password_corta', 'Mínimo 8 caracteres', min_length=8)]
+
+    - tipo: el 'type' del error (un tipo propio, como 'password_corta')
+    - mensaje: el texto que verá el usuario, igual que con raise ValueError(...)
+    - restricciones: las de pydantic-core (min_length, max_length, pattern, ge, le...)
+
+    Primero se valida el tipo normal (un texto que no es número sigue dando el error
+    de siempre) y después la restricción; solo ese segundo paso usa nuestro mensaje.
+    Se pueden poner varias en el mismo campo, cada una con su mensaje.
+    """
+
+    # Restricción de pydantic-core -> palabra clave de JSON Schema, según el tipo
+    JSON_SCHEMA = {
+        "string": {"min_length": "minLength", "max_length": "maxLength", "pattern": "pattern"},
+        "integer": {"ge": "minimum", "le": "maximum", "gt": "exclusiveMinimum", "lt": "exclusiveMaximum"},
+        "array": {"min_length": "minItems", "max_length": "maxItems"},
+    }
+
+    def __init__(self, tipo: str, mensaje: str, **restricciones):
+        self.tipo = tipo
+        self.mensaje = mensaje
+        self.restricciones = restricciones
+
+    def __get_pydantic_core_schema__(self, source, handler):
+        esquema = handler(source)
+        # Si el campo ya tenía otro MensajeError, añadimos un paso más a su cadena
+        pasos = esquema["steps"] if esquema["type"] == "chain" else [esquema]
+        restringido = {"type": pasos[0]["type"], **self.restricciones}
+        return core_schema.chain_schema([
+            *pasos,
+            core_schema.custom_error_schema(
+                restringido,
+                custom_error_type=self.tipo,
+                # Mismo texto que produce Pydantic con raise ValueError(mensaje)
+                custom_error_message=f"Value error, {self.mensaje}",
+            ),
+        ])
+
+    def __get_pydantic_json_schema__(self, esquema, handler):
+        # Publicamos las restricciones y sus mensajes en el JSON Schema: así la
+        # documentación y la validación en el navegador usan las mismas reglas
+        json_schema = handler(esquema)
+        claves = self.JSON_SCHEMA.get(json_schema.get("type"), {})
+        for nombre, valor in self.restricciones.items():
+            if nombre in claves:
+                json_schema[claves[nombre]] = valor
+                # Mensaje por palabra clave (convención "errorMessage" de ajv-errors)
+                json_schema.setdefault("errorMessage", {})[claves[nombre]] = f"Value error, {self.mensaje}"
+        return json_schema
 
 
 # ========== MODELO DE USUARIO ==========
@@ -41,41 +106,22 @@ class User(BaseModel):
     # - Automáticamente lanza un error si el formato es incorrecto
     email: EmailStr
     
-    # 🔐 CAMPO PASSWORD - Campo de texto obligatorio
+    # 🔐 CAMPO PASSWORD - Campo de texto obligatorio de al menos 8 caracteres
     # str significa que esperamos una cadena de texto
     # Este campo es obligatorio (si no se proporciona, Pydantic lanza un error)
-    password: str
+    #
+    # 🛡️ La regla de longitud la comprueba pydantic-core con min_length=8,
+    # sin llamar a una función de Python por cada usuario, pero con nuestro mensaje
+    # (antes era un @field_validator; el mensaje de error es exactamente el mismo)
+    password: Annotated[str, MensajeError(
+        'password_corta', '❌ La contraseña debe tener al menos 8 caracteres.', min_length=8
+    )]
     
     # ========== VALIDACIONES PERSONALIZADAS ==========
     
-    # 🛡️ VALIDADOR PERSONALIZADO - Reglas adicionales para la contraseña
-    # @field_validator nos permite crear reglas de validación personalizadas
-    # En este caso, validamos que la contraseña tenga al menos 8 caracteres
-    @field_validator('password')
-    @classmethod  # Agregamos @classmethod para mejor práctica
-    def validar_longitud_password(cls, valor_password):
-        """
-        🔍 Valida que la contraseña tenga al menos 8 caracteres
-        
-        Parámetros:
-        - cls: La clase (User) - no lo usamos pero es requerido
-        - valor_password: El valor de la contraseña que escribió el usuario
-        
-        Retorna:
-        - El valor de la contraseña si es válido
-        
-        Lanza:
-        - ValueError si la contraseña es muy corta
-        """
-        # Verificamos la longitud de la contraseña
-        if len(valor_password) < 8:
-            # Si es muy corta, lanzamos un error con un mensaje claro
-            raise ValueError('❌ La contraseña debe tener al menos 8 caracteres.')
-        
-        # Si la validación pasa, devolvemos el valor (esto es importante)
-        return valor_password
-    
     # 💡 EJEMPLO DE VALIDACIÓN ADICIONAL (comentado para que veas cómo agregar más)
+    # Cuando la regla no se puede expresar como restricción (longitud, rango,
+    # patrón...) usamos un @field_validator, que es código Python normal:
     # @field_validator('password')
     # @classmethod
     # def validar_password_segura(cls, valor_password):
@@ -97,7 +143,7 @@ class User(BaseModel):
    usuario = User(email=email, password=password)
 4. Pydantic automáticamente valida:
    - Que el email tenga formato válido (gracias a EmailStr)
-   - Que la contraseña tenga al menos 8 caracteres (gracias a nuestro validador)
+   - Que la contraseña tenga al menos 8 caracteres (gracias a MensajeError)
 5. Si todo está bien, se crea el objeto User sin problemas
 6. Si algo está mal, Pydantic lanza un ValidationError con detalles del error
 7. En main.py capturamos ese error y se lo mostramos al usuario
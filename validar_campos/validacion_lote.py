@@ -0,0 +1,236 @@
+"""
+🎓 VALIDACIÓN POR LOTES - MUCHOS USUARIOS A LA VEZ
+
+En main.py validamos UN usuario por cada envío del formulario. Cuando hay que
+importar miles de pares email/contraseña, crear un User por registro es lento.
+
+¿Qué hacemos aquí?
+- Construimos UNA sola vez un TypeAdapter(list[User]) que valida listas enteras
+- Validamos los registros en bloques (así la memoria no crece con el archivo)
+- Devolvemos los errores por índice y campo, con la misma forma que procesar_login:
+  {indice: {"email": "mensaje", "password": "mensaje"}}
+- Los dos tipos de respuesta usan las mismas claves:
+  JSON    -> {"total", "validos", "invalidos", "completo", "errores": {indice: {...}}}
+  NDJSON  -> una línea {"indice", "errores"} por registro inválido y al final
+             {"total", "validos", "invalidos", "completo"}
+- Si el archivo deja de poderse leer a mitad (bytes que no son UTF-8, una fila
+  que el módulo csv no entiende), la respuesta NDJSON ya empezó con un 200: el
+  error llega como una línea más {"indice": n, "errores": {"archivo": ...}}, los
+  registros desde el n no se validan y el resumen lleva "completo": false
+
+Formatos de entrada soportados:
+- JSON: una lista de objetos [{"email": ..., "password": ...}, ...]
+- NDJSON: un objeto JSON por línea
+- CSV: con cabecera email,password
+"""
+
+# ========== IMPORTACIONES ==========
+import codecs
+import csv
+import json
+from typing import AsyncIterator, BinaryIO, Iterable, Iterator
+
+import pydantic_core
+from pydantic import TypeAdapter, ValidationError
+
+from modelos_pydantic import User
+
+# ========== CONFIGURACIÓN ==========
+
+# 🏗️ El TypeAdapter se construye una vez al importar el módulo.
+# Construirlo en cada petición costaría más que validar los datos.
+validador_lote = TypeAdapter(list[User])
+
+# 📦 Cuántos registros se validan de una vez en modo streaming
+TAMANO_BLOQUE = 1000
+
+# 💥 Errores al leer el archivo a mitad: se informan dentro de la respuesta
+ERRORES_LECTURA = (UnicodeDecodeError, csv.Error)
+
+
+# ========== ERRORES ==========
+
+def errores_por_registro(e: ValidationError, desplazamiento: int = 0) -> dict[int, dict[str, str]]:
+    """
+    🔍 Convierte los errores de Pydantic en {indice: {campo: mensaje}}
+
+    Al validar una lista, error['loc'] es (indice, campo) en lugar de (campo,).
+    Si el registro entero es inválido (por ejemplo no es un objeto), loc solo
+    tiene el índice y usamos el campo "registro".
+    """
+    errores: dict[int, dict[str, str]] = {}
+    for error in e.errors():
+        loc = error['loc']
+        indice = loc[0] + desplazamiento
+        campo = loc[1] if len(loc) > 1 else "registro"
+        errores.setdefault(indice, {})[campo] = error['msg']
+    return errores
+
+
+def validar_bloque(registros: list, desplazamiento: int = 0) -> dict[int, dict[str, str]]:
+    """Valida una lista de registros y devuelve solo los que tienen errores"""
+    try:
+        validador_lote.validate_python(registros)
+    except ValidationError as e:
+        return errores_por_registro(e, desplazamiento)
+    return {}
+
+
+def validar_json(cuerpo: bytes) -> dict:
+    """
+    ⚡ Valida un arreglo JSON completo
+
+    pydantic_core.from_json lee el cuerpo UNA sola vez (en Rust, más rápido
+    que json.loads) y de esa misma lista salen el total y los errores.
+    Lanza ValueError si el cuerpo no es un arreglo JSON.
+    """
+    registros = pydantic_core.from_json(cuerpo)
+    if not isinstance(registros, list):
+        # No hay registros que numerar
+        raise ValueError("se esperaba un arreglo")
+    errores = validar_bloque(registros)
+    return {**_contadores(len(registros), len(errores)), "errores": errores}
+
+
+# ========== LECTURA INCREMENTAL ==========
+
+def leer_ndjson(lineas: Iterable[str]) -> Iterator:
+    """
+    📄 Un registro por línea. Una línea mal formada se devuelve como texto:
+    al validarla Pydantic la marca como inválida con su número de registro.
+    """
+    for linea in lineas:
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            yield json.loads(linea)
+        except json.JSONDecodeError:
+            yield linea
+
+
+def leer_csv(lineas: Iterable[str]) -> Iterator[dict]:
+    """📊 CSV con cabecera; cada fila se convierte en {"email": ..., "password": ...}"""
+    yield from csv.DictReader(lineas)
+
+
+def lineas_de_archivo(archivo: BinaryIO) -> Iterator[str]:
+    """
+    📁 Decodifica el archivo subido línea a línea (con su fin de línea, como
+    espera el módulo csv): un byte que no es UTF-8 solo corta desde su línea.
+    La primera se decodifica con utf-8-sig para descartar el BOM que añaden
+    Excel y LibreOffice (si no, la cabecera sería "\ufeffemail")
+    """
+    codificacion = "utf-8-sig"
+    for linea in archivo:
+        yield linea.decode(codificacion)
+        codificacion = "utf-8"
+
+
+async def lineas_de_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    🌊 Parte en líneas un cuerpo que llega por trozos (request.stream())
+    sin cargarlo entero en memoria
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pendiente = ""
+    async for chunk in chunks:
+        previo, _ = decoder.getstate()
+        try:
+            pendiente += decoder.decode(chunk)
+        except UnicodeDecodeError as e:
+            # 💥 Las líneas completas antes del byte inválido sí se validan
+            pendiente += (previo + chunk)[:e.start].decode("utf-8")
+            for linea in pendiente.split("\n")[:-1]:
+                yield linea
+            raise
+        *lineas, pendiente = pendiente.split("\n")
+        for linea in lineas:
+            yield linea
+    pendiente += decoder.decode(b"", final=True)
+    if pendiente:
+        yield pendiente
+
+
+# ========== RESULTADOS EN STREAMING ==========
+
+def _resultado_bloque(bloque: list, desplazamiento: int) -> tuple[list[str], int]:
+    errores = validar_bloque(bloque, desplazamiento)
+    lineas = [
+        json.dumps({"indice": indice, "errores": campos}, ensure_ascii=False) + "\n"
+        for indice, campos in sorted(errores.items())
+    ]
+    return lineas, len(errores)
+
+
+def _contadores(total: int, invalidos: int, completo: bool = True) -> dict:
+    return {"total": total, "validos": total - invalidos, "invalidos": invalidos, "completo": completo}
+
+
+def _resumen(total: int, invalidos: int, error: Exception | None = None) -> list[str]:
+    """Última(s) línea(s): el error de lectura si lo hubo y el resumen"""
+    lineas = []
+    if error is not None:
+        lineas.append(json.dumps(
+            {"indice": total, "errores": {"archivo": f"No se pudo leer el archivo: {error}"}},
+            ensure_ascii=False
+        ) + "\n")
+    lineas.append(json.dumps(_contadores(total, invalidos, error is None), ensure_ascii=False) + "\n")
+    return lineas
+
+
+def validar_en_streaming(registros: Iterable) -> Iterator[str]:
+    """
+    📤 Valida por bloques y va devolviendo NDJSON:
+    - una línea {"indice": i, "errores": {...}} por cada registro inválido
+    - una última línea con el resumen {"total", "validos", "invalidos", "completo"}
+    """
+    total = invalidos = 0
+    bloque = []
+    error = None
+    try:
+        for registro in registros:
+            bloque.append(registro)
+            if len(bloque) == TAMANO_BLOQUE:
+                lineas, n = _resultado_bloque(bloque, total)
+                yield from lineas
+                total += len(bloque)
+                invalidos += n
+                bloque = []
+    except ERRORES_LECTURA as e:
+        # Los registros ya leídos se validan igual; el error va antes del resumen
+        error = e
+    if bloque:
+        lineas, n = _resultado_bloque(bloque, total)
+        yield from lineas
+        total += len(bloque)
+        invalidos += n
+    yield from _resumen(total, invalidos, error)
+
+
+async def validar_en_streaming_async(lineas: AsyncIterator[str]) -> AsyncIterator[str]:
+    """📤 Igual que validar_en_streaming, pero para un cuerpo NDJSON que aún está llegando"""
+    total = invalidos = 0
+    bloque = []
+    error = None
+    try:
+        async for linea in lineas:
+            for registro in leer_ndjson([linea]):
+                bloque.append(registro)
+            if len(bloque) >= TAMANO_BLOQUE:
+                resultado, n = _resultado_bloque(bloque, total)
+                for texto in resultado:
+                    yield texto
+                total += len(bloque)
+                invalidos += n
+                bloque = []
+    except ERRORES_LECTURA as e:
+        error = e
+    if bloque:
+        resultado, n = _resultado_bloque(bloque, total)
+        for texto in resultado:
+            yield texto
+        total += len(bloque)
+        invalidos += n
+    for texto in _resumen(total, invalidos, error):
+        yield texto